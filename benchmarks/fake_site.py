@@ -0,0 +1,354 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from time import sleep
+from datetime import date, timedelta
+from string import Template
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pages")
+
+LISTING_PATH = "/browse/movies_at_home/?page=1"
+
+TILES_PER_PAGE = 30
+
+REVIEWS_PER_PAGE = {"critic_reviews": 20, "audience_reviews": 10}
+
+# the links get_reviews follows, removed for runs that skip the reviews
+REVIEW_LINK = re.compile(
+    r'<a data-qa="(tomatometer-review-count|audience-rating-count)".*?</a>'
+)
+
+
+def slug(i):
+    return f"movie_{i}"
+
+
+class FakeSite:
+    """
+    Serves the pages in `pages_dir` as a stand-in for the live site:
+
+        /browse/movies_at_home/?page=N  listing.html, with the tiles of
+                                        pages 1 to N like the real listing
+        /m/<slug>                       movie.html
+        /m/<slug>/reviews               critic_reviews.html
+        /m/<slug>/reviews?type=user     audience_reviews.html
+
+    plus a Sheets `values:batchUpdate` endpoint that accepts every write,
+    or answers every one with `sheets_status` when it is not 200.
+    The pages are string.Template files, so recorded pages can be dropped in
+    with $title and $slug where the movie's title and slug go. Every
+    response waits `latency` seconds first, and `padding` kilobytes of
+    unrelated markup are added to movie pages to bring them up to the size
+    of real ones. Without `review_links` movie pages do not link to their
+    reviews.
+
+    The reviews have `review_pages` pages, each linking to the next with
+    `&page=N`, or with an opaque `&after=` cursor when `review_paging` is
+    "cursor". Clicking Next renders the linked page in place. The
+    `new_reviews` newest reviews come on top of those pages, and the counts
+    on movie pages include them. Audience reviews are `review_age` days
+    old, shown as "Nd" under a week old and as a date after, like the live
+    site. Both can be changed between two crawls of a running site, and so
+    can the `cast` size and `audience_score` of every movie.
+
+    The next `throttle` page requests are answered with a 429 asking to
+    retry after `retry_after` seconds. With `etags` pages carry an ETag,
+    and requests whose If-None-Match matches it get a 304, counted in
+    `not_modified`.
+    """
+
+    def __init__(
+        self,
+        movies=100,
+        latency=0.0,
+        padding=0,
+        cast=20,
+        audience_score=94,
+        review_pages=3,
+        review_paging="numbered",
+        new_reviews=0,
+        review_age=1,
+        review_links=True,
+        etags=False,
+        pages_dir=PAGES_DIR,
+        port=0,
+    ) -> None:
+        self.movies = movies
+        self.latency = latency
+        self.cast = cast
+        self.audience_score = audience_score
+        self.review_pages = review_pages
+        self.review_paging = review_paging
+        self.new_reviews = new_reviews
+        self.review_age = review_age
+        self.review_links = review_links
+        self.etags = etags
+        self.templates = {}
+
+        for name in ("listing", "movie", "critic_reviews", "audience_reviews"):
+            with open(os.path.join(pages_dir, name + ".html")) as page_file:
+                self.templates[name] = Template(page_file.read())
+
+        self.padding = self.make_padding(padding)
+        self.sheets_status = 200
+        self.throttle = 0
+        self.retry_after = 1
+        self.requests = 0
+        self.not_modified = 0
+        self.sheet_writes = 0
+        self.lock = threading.Lock()
+
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                site.handle_get(self)
+
+            def do_POST(self):
+                site.handle_post(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    @property
+    def listing_url(self):
+        return self.url + LISTING_PATH
+
+    def movie_urls(self):
+        return [f"{self.url}/m/{slug(i)}" for i in range(self.movies)]
+
+    def make_padding(self, kilobytes):
+        block = (
+            '<div class="recommendation"><a href="/m/other"><img src="x.jpg">'
+            "<span>Another movie you might like</span></a><script>var x=1;</script>"
+            "</div>\n"
+        )
+
+        return block * (kilobytes * 1024 // len(block))
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def render(self, path, query):
+        parts = path.strip("/").split("/")
+
+        if path.startswith("/browse/"):
+            page = int(query.get("page", ["1"])[0])
+            shown = min(page * TILES_PER_PAGE, self.movies)
+
+            return self.templates["listing"].substitute(
+                tiles="\n".join(
+                    f'<a class="js-tile-link" href="/m/{slug(i)}">Movie {i}</a>'
+                    for i in range(shown)
+                ),
+                more='<button data-qa="dlp-load-more-button">Load more</button>'
+                if shown < self.movies
+                else "",
+            )
+
+        if len(parts) < 2 or parts[0] != "m":
+            return None
+
+        movie = parts[1]
+        title = movie.replace("_", " ").title()
+
+        if len(parts) == 2:
+            page = self.templates["movie"].substitute(
+                title=title,
+                slug=movie,
+                cast="\n".join(
+                    f'<div class="cast-item"><a href="/celebrity/{movie}_{i}">'
+                    f'<img alt=" Person {i} " src="x.jpg"></a><div class="metadata">'
+                    f'<a href="/celebrity/{movie}_{i}"><p>Person {i}</p></a>'
+                    f'<p class="p--small">  Role   {i} </p></div></div>'
+                    for i in range(self.cast)
+                ),
+                padding=self.padding,
+                audience_score=self.audience_score,
+                critic_count=len(self.review_numbers("critic_reviews")),
+                audience_count=len(self.review_numbers("audience_reviews")),
+            )
+
+            if not self.review_links:
+                page = REVIEW_LINK.sub("", page)
+
+            return page
+
+        name = (
+            "audience_reviews" if "user" in query.get("type", []) else "critic_reviews"
+        )
+        page = self.review_page(query)
+
+        if page is None or page < 1 or page > self.pages(name):
+            return None
+
+        return self.templates[name].substitute(
+            title=title,
+            slug=movie,
+            rows=self.review_rows(name, title, page),
+            next=self.next_link(path, name, page),
+            delay=int(self.latency * 1000),
+        )
+
+    def review_page(self, query):
+        if self.review_paging == "cursor":
+            cursor = query.get("after", [""])[0]
+
+            return 1 if cursor == "" else int(cursor, 16) ^ 0x5EED
+
+        page = query.get("page", ["1"])[0]
+
+        return int(page) if page.isdigit() else None
+
+    def review_numbers(self, name):
+        # newest first, so the new reviews are numbered past the others
+        old = self.review_pages * REVIEWS_PER_PAGE[name]
+
+        return [old + n for n in reversed(range(self.new_reviews))] + list(range(old))
+
+    def pages(self, name):
+        per_page = REVIEWS_PER_PAGE[name]
+
+        return (len(self.review_numbers(name)) + per_page - 1) // per_page
+
+    def audience_date(self):
+        if self.review_age < 7:
+            return f"{self.review_age}d"
+
+        return (date.today() - timedelta(days=self.review_age)).strftime("%b %d, %Y")
+
+    def next_link(self, path, name, page):
+        if page >= self.pages(name):
+            return '<a class="next hide">Next</a>'
+
+        query = "type=user&" if name == "audience_reviews" else ""
+
+        if self.review_paging == "cursor":
+            query += f"after={(page + 1) ^ 0x5EED:x}"
+        else:
+            query += f"page={page + 1}"
+
+        return f'<a class="next" href="{path}?{query}">Next</a>'
+
+    def review_rows(self, name, title, page):
+        per_page = REVIEWS_PER_PAGE[name]
+        numbers = self.review_numbers(name)[(page - 1) * per_page : page * per_page]
+
+        if name == "audience_reviews":
+            return "".join(
+                '<div class="audience-review-row">'
+                f'<span class="audience-reviews__name">Viewer {n}</span>'
+                f'<p data-qa="review-text">Review {n} of {title}.</p>'
+                '<span class="audience-reviews__duration">'
+                f"{self.audience_date()}</span>"
+                "</div>"
+                for n in numbers
+            )
+
+        return "".join(
+            '<div class="review-row">'
+            '<div class="review-data"><div class="reviewer-name-and-publication">'
+            f'<a class="display-name">Critic {n}</a></div></div>'
+            '<div class="review-text-container">'
+            f'<p class="review-text">Review {n} of {title}.</p>'
+            '<p class="original-score-and-url"><span data-qa="review-date">'
+            "May 26, 2023</span></p>"
+            "</div>"
+            "</div>"
+            for n in numbers
+        )
+
+    def handle_get(self, handler):
+        if self.latency > 0:
+            sleep(self.latency)
+
+        with self.lock:
+            self.requests += 1
+            throttled = self.throttle > 0
+
+            if throttled:
+                self.throttle -= 1
+
+        if throttled:
+            handler.send_response(429)
+            handler.send_header("Retry-After", str(self.retry_after))
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+            return
+
+        parts = urlparse(handler.path)
+        body = self.render(parts.path, parse_qs(parts.query))
+
+        if body is None:
+            handler.send_response(404)
+            handler.end_headers()
+            return
+
+        body = body.encode("utf-8")
+        etag = f'"{hashlib.sha1(body).hexdigest()}"' if self.etags else None
+
+        if etag is not None and handler.headers.get("If-None-Match") == etag:
+            with self.lock:
+                self.not_modified += 1
+
+            handler.send_response(304)
+            handler.send_header("ETag", etag)
+            handler.end_headers()
+            return
+
+        handler.send_response(200)
+
+        if etag is not None:
+            handler.send_header("ETag", etag)
+
+        handler.send_header("Content-Type", "text/html; charset=utf-8")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def handle_post(self, handler):
+        length = int(handler.headers.get("Content-Length", 0))
+        request = json.loads(handler.rfile.read(length) or b"{}")
+
+        cells = sum(
+            len(row) for data in request.get("data", []) for row in data["values"]
+        )
+        rows = sum(len(data["values"]) for data in request.get("data", []))
+
+        with self.lock:
+            self.sheet_writes += 1
+
+        if self.sheets_status != 200:
+            handler.send_response(self.sheets_status)
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+            return
+
+        body = json.dumps({"totalUpdatedCells": cells, "totalUpdatedRows": rows})
+        body = body.encode("utf-8")
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
@@ -0,0 +1,402 @@
+"""
+Offline crawler benchmarks against the local fake site.
+
+    python -m benchmarks.run [--movies 200] [--latency 0.02] [--stages fetch,parse]
+
+Each stage runs in its own process, so the peak RSS it reports is its own.
+The results are saved as JSON in benchmarks/results, named after the time
+and the commit, and compared with the previous result file (or the one
+given with --compare).
+"""
+
+import io
+import os
+import sys
+import csv
+import json
+import glob
+import queue
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from time import perf_counter, strftime
+from contextlib import redirect_stdout
+from benchmarks.fake_site import LISTING_PATH, FakeSite, slug
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+STAGES = ("startup", "fetch", "parse", "sink", "e2e")
+
+# the numbers compared between runs and whether a higher value is better
+METRICS = {
+    "pages_per_sec": True,
+    "parse_ms_per_page": False,
+    "partial_parse_ms_per_page": False,
+    "full_parse_ms_per_page": False,
+    "csv_ms_per_1000_rows": False,
+    "sheets_ms_per_1000_rows": False,
+    "import_seconds": False,
+    "startup_seconds": False,
+    "peak_rss_mb": False,
+    "seconds": False,
+}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+
+    return round(max(usage, children) / scale, 1)
+
+
+def fetch_pages(site, urls):
+    from crawler.session import CachedSession
+
+    session = CachedSession()
+
+    try:
+        return [session.get(url).content for url in urls]
+    finally:
+        session.close()
+
+
+def bench_startup(site, args):
+    # a fresh process, so this is the cold start of a metadata-only crawler
+    start = perf_counter()
+
+    from crawler.crawler import RottenTomatoesCrawler
+
+    imported = perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.environ.update(
+            {
+                "START_URL": site.listing_url,
+                "DATA_DIR": tmp_dir,
+                "CACHE_DIR": os.path.join(tmp_dir, "cache"),
+            }
+        )
+
+        with redirect_stdout(io.StringIO()):
+            crawler = RottenTomatoesCrawler(sheets_output=False, stages=("metadata",))
+            ready = perf_counter() - start
+            crawler.close()
+
+    return {
+        "import_seconds": round(imported, 3),
+        "startup_seconds": round(ready, 3),
+        "selenium_imported": "selenium" in sys.modules,
+        "google_imported": "googleapiclient" in sys.modules,
+    }
+
+
+def bench_fetch(site, args):
+    from crawler.fetcher import AsyncFetcher
+
+    fetcher = AsyncFetcher(
+        concurrency=args.concurrency, per_host=args.concurrency, delay=0.0
+    )
+    fetched = {"bytes": 0}
+
+    def count(url, content):
+        fetched["bytes"] += len(content)
+
+    start = perf_counter()
+    pages = fetcher.run(site.movie_urls(), count)
+    elapsed = perf_counter() - start
+
+    fetcher.close()
+
+    return {
+        "pages": pages,
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(pages / elapsed, 1),
+        "kb_per_page": round(fetched["bytes"] / max(pages, 1) / 1024, 1),
+    }
+
+
+def bench_parse(site, args):
+    from crawler.extraction import extract_movie
+    from crawler.frontier import STAGES as EXTRACTION_STAGES
+
+    pages = fetch_pages(site, site.movie_urls()[: args.parse_pages])
+    domain = site.url.split("//")[1]
+    result = {"pages": len(pages)}
+
+    for name, partial in (("partial", True), ("full", False)):
+        start = perf_counter()
+
+        for i, content in enumerate(pages):
+            extract_movie(
+                site.movie_urls()[i],
+                content,
+                domain,
+                EXTRACTION_STAGES,
+                partial=partial,
+            )
+
+        elapsed = perf_counter() - start
+        result[f"{name}_parse_ms_per_page"] = round(elapsed * 1000 / len(pages), 2)
+
+    result["parse_ms_per_page"] = result["partial_parse_ms_per_page"]
+
+    return result
+
+
+def bench_sink(site, args):
+    from crawler.records import CastMember
+    from crawler.sinks import CsvSink, SheetsClient, SheetsSink
+
+    rows = [
+        CastMember(
+            f"{site.url}/m/movie_{i // 20}", f"/celebrity/{i}", f"Person {i}", "Role"
+        )
+        for i in range(args.sink_rows)
+    ]
+    result = {"rows": len(rows)}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        sink = CsvSink(os.path.join(tmp_dir, "cast.csv"), list(CastMember._fields))
+
+        start = perf_counter()
+        sink.write(rows)
+        sink.close()
+        elapsed = perf_counter() - start
+
+    result["csv_ms_per_1000_rows"] = round(elapsed * 1000 * 1000 / len(rows), 2)
+
+    os.environ.pop("CREDENTIALS", None)
+    client = SheetsClient("benchmark", endpoint=site.url + "/")
+    sink = SheetsSink(client, "Cast", list(CastMember._fields), "E")
+
+    with redirect_stdout(io.StringIO()):
+        start = perf_counter()
+        sink.write(rows)
+        sink.close()
+        elapsed = perf_counter() - start
+
+    result["sheets_ms_per_1000_rows"] = round(elapsed * 1000 * 1000 / len(rows), 2)
+
+    return result
+
+
+def bench_e2e(site, args):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        os.environ.update(
+            {
+                "START_URL": site.listing_url,
+                "DATA_DIR": tmp_dir,
+                "CACHE_DIR": os.path.join(tmp_dir, "cache"),
+                "SHEETS_ENDPOINT": site.url + "/",
+                "INCREMENTAL": "0",
+                # the reviews of the fake site are paged over HTTP, as there
+                # is no browser to click through them
+                "REVIEW_FETCH": "http",
+            }
+        )
+
+        from crawler.crawler import RottenTomatoesCrawler
+
+        # the .env file may hold real credentials, which the fake site
+        # does not need
+        os.environ.pop("CREDENTIALS", None)
+
+        output = sys.stdout if args.verbose else io.StringIO()
+
+        with redirect_stdout(output):
+            start = perf_counter()
+            crawler = RottenTomatoesCrawler()
+            crawler.get_page()
+            elapsed = perf_counter() - start
+
+        with open(os.path.join(tmp_dir, "movies.csv"), newline="") as movies_file:
+            movies = len(list(csv.reader(movies_file))) - 1
+
+        with open(os.path.join(tmp_dir, "reviews.csv"), newline="") as reviews_file:
+            reviews = len(list(csv.reader(reviews_file))) - 1
+
+    if args.reviews and reviews == 0:
+        raise RuntimeError("the end-to-end crawl saved no reviews")
+
+    return {
+        "movies": movies,
+        "reviews": reviews,
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(movies / elapsed, 1),
+    }
+
+
+class SiteUrls:
+    """
+    The URLs of a fake site served by another process.
+    """
+
+    def __init__(self, url, movies) -> None:
+        self.url = url
+        self.listing_url = url + LISTING_PATH
+        self.movies = movies
+
+    def movie_urls(self):
+        return [f"{self.url}/m/{slug(i)}" for i in range(self.movies)]
+
+
+def run_stage(name, site_url, args, results):
+    result = globals()["bench_" + name](SiteUrls(site_url, args.movies), args)
+    result["peak_rss_mb"] = peak_rss_mb()
+    results.put(result)
+
+
+def run(args):
+    site = FakeSite(
+        movies=args.movies,
+        latency=args.latency,
+        padding=args.padding,
+        review_links=args.reviews,
+    ).start()
+    context = multiprocessing.get_context("spawn")
+    stages = {}
+
+    try:
+        for name in args.stages:
+            print(f"Running the {name} benchmark")
+
+            results = context.Queue()
+            process = context.Process(
+                target=run_stage, args=(name, site.url, args, results)
+            )
+            process.start()
+
+            while name not in stages:
+                try:
+                    stages[name] = results.get(timeout=1)
+                except queue.Empty:
+                    if not process.is_alive():
+                        break
+
+            process.join()
+
+            if name in stages:
+                print(f"\t{json.dumps(stages[name])}")
+            else:
+                print(f"Error: the {name} benchmark exited with {process.exitcode}")
+    finally:
+        site.stop()
+
+    return stages
+
+
+def commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save(result, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+
+    path = os.path.join(
+        output_dir, f"{strftime('%Y%m%d-%H%M%S')}-{result['commit']}.json"
+    )
+
+    with open(path, "w") as result_file:
+        json.dump(result, result_file, indent=2)
+
+    return path
+
+
+def compare(result, previous):
+    print(f"\n--- Compared with {previous['commit']} ({previous['time']}) ---")
+
+    for stage, metrics in result["stages"].items():
+        for metric, value in metrics.items():
+            old = previous["stages"].get(stage, {}).get(metric)
+
+            if metric not in METRICS or not old:
+                continue
+
+            change = (value - old) / old * 100
+            better = change > 0 if METRICS[metric] else change < 0
+
+            print(
+                "\t{0}.{1}: {2} -> {3} ({4:+.1f}%{5})".format(
+                    stage,
+                    metric,
+                    old,
+                    value,
+                    change,
+                    "" if abs(change) < 10 else ", better" if better else ", WORSE",
+                )
+            )
+
+    print("-------------------------------")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline crawler benchmarks")
+    parser.add_argument("--stages", default=",".join(STAGES))
+    parser.add_argument("--movies", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--padding", type=int, default=300, help="KB per movie page")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--parse-pages", type=int, default=50)
+    parser.add_argument("--sink-rows", type=int, default=20000)
+    parser.add_argument(
+        "--reviews",
+        action="store_true",
+        help="link movie pages to their reviews and fetch them",
+    )
+    parser.add_argument("--output", default=RESULTS_DIR)
+    parser.add_argument("--compare", help="a result file, by default the latest")
+    parser.add_argument("--verbose", action="store_true")
+
+    args = parser.parse_args(argv)
+    args.stages = [stage for stage in args.stages.split(",") if stage]
+
+    for stage in args.stages:
+        if stage not in STAGES:
+            parser.error(f"unknown stage {stage}, expected one of {STAGES}")
+
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    previous = (
+        args.compare
+        or (sorted(glob.glob(os.path.join(args.output, "*.json"))) or [None])[-1]
+    )
+
+    result = {
+        "commit": commit(),
+        "time": strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "params": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ("output", "compare", "verbose")
+        },
+        "stages": run(args),
+    }
+
+    print(f"Saved the results to {save(result, args.output)}")
+
+    if previous is not None:
+        with open(previous) as previous_file:
+            compare(result, json.load(previous_file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import os
+import gzip
+import sqlite3
+import hashlib
+import threading
+from time import time
+from datetime import datetime, timezone
+
+
+class PageArchive:
+    """
+    An append-only archive of every page fetched, for re-running the
+    extractors later without the network.
+
+    Pages are stored as WARC `resource` records, each compressed as its own
+    gzip member, in files of up to `max_file_bytes` named pages-NNNNN.warc.gz
+    under `path`. Tools that read WARC files can read them directly.
+    `index.db` maps every URL and fetch time to the file, offset and length
+    of its record, so any page can be read back without scanning. A page
+    identical to the last one archived for its URL is not stored again.
+
+    Like the frontier, index rows are written on `commit`, after the
+    records they point to have been flushed, so the index never points at
+    a record that was not written.
+    """
+
+    def __init__(self, path, max_file_bytes=1024 * 1024 * 1024) -> None:
+        self.path = path
+        self.max_file_bytes = max_file_bytes
+        self.lock = threading.Lock()
+        self.pending = []
+        self.latest = {}
+
+        os.makedirs(self.path, exist_ok=True)
+
+        self.connection = sqlite3.connect(
+            os.path.join(self.path, "index.db"), check_same_thread=False
+        )
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT,
+                fetched_at REAL,
+                digest TEXT,
+                file TEXT,
+                offset INTEGER,
+                length INTEGER,
+                PRIMARY KEY (url, fetched_at)
+            );
+            """
+        )
+
+        row = self.connection.execute("SELECT MAX(file) FROM pages").fetchone()
+        self.file_name = row[0] or self.next_file_name(None)
+        self.file = open(os.path.join(self.path, self.file_name), "ab")
+
+    def next_file_name(self, current):
+        number = 0 if current is None else int(current[6:11]) + 1
+
+        return f"pages-{number:05d}.warc.gz"
+
+    def record(self, url, content, fetched_at):
+        date = datetime.fromtimestamp(fetched_at, timezone.utc)
+        headers = (
+            "WARC/1.0\r\n"
+            "WARC-Type: resource\r\n"
+            f"WARC-Target-URI: {url}\r\n"
+            f"WARC-Date: {date.strftime('%Y-%m-%dT%H:%M:%SZ')}\r\n"
+            "Content-Type: text/html\r\n"
+            f"Content-Length: {len(content)}\r\n"
+            "\r\n"
+        )
+
+        return gzip.compress(headers.encode("utf-8") + content + b"\r\n\r\n")
+
+    def last_digest(self, url):
+        if url in self.latest:
+            return self.latest[url]
+
+        row = self.connection.execute(
+            "SELECT digest FROM pages WHERE url = ? ORDER BY fetched_at DESC LIMIT 1",
+            (url,),
+        ).fetchone()
+
+        return None if row is None else row[0]
+
+    def append(self, url, content, fetched_at=None):
+        """
+        Archives `content` as fetched from `url`, unless it is unchanged.
+        """
+
+        fetched_at = time() if fetched_at is None else fetched_at
+        digest = hashlib.sha1(content).hexdigest()
+        record = self.record(url, content, fetched_at)
+
+        with self.lock:
+            if self.last_digest(url) == digest:
+                return False
+
+            if self.file.tell() > 0 and self.file.tell() + len(record) > (
+                self.max_file_bytes
+            ):
+                self.file.close()
+                self.file_name = self.next_file_name(self.file_name)
+                self.file = open(os.path.join(self.path, self.file_name), "ab")
+
+            offset = self.file.tell()
+            self.file.write(record)
+            self.latest[url] = digest
+            self.pending.append(
+                (url, fetched_at, digest, self.file_name, offset, len(record))
+            )
+
+        return True
+
+    def commit(self):
+        with self.lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)",
+                    self.pending,
+                )
+
+            self.pending = []
+
+    def entries(self):
+        """
+        Returns `(url, fetched_at, file, offset, length)` for the latest
+        archived copy of every URL, in the order they were archived.
+        """
+
+        with self.lock:
+            return self.connection.execute(
+                """
+                SELECT url, fetched_at, file, offset, length FROM pages AS page
+                WHERE fetched_at = (
+                    SELECT MAX(fetched_at) FROM pages WHERE url = page.url
+                )
+                ORDER BY rowid
+                """
+            ).fetchall()
+
+    def close(self):
+        self.commit()
+        self.file.close()
+        self.connection.close()
+
+
+def read_record(path, file_name, offset, length):
+    """
+    Returns the page stored in the record at `offset` of an archive file.
+    """
+
+    with open(os.path.join(path, file_name), "rb") as archive_file:
+        archive_file.seek(offset)
+        record = gzip.decompress(archive_file.read(length))
+
+    headers, _, body = record.partition(b"\r\n\r\n")
+
+    return body[: -len(b"\r\n\r\n")]
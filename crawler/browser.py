@@ -0,0 +1,368 @@
+import os
+import queue
+import threading
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
+from crawler.metrics import metrics
+
+
+# The light browser profile (BROWSER_PROFILE=light, the default) loads the
+# documents and scripts the crawler reads and nothing else: no images,
+# fonts or media, none of the ad, analytics and consent scripts below,
+# and none of Chrome's background features. Navigations return once the
+# DOM is ready instead of waiting for every subresource.
+LIGHT_PROFILE_ARGUMENTS = (
+    "--blink-settings=imagesEnabled=false",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--disable-notifications",
+    "--mute-audio",
+    "--no-first-run",
+    "--disable-features=Translate,MediaRouter,OptimizationHints",
+)
+
+LIGHT_PROFILE_PREFS = {
+    "profile.managed_default_content_settings.images": 2,
+    "profile.managed_default_content_settings.media_stream": 2,
+    "profile.default_content_setting_values.notifications": 2,
+}
+
+BLOCKED_URLS = (
+    "*.png*",
+    "*.jpg*",
+    "*.jpeg*",
+    "*.gif*",
+    "*.webp*",
+    "*.avif*",
+    "*.svg*",
+    "*.ico*",
+    "*.woff*",
+    "*.ttf*",
+    "*.otf*",
+    "*.mp4*",
+    "*.webm*",
+    "*.m3u8*",
+    "*doubleclick.net*",
+    "*googlesyndication.com*",
+    "*googletagmanager.com*",
+    "*googletagservices.com*",
+    "*google-analytics.com*",
+    "*amazon-adsystem.com*",
+    "*adnxs.com*",
+    "*adsrvr.org*",
+    "*criteo.com*",
+    "*pubmatic.com*",
+    "*rubiconproject.com*",
+    "*casalemedia.com*",
+    "*moatads.com*",
+    "*scorecardresearch.com*",
+    "*quantserve.com*",
+    "*chartbeat.com*",
+    "*krxd.net*",
+    "*facebook.net*",
+    "*taboola.com*",
+    "*outbrain.com*",
+    "*cookielaw.org*",
+    "*onetrust.com*",
+)
+
+# the bytes transferred by the document (right after a navigation) and the
+# resources requested since the `arguments[0]`th one, the number of
+# resources so far and the page's JavaScript heap
+PAGE_STATS_SCRIPT = """
+performance.setResourceTimingBufferSize(10000);
+const start = arguments[0];
+const navigation = performance.getEntriesByType("navigation")[0];
+const resources = performance.getEntriesByType("resource");
+let bytes = start === 0 && navigation ? navigation.transferSize : 0;
+for (const entry of resources.slice(start)) {
+  bytes += entry.transferSize;
+}
+return {
+  bytes: bytes,
+  resources: resources.length,
+  heap: performance.memory ? performance.memory.usedJSHeapSize : 0,
+};
+"""
+
+
+def make_driver(profile=None):
+    # Selenium is only imported once a browser is needed, so the stages
+    # that never start one do not pay for it
+    from selenium import webdriver
+    from selenium.webdriver.chrome.service import Service
+
+    profile = profile or os.getenv("BROWSER_PROFILE", "light")
+
+    options = webdriver.ChromeOptions()
+    options.add_argument("--headless")
+    options.add_argument("--disable-gpu")
+    options.add_argument("--no-sandbox")
+    options.add_argument("--disable-dev-shm-usage")
+
+    if profile == "light":
+        options.page_load_strategy = "eager"
+
+        for argument in LIGHT_PROFILE_ARGUMENTS:
+            options.add_argument(argument)
+
+        options.add_experimental_option("prefs", LIGHT_PROFILE_PREFS)
+
+    chrome_path = os.getenv("GOOGLE_CHROME_PATH")
+    driver_path = os.getenv("CHROMEDRIVER_PATH")
+    debug = os.getenv("DEBUG")
+
+    if debug == True:
+        driver = webdriver.Chrome(options=options)
+    else:
+        options.binary_location = chrome_path
+
+        driver = webdriver.Chrome(
+            service=Service(executable_path=driver_path), options=options
+        )
+
+    if profile == "light":
+        blocked = list(BLOCKED_URLS)
+        blocked += [url for url in os.getenv("BLOCKED_URLS", "").split(",") if url]
+
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": blocked})
+
+    return driver
+
+
+def process_tree_rss_mb(pid):
+    """
+    Returns the resident memory of process `pid` and all of its descendants
+    in MB, or None where /proc cannot be read.
+    """
+
+    children = {}
+    rss = {}
+
+    try:
+        entries = [entry for entry in os.listdir("/proc") if entry.isdigit()]
+    except OSError:
+        return None
+
+    for entry in entries:
+        try:
+            with open(f"/proc/{entry}/stat") as stat_file:
+                fields = stat_file.read().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+
+        children.setdefault(int(fields[1]), []).append(int(entry))
+        rss[int(entry)] = int(fields[21])
+
+    if pid not in rss:
+        return None
+
+    total = 0
+    found = [pid]
+
+    while len(found) > 0:
+        process = found.pop()
+        total += rss.get(process, 0)
+        found += children.get(process, [])
+
+    return total * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+class BrowserStats:
+    """
+    The bytes transferred and load times of the pages the browsers load, by
+    page name, and the largest memory footprint of a browser's processes.
+    """
+
+    def __init__(self) -> None:
+        self.pages = {}
+        self.peak_rss_mb = None
+        self.lock = threading.Lock()
+
+    def record(self, name, transferred, seconds, heap):
+        metrics.inc("browser_bytes", transferred, page=name)
+        metrics.observe("browser_page_load", seconds, page=name)
+
+        with self.lock:
+            stats = self.pages.setdefault(
+                name, {"count": 0, "bytes": 0, "seconds": 0.0, "heap": 0}
+            )
+            stats["count"] += 1
+            stats["bytes"] += transferred
+            stats["seconds"] += seconds
+            stats["heap"] = max(stats["heap"], heap)
+
+    def record_rss(self, rss_mb):
+        if rss_mb is None:
+            return
+
+        metrics.set("browser_rss_mb", rss_mb)
+
+        with self.lock:
+            self.peak_rss_mb = max(self.peak_rss_mb or 0, rss_mb)
+
+    def print_summary(self):
+        with self.lock:
+            if len(self.pages) == 0:
+                return
+
+            print("\n--- Browser pages ---")
+
+            for name, stats in self.pages.items():
+                print(
+                    "\t{0}: {1} pages, {2:.1f} KB/page, {3:.2f}s/page,"
+                    " JS heap up to {4:.1f} MB".format(
+                        name,
+                        stats["count"],
+                        stats["bytes"] / stats["count"] / 1024,
+                        stats["seconds"] / stats["count"],
+                        stats["heap"] / (1024 * 1024),
+                    )
+                )
+
+            if self.peak_rss_mb is not None:
+                print(f"\tPeak browser memory: {self.peak_rss_mb:.0f} MB")
+
+            print("---------------------")
+
+
+class BrowserWorker:
+    def __init__(self, max_pages, stats=None) -> None:
+        self.max_pages = max_pages
+        self.stats = stats or BrowserStats()
+        self.pages = 0
+        self.measured = 0
+        self.loading_since = None
+        self._driver = None
+
+    @property
+    def driver(self):
+        if self._driver is None:
+            start = perf_counter()
+            self._driver = make_driver()
+            elapsed = perf_counter() - start
+
+            metrics.observe("browser_start", elapsed)
+            print(f"Started a browser in {elapsed:.2f}s")
+
+        return self._driver
+
+    def get(self, url, name):
+        self.loading_since = perf_counter()
+
+        with metrics.timer("selenium_navigation", page=name):
+            self.driver.get(url)
+
+        self.pages += 1
+        self.measured = 0
+
+    def click(self, elem):
+        self.loading_since = perf_counter()
+        elem.click()
+        self.pages += 1
+
+    def measure(self, name):
+        """
+        Records what the page loaded since the last `get` or `click` and
+        how long it took to be ready, which is when this is called.
+        """
+
+        try:
+            stats = self.driver.execute_script(PAGE_STATS_SCRIPT, self.measured)
+        except Exception as e:
+            print("Error: ", e)
+            return
+
+        self.measured = stats["resources"]
+        self.stats.record(
+            name, stats["bytes"], perf_counter() - self.loading_since, stats["heap"]
+        )
+
+    def record_memory(self):
+        if self._driver is None:
+            return
+
+        try:
+            pid = self._driver.service.process.pid
+        except AttributeError:
+            return
+
+        self.stats.record_rss(process_tree_rss_mb(pid))
+
+    def recycle_if_needed(self):
+        self.record_memory()
+
+        if self.max_pages > 0 and self.pages >= self.max_pages:
+            print(f"Recycling browser after {self.pages} pages")
+            self.quit()
+
+    def quit(self):
+        if self._driver is not None:
+            self.record_memory()
+
+            try:
+                self._driver.quit()
+            except Exception as e:
+                print("Error: ", e)
+
+        self._driver = None
+        self.pages = 0
+
+
+class BrowserPool:
+    """
+    A bounded pool of reusable headless Chrome workers.
+
+    `run(fn, *args)` queues `fn(worker, *args)` and returns a future. Each
+    worker starts its browser on first use, counts the pages it loads in
+    `worker.pages`, and is restarted once that reaches `max_pages` so a
+    long crawl does not keep growing Chrome's memory. What the pages load
+    is recorded in `stats`, shared by every worker.
+    """
+
+    def __init__(self, size=2, max_pages=50) -> None:
+        self.size = max(1, size)
+        self.executor = ThreadPoolExecutor(max_workers=self.size)
+        self.stats = BrowserStats()
+        self.workers = [BrowserWorker(max_pages, self.stats) for _ in range(self.size)]
+        self.idle = queue.Queue()
+
+        for worker in self.workers:
+            self.idle.put(worker)
+
+    def run(self, fn, *args):
+        return self.executor.submit(self.call, fn, *args)
+
+    def call(self, fn, *args):
+        worker = self.idle.get()
+
+        try:
+            return fn(worker, *args)
+        except Exception:
+            # the browser may be left on a broken page, start a fresh one
+            worker.quit()
+            raise
+        finally:
+            worker.recycle_if_needed()
+            self.idle.put(worker)
+
+    def drain(self):
+        """
+        Waits for every queued call and its callbacks to finish, keeping the
+        browsers open for the next ones.
+        """
+
+        self.executor.shutdown(wait=True)
+        self.executor = ThreadPoolExecutor(max_workers=self.size)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+        for worker in self.workers:
+            worker.quit()
+
+        self.stats.print_summary()
@@ -0,0 +1,294 @@
+import json
+import sqlite3
+import threading
+from time import time
+
+
+class Coordinator:
+    """
+    Splits a crawl between workers through a lease table in SQLite, which
+    every worker process opens itself, so a shared file is all the
+    coordination a local multi-process crawl needs.
+
+    The coordinator adds the discovered movie URLs as leases of `lease_size`
+    URLs and seals the table once discovery is over. A worker claims the
+    oldest lease that is pending or whose holder stopped renewing it within
+    `lease_ttl` seconds, keeps it alive with `hold` while it crawls, and
+    reports what it did with `complete`. A lease that was claimed
+    `max_attempts` times without being completed, because its crawl failed
+    or its holder died, is marked failed instead of being handed out
+    again. The crawl is finished once the table is sealed and every lease
+    is done or failed. Workers `join` the crawl before claiming leases, so
+    only their outputs are merged.
+    """
+
+    def __init__(self, path, lease_ttl=300, max_attempts=3) -> None:
+        self.path = path
+        self.lease_ttl = lease_ttl
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+
+        self.connection = sqlite3.connect(
+            self.path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS leases (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                urls TEXT,
+                status TEXT DEFAULT 'pending',
+                worker TEXT,
+                expires_at REAL,
+                attempts INTEGER DEFAULT 0,
+                result TEXT
+            );
+            CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS workers (worker TEXT PRIMARY KEY);
+            """
+        )
+
+    def begin(self):
+        """
+        Starts a new sharded crawl and returns True, or returns False when
+        the last one was fully split into leases but is not finished yet,
+        so its workers can carry on with it.
+        """
+
+        if self.is_sealed() and not self.is_finished():
+            print(f"Resuming the sharded crawl recorded in {self.path}")
+            return False
+
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.connection.execute("DELETE FROM leases")
+            self.connection.execute("DELETE FROM state")
+            self.connection.execute("DELETE FROM workers")
+            self.connection.execute("COMMIT")
+
+        return True
+
+    def join(self, worker):
+        """
+        Records that `worker` takes part in the crawl, so its outputs are
+        merged with the others.
+        """
+
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO workers (worker) VALUES (?)", (worker,)
+            )
+
+    def workers(self):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT worker FROM workers ORDER BY worker"
+            ).fetchall()
+
+        return [worker for (worker,) in rows]
+
+    def add_leases(self, urls, lease_size=20):
+        """
+        Adds `urls` as leases of `lease_size` URLs as they are discovered,
+        so workers can start before discovery is over, and returns the
+        number of URLs added.
+        """
+
+        added = 0
+        batch = []
+
+        for url in urls:
+            batch.append(url)
+            added += 1
+
+            if len(batch) >= lease_size:
+                self.add_lease(batch)
+                batch = []
+
+        if len(batch) > 0:
+            self.add_lease(batch)
+
+        return added
+
+    def add_lease(self, urls):
+        with self.lock:
+            self.connection.execute(
+                "INSERT INTO leases (urls) VALUES (?)", (json.dumps(urls),)
+            )
+
+    def seal(self):
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO state (key, value) VALUES ('sealed', '1')"
+            )
+
+    def claim(self, worker):
+        """
+        Returns `(lease_id, urls)` for the next lease `worker` should crawl,
+        or None when there is nothing to claim right now.
+        """
+
+        now = time()
+
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+
+            try:
+                failed = self.connection.execute(
+                    """
+                    UPDATE leases SET status = 'failed'
+                    WHERE status = 'leased' AND expires_at < ? AND attempts >= ?
+                    RETURNING id, worker
+                    """,
+                    (now, self.max_attempts),
+                ).fetchall()
+                row = self.connection.execute(
+                    """
+                    SELECT id, urls, status, worker FROM leases
+                    WHERE status = 'pending' OR (status = 'leased' AND expires_at < ?)
+                    ORDER BY id LIMIT 1
+                    """,
+                    (now,),
+                ).fetchone()
+
+                if row is not None:
+                    self.connection.execute(
+                        """
+                        UPDATE leases SET status = 'leased', worker = ?,
+                            expires_at = ?, attempts = attempts + 1
+                        WHERE id = ?
+                        """,
+                        (worker, now + self.lease_ttl, row[0]),
+                    )
+            finally:
+                self.connection.execute("COMMIT")
+
+        for lease_id, holder in failed:
+            print(
+                f"Error: lease {lease_id} of {holder} expired after"
+                f" {self.max_attempts} attempts, marking it failed"
+            )
+
+        if row is None:
+            return None
+
+        if row[2] == "leased":
+            print(f"Lease {row[0]} of {row[3]} expired, reassigning it to {worker}")
+
+        return row[0], json.loads(row[1])
+
+    def renew(self, lease_id, worker):
+        with self.lock:
+            cursor = self.connection.execute(
+                """
+                UPDATE leases SET expires_at = ?
+                WHERE id = ? AND worker = ? AND status = 'leased'
+                """,
+                (time() + self.lease_ttl, lease_id, worker),
+            )
+
+        return cursor.rowcount == 1
+
+    def hold(self, lease_id, worker):
+        """
+        Renews the lease in the background until the returned event is set.
+        """
+
+        stop = threading.Event()
+
+        def renew():
+            while not stop.wait(self.lease_ttl / 3):
+                if not self.renew(lease_id, worker):
+                    print(f"Error: {worker} lost lease {lease_id}")
+                    break
+
+        threading.Thread(target=renew, daemon=True).start()
+
+        return stop
+
+    def complete(self, lease_id, worker, result):
+        with self.lock:
+            cursor = self.connection.execute(
+                """
+                UPDATE leases SET status = 'done', result = ?
+                WHERE id = ? AND worker = ? AND status = 'leased'
+                """,
+                (json.dumps({"worker": worker, **result}), lease_id, worker),
+            )
+
+        return cursor.rowcount == 1
+
+    def release(self, lease_id, worker):
+        """
+        Hands a lease `worker` could not crawl back to be claimed again, or
+        marks it failed once it has been tried `max_attempts` times.
+        """
+
+        with self.lock:
+            row = self.connection.execute(
+                """
+                UPDATE leases SET
+                    status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                    worker = NULL
+                WHERE id = ? AND worker = ? AND status = 'leased'
+                RETURNING status
+                """,
+                (self.max_attempts, lease_id, worker),
+            ).fetchone()
+
+        if row is not None and row[0] == "failed":
+            print(
+                f"Error: lease {lease_id} failed {self.max_attempts} times,"
+                " marking it failed"
+            )
+
+    def is_sealed(self):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value FROM state WHERE key = 'sealed'"
+            ).fetchone()
+
+        return row is not None
+
+    def is_finished(self):
+        with self.lock:
+            remaining = self.connection.execute(
+                "SELECT COUNT(*) FROM leases WHERE status NOT IN ('done', 'failed')"
+            ).fetchone()[0]
+
+        return remaining == 0 and self.is_sealed()
+
+    def summary(self):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT status, COUNT(*) FROM leases GROUP BY status"
+            ).fetchall()
+            results = self.connection.execute(
+                "SELECT result FROM leases WHERE status = 'done'"
+            ).fetchall()
+
+        workers = {}
+
+        for (result,) in results:
+            result = json.loads(result)
+            stats = workers.setdefault(result["worker"], {"leases": 0, "urls": 0})
+            stats["leases"] += 1
+            stats["urls"] += result.get("urls", 0)
+
+        return {"leases": dict(rows), "workers": workers}
+
+    def print_summary(self):
+        summary = self.summary()
+
+        print("\n--- Sharded crawl ---")
+
+        for status, count in summary["leases"].items():
+            print(f"\t{status}: {count} leases")
+
+        for worker, stats in summary["workers"].items():
+            print(f"\t{worker}: {stats['leases']} leases, {stats['urls']} urls")
+
+        print("---------------------")
+
+    def close(self):
+        self.connection.close()
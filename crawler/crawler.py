@@ -1,65 +1,463 @@
 from __future__ import print_function
 
 import os
-import csv
-import json
-import requests
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from time import sleep
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from urllib.parse import urlparse
-from selenium.webdriver.common.by import By
-from googleapiclient.discovery import build
-from google.oauth2 import service_account
-from dotenv import load_dotenv, find_dotenv
-from selenium.webdriver.chrome.service import Service
-
-
-dotenv_path = find_dotenv()
-load_dotenv(dotenv_path)
+from datetime import date
+from urllib.parse import urljoin, urlparse
+from crawler.archive import PageArchive
+from crawler.browser import BrowserPool, BrowserWorker
+from crawler.dedupe import ReviewIndex, review_key
+from crawler.fetcher import AsyncFetcher
+from crawler.discovery import ListingDiscovery
+from crawler.frontier import STAGES, Frontier, fingerprint
+from crawler.metrics import metrics
+from crawler.pipeline import Pipeline
+from crawler.records import CastMember, Movie, Review, crawl_time
+from crawler.extraction import extract_movie
+from crawler.session import CachedSession, ResponseCache
+from crawler.sinks import (
+    BackgroundSink,
+    CsvSink,
+    MultiSink,
+    SheetsClient,
+    SheetsSink,
+    close_each,
+    latest_crawls,
+    latest_rows,
+    read_csv_rows,
+    read_header,
+)
+from crawler.reviews import ReviewCollector, ReviewPager
+from crawler.readiness import (
+    PageReadiness,
+    count_changed,
+    element_present,
+    rows_replaced,
+)
+
+SPREADSHEET_ID = "11ZDCJ0_1oAkAcvXUQkQx95uAt_eeO9h5XNxtwJ5eeDc"
+
+START_URL = "https://www.rottentomatoes.com/browse/movies_at_home/?page=1"
+
+MOVIE_COLUMNS = list(Movie._fields)
+
+CAST_COLUMNS = list(CastMember._fields)
+
+REVIEW_COLUMNS = list(Review._fields)
+
+# the output of each stage: its CSV file, worksheet, columns and the letter
+# of the worksheet's last column
+OUTPUTS = {
+    "metadata": ("movies.csv", "Movies", MOVIE_COLUMNS, "T"),
+    "cast": ("cast_and_crew.csv", "Cast", CAST_COLUMNS, "E"),
+    "reviews": ("reviews.csv", "Reviews", REVIEW_COLUMNS, "F"),
+}
+
+# the frontier fingerprints each stage compares an incremental crawl with
+FINGERPRINTS = {
+    "metadata": ("metadata",),
+    "cast": ("cast",),
+    "reviews": ("reviews", "critic_review", "audience_review"),
+}
+
+# Each review page is read with a single script call that returns the row
+# elements and the (posted_by, review, date_posted) of every row, instead of
+# several WebDriver round trips per row.
+CRITIC_REVIEWS_SCRIPT = """
+const text = (row, xpath) => {
+  const node = document.evaluate(
+    xpath, row, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null
+  ).singleNodeValue;
+  return node ? node.innerText.trim() : "N/A";
+};
+const rows = Array.from(document.getElementsByClassName("review-row"));
+return {
+  rows: rows,
+  reviews: rows.map((row) => [
+    text(row, "./div[@class='review-data']//div[@class='reviewer-name-and-publication']//a[@class='display-name']"),
+    text(row, "./div[@class='review-text-container']//p[@class='review-text']"),
+    text(row, "./div[@class='review-text-container']//p[@class='original-score-and-url']//span[@data-qa='review-date']"),
+  ]),
+};
+"""
+
+AUDIENCE_REVIEWS_SCRIPT = """
+const text = (row, selector) => {
+  const node = row.querySelector(selector);
+  return node ? node.innerText.trim() : "N/A";
+};
+const rows = Array.from(document.getElementsByClassName("audience-review-row"));
+return {
+  rows: rows,
+  reviews: rows.map((row) => [
+    text(row, ".audience-reviews__name"),
+    text(row, "p[data-qa='review-text']"),
+    text(row, "span[class='audience-reviews__duration']"),
+  ]),
+};
+"""
 
 
 class RottenTomatoesCrawler:
-    def __init__(self) -> None:
-        self.url = "https://www.rottentomatoes.com/browse/movies_at_home/?page=1"
-        self.cast = []
-        self.movies = []
-        self.reviews = []
+    def __init__(
+        self, data_dir=None, sheets_output=None, stages=None, cache_dir=None
+    ) -> None:
+        self.stages = tuple(stages or STAGES)
+        self.url = os.getenv("START_URL", START_URL)
         self.domain = urlparse(self.url).netloc
         self.driver = None
-        self.last_review_row = 0
-        self.last_cast_row = 0
-        self.last_movie_row = 0
+        self.discovery = os.getenv("DISCOVERY", "http")
+        self.parser = os.getenv("HTML_PARSER")
+        self.partial_parse = os.getenv("PARTIAL_PARSE", "1") == "1"
+        concurrency = int(os.getenv("CONCURRENCY", "8"))
+        cache = ResponseCache(
+            cache_dir or os.getenv("CACHE_DIR", ".cache/http"),
+            ttl=int(os.getenv("CACHE_TTL", "86400")),
+            max_bytes=int(os.getenv("CACHE_MAX_BYTES", str(512 * 1024 * 1024))),
+        )
+        self.session = CachedSession(cache=cache, pool_size=concurrency)
+        self.fetcher = AsyncFetcher(
+            concurrency=concurrency,
+            per_host=int(os.getenv("PER_HOST_CONCURRENCY", "4")),
+            delay=float(os.getenv("POLITENESS_DELAY", "0")),
+            session=self.session,
+            adaptive=os.getenv("ADAPTIVE_CONCURRENCY", "1") == "1",
+            retries=int(os.getenv("FETCH_RETRIES", "3")),
+            backoff=float(os.getenv("RETRY_BACKOFF", "1")),
+            latency_target=float(os.getenv("LATENCY_TARGET", "2")),
+        )
+        self.browsers = BrowserPool(
+            size=int(os.getenv("REVIEW_WORKERS", "2")),
+            max_pages=int(os.getenv("BROWSER_MAX_PAGES", "50")),
+        )
+        self.reviews_pending = 0
+        self.review_queue_size = max(1, int(os.getenv("REVIEW_QUEUE_SIZE", "8")))
+        self.sheets = SheetsClient(
+            SPREADSHEET_ID,
+            endpoint=os.getenv("SHEETS_ENDPOINT"),
+            max_retries=int(os.getenv("SHEETS_MAX_RETRIES", "5")),
+        )
+        self.reviews_lock = threading.Condition()
+        self.data_dir = data_dir or os.getenv("DATA_DIR", "data")
+        self.sheets_output = (
+            os.getenv("SHEETS_OUTPUT", "1") == "1"
+            if sheets_output is None
+            else sheets_output
+        )
+        os.makedirs(self.data_dir, exist_ok=True)
+        self.incremental = os.getenv("INCREMENTAL", "1") == "1"
+        self.frontier = Frontier(
+            os.getenv("FRONTIER_PATH", os.path.join(self.data_dir, "frontier.db")),
+            keep_offsets=self.incremental,
+        )
+        self.archive = (
+            PageArchive(
+                os.getenv("ARCHIVE_DIR", os.path.join(self.data_dir, "archive"))
+            )
+            if os.getenv("ARCHIVE", "1") == "1"
+            else None
+        )
+        # review pages are clicked through in the browser, or fetched over
+        # HTTP by following their next links with REVIEW_FETCH=http
+        # clicking through pages is slow, so the browser stops at 10 pages
+        # of each review type unless REVIEW_MAX_PAGES says otherwise
+        review_fetch = os.getenv("REVIEW_FETCH", "browser")
+        self.review_max_pages = int(
+            os.getenv("REVIEW_MAX_PAGES", "0" if review_fetch == "http" else "10")
+        )
+        self.review_limit = int(os.getenv("REVIEW_LIMIT", "0"))
+        self.review_since = (
+            date.fromisoformat(os.getenv("REVIEW_SINCE"))
+            if os.getenv("REVIEW_SINCE")
+            else None
+        )
+        self.review_pager = (
+            ReviewPager(
+                self.fetcher,
+                parser=self.parser,
+                pages_in_flight=int(os.getenv("REVIEW_PAGES_IN_FLIGHT", "4")),
+                max_pages=self.review_max_pages,
+                limit=self.review_limit,
+                since=self.review_since,
+                archive=self.archive,
+            )
+            if review_fetch == "http"
+            else None
+        )
+        # outputs an older crawler wrote with other columns are started again
+        migrated = [stage for stage in self.stages if self.migrate_output(stage)]
+        # reviews already in the outputs, from this crawl or earlier ones
+        self.review_index = (
+            ReviewIndex(
+                os.getenv(
+                    "REVIEW_INDEX_PATH", os.path.join(self.data_dir, "reviews.db")
+                ),
+                capacity=int(os.getenv("REVIEW_INDEX_CAPACITY", "10000000")),
+                keep=(self.frontier.resuming or self.incremental)
+                and "reviews" not in migrated,
+            )
+            if "reviews" in self.stages and os.getenv("REVIEW_DEDUPE", "1") == "1"
+            else None
+        )
+        # only the stages being run open their outputs
+        self.movie_sink = self.make_stage_sink("metadata")
+        self.cast_sink = self.make_stage_sink("cast")
+        self.review_sink = self.make_stage_sink("reviews")
+        self.sinks = [
+            sink
+            for sink in (self.movie_sink, self.cast_sink, self.review_sink)
+            if sink is not None
+        ]
+        # EXTRACT_PROCESSES > 0 parses and extracts pages in a process pool,
+        # which the parse stage's threads feed and wait on
+        extract_processes = int(os.getenv("EXTRACT_PROCESSES", "0"))
+        self.extractors = (
+            ProcessPoolExecutor(
+                max_workers=extract_processes,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+            if extract_processes > 0
+            else None
+        )
+        self.pipeline = Pipeline(
+            self.fetcher,
+            self.write_record,
+            parse_workers=max(
+                int(os.getenv("PARSE_WORKERS", "2")), 2 * extract_processes
+            ),
+            queue_size=int(os.getenv("QUEUE_SIZE", "64")),
+            checkpoint_every=int(os.getenv("CHECKPOINT_EVERY", "200")),
+        )
+        metrics.configure(os.getenv("METRICS", "0") == "1")
+
+        if metrics.enabled:
+            if os.getenv("METRICS_PORT"):
+                metrics.serve(int(os.getenv("METRICS_PORT")))
+
+            metrics.report(float(os.getenv("METRICS_INTERVAL", "60")))
+
+        self.readiness = PageReadiness(
+            timeout=float(os.getenv("READY_TIMEOUT", "10")),
+            fallback=os.getenv("READY_FALLBACK", "idle"),
+        )
+
+    def migrate_output(self, stage):
+        """
+        Moves the output of `stage` to `<path>.old` if it was written with
+        other columns than its rows have now, and has the frontier forget
+        what the stage extracted, so the whole output is written again.
+        Returns True if it was moved.
+        """
+
+        file_name, worksheet, columns, _ = OUTPUTS[stage]
+        path = os.path.join(self.data_dir, file_name)
+
+        if not os.path.exists(path) or read_header(path) in (None, columns):
+            return False
+
+        print(f"{path} has the columns of an older crawler, moving it to {path}.old")
+
+        # forgotten first, so a crash before the move only repeats it
+        self.frontier.forget(stage, FINGERPRINTS[stage], [path, worksheet])
+        os.replace(path, path + ".old")
+
+        if os.path.exists(path + ".checkpoint"):
+            os.remove(path + ".checkpoint")
+
+        return True
+
+    def make_stage_sink(self, stage):
+        if stage not in self.stages:
+            return None
+
+        file_name, worksheet, columns, last_column_letter = OUTPUTS[stage]
+
+        return self.make_sink(
+            os.path.join(self.data_dir, file_name),
+            worksheet,
+            columns,
+            last_column_letter=last_column_letter,
+        )
+
+    def make_sink(self, path, worksheet, columns, last_column_letter):
+        # resumed and incremental crawls carry on from the saved offsets
+        keep = self.frontier.resuming or self.incremental
+        offset = self.frontier.get_offset(path, None) if keep else None
+
+        sinks = [
+            CsvSink(
+                path,
+                columns,
+                batch_size=int(os.getenv("CSV_BATCH_SIZE", "100")),
+                append=offset is not None,
+                offset=offset,
+            )
+        ]
+
+        if self.sheets_output:
+            # written on a thread of its own, so a Sheets outage never holds
+            # up the writer or fails a checkpoint
+            sinks.append(
+                BackgroundSink(
+                    SheetsSink(
+                        self.sheets,
+                        worksheet,
+                        columns,
+                        last_column_letter,
+                        batch_size=int(os.getenv("SHEETS_BATCH_SIZE", "50")),
+                        max_delay=float(os.getenv("SHEETS_MAX_DELAY", "30")),
+                        start_row=self.frontier.get_offset(worksheet) if keep else 0,
+                    ),
+                    max_buffer=int(os.getenv("SHEETS_MAX_BUFFER", "10000")),
+                    retry_delay=float(os.getenv("SHEETS_RETRY_DELAY", "30")),
+                )
+            )
+
+        return MultiSink(sinks)
 
     def get_page(
         self,
     ):
-        options = webdriver.ChromeOptions()
-        options.add_argument("--headless")
-        options.add_argument("--disable-gpu")
-        options.add_argument("--no-sandbox")
-        options.add_argument("--disable-dev-shm-usage")
+        self.crawl(self.discovered_urls())
+        self.close()
+
+    def crawl(self, urls):
+        return self.pipeline.run(
+            self.queued_urls(urls),
+            self.extract_data,
+            self.checkpoint,
+            drain=self.drain_reviews,
+        )
 
-        chrome_path = os.getenv("GOOGLE_CHROME_PATH")
-        driver_path = os.getenv("CHROMEDRIVER_PATH")
-        debug = os.getenv("DEBUG")
+    def work(self, coordinator, worker, poll=2):
+        """
+        Crawls the leases `worker` claims from `coordinator` until the
+        sharded crawl is finished.
+        """
 
-        self.driver = None
+        coordinator.join(worker)
 
-        print(debug)
+        while True:
+            lease = coordinator.claim(worker)
 
-        if debug == True:
-            self.driver = webdriver.Chrome(options=options)
-        else:
-            options.binary_location = chrome_path
-            self.driver = webdriver.Chrome(
-                service=Service(executable_path=driver_path), options=options
+            if lease is None:
+                if coordinator.is_finished():
+                    break
+
+                sleep(poll)
+                continue
+
+            lease_id, urls = lease
+            print(f"{worker} crawling lease {lease_id} ({len(urls)} urls)")
+
+            holding = coordinator.hold(lease_id, worker)
+
+            try:
+                queued = self.crawl(urls)
+            except Exception as e:
+                print("Error: ", e)
+                coordinator.release(lease_id, worker)
+                continue
+            finally:
+                holding.set()
+
+            incomplete = [
+                url for url in urls if len(self.frontier.pending_stages(url)) > 0
+            ]
+
+            coordinator.complete(
+                lease_id,
+                worker,
+                {"urls": len(urls), "queued": queued, "incomplete": incomplete},
             )
 
-        self.driver.get(self.url)
+        self.close()
+
+    def close(self):
+        # everything is closed even if a step fails, but the crawl is only
+        # marked complete by `finish`
+        try:
+            if self.extractors is not None:
+                self.extractors.shutdown()
+
+            self.browsers.close()
+
+            if self.review_pager is not None:
+                self.review_pager.close()
+        finally:
+            try:
+                self.fetcher.close()
+                self.session.close()
+                self.finish()
+            finally:
+                self.frontier.close()
+
+                if self.review_index is not None:
+                    self.review_index.close()
+
+                if self.archive is not None:
+                    self.archive.close()
+
+                self.readiness.print_summary()
+                metrics.print_summary()
+                metrics.close()
+
+    def finish(self):
+        """
+        Closes the sinks, checkpoints the rows they wrote last and marks the
+        crawl complete. If that fails nothing more is committed, so the
+        fingerprints and done marks never get ahead of the outputs, and the
+        next run resumes from the last checkpoint that succeeded.
+        """
+
+        # the sinks are closed first, so the rows the Sheets thread was still
+        # writing are in the offsets the crawl finishes with
+        self.close_sinks()
+        self.checkpoint()
+        self.frontier.finish()
+
+    def queued_urls(self, urls):
+        for url in urls:
+            if self.frontier.add(url) and len(self.stages_to_run(url)) > 0:
+                yield url
+
+    def stages_to_run(self, url):
+        return [
+            stage for stage in self.frontier.pending_stages(url) if stage in self.stages
+        ]
+
+    def discovered_urls(self):
+        found = 0
+
+        if self.discovery == "http":
+            for url in ListingDiscovery(self.session, self.url).urls():
+                found += 1
+
+                yield url
 
-        sleep(5)
+        if found == 0:
+            print("Falling back to discovering movies with the browser")
+            browser = BrowserWorker(0, self.browsers.stats)
+            self.driver = browser.driver
+
+            try:
+                yield from self.discover_with_browser(browser)
+            finally:
+                browser.quit()
+
+    def discover_with_browser(self, browser):
+        from selenium.webdriver.common.by import By
+
+        browser.get(self.url, "listing")
+
+        self.readiness.wait(
+            self.driver, "listing", element_present(By.CLASS_NAME, "js-tile-link")
+        )
         self.driver.execute_script("window.stop();")
+        browser.measure("listing")
 
         has_more = True
         last_index = 0
@@ -81,7 +479,7 @@ class RottenTomatoesCrawler:
                     inner_elem = elem.find_element(By.XPATH, ("./tile-dynamic//a"))
                     url = inner_elem.get_attribute("href")
 
-                self.extract_data(url)
+                yield url
                 # temp_index = len(movie_cards)
 
             more_btn = self.driver.find_elements(
@@ -90,213 +488,274 @@ class RottenTomatoesCrawler:
 
             if len(more_btn) > 0:
                 last_index = len(movie_cards)
-                more_btn[0].click()
+                browser.click(more_btn[0])
                 has_more = True
 
-                sleep(5)
+                self.readiness.wait(
+                    self.driver,
+                    "listing_load_more",
+                    count_changed(By.CLASS_NAME, "js-tile-link", len(movie_cards)),
+                )
+                browser.measure("listing_load_more")
             else:
                 has_more = False
 
-        self.driver.quit()
-
-    def extract_data(self, url):
+    def extract_data(self, url, content):
         print(f"Crawling {url}")
 
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:98.0) Gecko/20100101 Firefox/98.0"
-        }
-        response = requests.get(url, headers=headers)
-        soup = BeautifulSoup(response.content, "html.parser")
-
-        # self.get_cast_and_crew(soup=soup, movie_url=url)
-        self.get_metadata(soup=soup)
-        # self.get_reviews(soup=soup)
-
-    def get_cast_and_crew(self, soup, movie_url):
-        try:
-            print(f"Getting cast and crew from {movie_url}")
-
-            cast_elems = soup.find("div", attrs={"class": "cast-wrap"}).find_all("div")
-
-            for i in cast_elems:
-                meta = i.find("div", attrs={"class": "metadata"})
+        if self.archive is not None:
+            self.archive.append(url, content)
 
-                if meta is not None:
-                    profile_url = "N/A"
-                    name = "N/A"
-                    role = "N/A"
+        stages = self.stages_to_run(url)
 
-                    profile_path_elem = i.find_all("a")
-                    profile_url = (
-                        self.domain + profile_path_elem[0].get("href")
-                        if len(profile_path_elem) > 0
-                        else ""
-                    )
-
-                    name = i.find_all("img")[0].get("alt").strip()
-                    raw_role = meta.find("p", attrs={"class": "p--small"}).text.strip()
-
-                    role = " ".join([x.strip() for x in raw_role.split(" ")])
-
-                    self.cast.append((movie_url, profile_url, name, role))
-
-            index = (
-                self.last_cast_row
-                if self.last_cast_row == 0
-                else self.last_cast_row - 1
+        if self.extractors is None:
+            record = extract_movie(
+                url,
+                content,
+                self.domain,
+                stages,
+                parser=self.parser,
+                partial=self.partial_parse,
             )
+        else:
+            record = self.extractors.submit(
+                extract_movie,
+                url,
+                content,
+                self.domain,
+                stages,
+                parser=self.parser,
+                partial=self.partial_parse,
+            ).result()
+
+        self.save_record(url, record)
+
+    def save_record(self, url, record):
+        for name, seconds in record["timings"].items():
+            if name == "parse":
+                metrics.observe("parse", seconds)
+            else:
+                metrics.observe("extract", seconds, extractor=name)
 
-            new_cast = self.cast[index:]
+        metrics.inc("parsed_pages")
 
-            columns = (
-                None
-                if self.last_cast_row > 0
-                else ["movie_url", "actor_profile_url", "name", "role"]
-            )
+        for stage, save in (
+            ("cast", self.get_cast_and_crew),
+            ("metadata", self.get_metadata),
+            ("reviews", self.get_reviews),
+        ):
+            if stage not in record:
+                continue
 
-            start = self.last_cast_row + 1
-            end = (
-                len(new_cast) + 1
-                if self.last_cast_row == 0
-                else len(new_cast) + self.last_cast_row
-            )
+            result, error = record[stage]
 
-            self.write_to_google_sheet(
-                new_cast,
-                columns,
-                worksheet="Cast",
-                start=start,
-                end=end,
-                last_column_letter="D",
-            )
+            if error is not None:
+                print("Error: ", error)
+            else:
+                save(result, movie_url=url)
 
-            self.last_cast_row = end
+    def get_cast_and_crew(self, cast, movie_url):
+        print(f"Getting cast and crew from {movie_url}")
 
-            with open("data/cast_and_crew.csv", "w") as cast_csv:
-                writer = csv.writer(cast_csv)
+        value, unchanged = self.check_fingerprint(movie_url, "cast", cast)
 
-                writer.writerow(["movie_url", "actor_profile_url", "name", "role"])
-                writer.writerows(self.cast)
+        if unchanged:
+            print(f"Cast and crew from {movie_url} are unchanged")
 
-            print(f"Successfully extracted and saved cast and crew from {movie_url}")
-        except Exception as e:
-            print("Error: ", e)
+        crawled_at = crawl_time()
 
-    def get_reviews(self, soup):
-        critics_reviews_url_elems = soup.find_all(
-            "a", attrs={"data-qa": "tomatometer-review-count"}
-        )
-        audience_reviews_url_elems = soup.find_all(
-            "a", attrs={"data-qa": "audience-rating-count"}
+        self.output(
+            None if unchanged else self.cast_sink,
+            [member._replace(crawled_at=crawled_at) for member in cast],
+            movie_url=movie_url,
+            stage="cast",
+            fingerprints=[("cast", value)],
         )
 
-        title_elem = soup.find_all("h1", attrs={"data-qa": "score-panel-title"})
-        title = title_elem[0].text.strip() if len(title_elem) > 0 else ""
+        print(f"Successfully extracted and saved cast and crew from {movie_url}")
+
+    def get_reviews(self, links, movie_url=None):
+        title = links["title"]
+        counts = links["counts"]
+        incremental = self.incremental and movie_url is not None
+
+        if (
+            incremental
+            and self.frontier.get_fingerprint(movie_url, "reviews") == counts
+        ):
+            print(f"No new reviews for {title}")
+            self.output(movie_url=movie_url, stage="reviews")
+            return
 
         print(f"Getting movie reviews for {title}")
 
-        # TODO: Consider implementing parallelism to improve the speed of getting the reviews
-        if len(critics_reviews_url_elems) > 0:
-            self.get_critics_reviews(title, critics_reviews_url_elems[0].get("href"))
+        scrapes = [
+            (links[link], review_type)
+            for link, review_type in (
+                ("critics", "critic_review"),
+                ("audience", "audience_review"),
+            )
+            if links[link] is not None
+        ]
+        # the reviews stage is done once every scrape for the movie succeeded
+        progress = {"pending": len(scrapes), "failed": False, "counts": counts}
+
+        def emit(rows):
+            # every page's reviews are written as soon as they are read
+            self.output(self.review_sink, rows, movie_url=movie_url)
+
+        for url_chunk, review_type in scrapes:
+            # finished as soon as it is done, so a scrape never holds its
+            # place in the review queue while this thread waits for another
+            self.fetch_reviews(
+                movie_url,
+                title,
+                url_chunk,
+                review_type,
+                emit,
+                self.frontier.get_fingerprint(movie_url, review_type)
+                if incremental
+                else None,
+            ).add_done_callback(
+                lambda f: self.save_reviews(title, movie_url, f, progress)
+            )
+
+        if len(scrapes) == 0:
+            self.output(
+                movie_url=movie_url,
+                stage="reviews",
+                fingerprints=[("reviews", counts)],
+            )
 
-        if len(audience_reviews_url_elems) > 0:
-            self.get_audience_reviews(title, audience_reviews_url_elems[0].get("href"))
+    def fetch_reviews(
+        self, movie_url, title, url_chunk, review_type, emit, last_seen=None
+    ):
+        # blocks the parse thread while the review queue is full, so review
+        # scrapes are held back like the pipeline's other stages
+        with self.reviews_lock:
+            self.reviews_lock.wait_for(
+                lambda: self.reviews_pending < self.review_queue_size
+            )
+            self.reviews_pending += 1
+
+        if self.review_pager is not None:
+            return self.review_pager.run(
+                movie_url,
+                title,
+                urljoin(self.url, url_chunk),
+                review_type,
+                emit,
+                last_seen,
+            )
 
-        index = (
-            self.last_review_row
-            if self.last_review_row == 0
-            else self.last_review_row - 1
+        return self.browsers.run(
+            self.get_critics_reviews
+            if review_type == "critic_review"
+            else self.get_audience_reviews,
+            movie_url,
+            title,
+            url_chunk,
+            emit,
+            last_seen,
         )
 
-        new_reviews = self.reviews[index:]
+    def drain_reviews(self):
+        # waits until every review scrape has been saved, whichever thread
+        # it finished on
+        self.browsers.drain()
 
-        columns = (
-            None
-            if self.last_review_row > 0
-            else ["movie", "posted_by", "text", "date_posted", "review_type"]
-        )
+        with self.reviews_lock:
+            self.reviews_lock.wait_for(lambda: self.reviews_pending == 0)
 
-        start = self.last_review_row + 1
-        end = (
-            len(new_reviews) + 1
-            if self.last_review_row == 0
-            else len(new_reviews) + self.last_review_row
-        )
+    def save_reviews(self, title, movie_url, future, progress):
+        failed = False
 
-        self.write_to_google_sheet(
-            new_reviews,
-            columns,
-            worksheet="Reviews",
-            start=start,
-            end=end,
-            last_column_letter="E",
-        )
+        try:
+            newest = future.result()
+            fingerprints = []
+
+            if newest is not None:
+                # the newest review, where the next incremental crawl stops,
+                # recorded once the scrape is over so a scrape that failed
+                # part way is read again from the top
+                fingerprints.append(
+                    (newest.review_type, fingerprint(newest.posted_by, newest.text))
+                )
 
-        self.last_review_row = end
+            self.output(movie_url=movie_url, fingerprints=fingerprints)
 
-        with open("data/reviews.csv", "w") as reviews_csv:
-            writer = csv.writer(reviews_csv)
-            writer.writerow(
-                ["movie", "posted_by", "text", "date_posted", "review_type"]
+            print(f"Successfully extracted and saved movie reviews for {title}")
+        except Exception as e:
+            print("Error: ", e)
+            failed = True
+
+        with self.reviews_lock:
+            progress["pending"] -= 1
+            progress["failed"] = progress["failed"] or failed
+            finished = progress["pending"] == 0 and not progress["failed"]
+
+        if finished:
+            self.output(
+                movie_url=movie_url,
+                stage="reviews",
+                fingerprints=[("reviews", progress["counts"])],
             )
-            writer.writerows(self.reviews)
 
-        print(f"Successfully extracted and saved movie reviews for {title}")
+        with self.reviews_lock:
+            self.reviews_pending -= 1
+            self.reviews_lock.notify_all()
 
-    def get_critics_reviews(self, title, url_chunk):
-        self.driver.execute_script("window.open('');")
+    def get_critics_reviews(
+        self, browser, movie_url, title, url_chunk, emit, last_seen=None
+    ):
+        from selenium.webdriver.common.by import By
+
+        driver = browser.driver
+        collector = ReviewCollector(
+            movie_url,
+            title,
+            "critic_review",
+            emit,
+            last_seen,
+            limit=self.review_limit,
+            since=self.review_since,
+        )
 
-        new_window = self.driver.window_handles[1]
-        self.driver.switch_to.window(new_window)
+        complete_url = urljoin(self.url, url_chunk)
 
-        complete_url = "https://" + self.domain + url_chunk
-        self.driver.get(complete_url)
+        browser.get(complete_url, "critic_reviews")
 
-        sleep(3)
-        self.driver.execute_script("window.stop();")
+        self.readiness.wait(
+            driver, "critic_reviews", element_present(By.CLASS_NAME, "review-row")
+        )
+        driver.execute_script("window.stop();")
+        browser.measure("critic_reviews")
 
         has_more = True
         page = 1
-        max_pages = 10
 
         while has_more:
-            print(f"Getting page {page} of {max_pages} from '{title}' critic reviews")
-
-            review_rows = self.driver.find_elements(By.CLASS_NAME, ("review-row"))
-
-            for i in review_rows:
-                posted_by = i.find_element(
-                    By.XPATH,
-                    "./div[@class='review-data']//div[@class='reviewer-name-and-publication']//a[@class='display-name']",
-                ).text.strip()
-                date_posted = i.find_element(
-                    By.XPATH,
-                    "./div[@class='review-text-container']//p[@class='original-score-and-url']//span[@data-qa='review-date']",
-                ).text.strip()
-                review = i.find_element(
-                    By.XPATH,
-                    "./div[@class='review-text-container']//p[@class='review-text']",
-                ).text.strip()
-
-                self.reviews.append(
-                    [title, posted_by, review, date_posted, "critic_review"]
-                )
+            print(f"Getting page {page} from '{title}' critic reviews")
+
+            page_data = driver.execute_script(CRITIC_REVIEWS_SCRIPT)
+            review_rows = page_data["rows"]
 
-            next_btn = self.driver.find_elements(By.CLASS_NAME, "next")
+            more = collector.add_page(page_data["reviews"])
+
+            next_btn = driver.find_elements(By.CLASS_NAME, "next")
 
             if (
                 len(next_btn) != 0
                 and next_btn[0].get_attribute("class") == "next"
-                and page < max_pages
+                and (self.review_max_pages == 0 or page < self.review_max_pages)
+                and more
             ):
-                cookie_popups = self.driver.find_elements(By.ID, "onetrust-policy")
+                cookie_popups = driver.find_elements(By.ID, "onetrust-policy")
 
                 if len(cookie_popups) > 0:
                     cookie_popup = cookie_popups[0]
                     print(cookie_popup.get_attribute("outerHTML"))
-                    self.driver.execute_script(
-                        "arguments[0].scrollIntoView();", next_btn[0]
-                    )
+                    driver.execute_script("arguments[0].scrollIntoView();", next_btn[0])
 
                     print("scrolled to view...")
 
@@ -305,336 +764,291 @@ class RottenTomatoesCrawler:
                 #     if len(btn) > 0:
                 #         btn[0].click()
 
-                # sections_popups = self.driver.find_elements(By.ID, "ot-lst-cnt")
+                # sections_popups = driver.find_elements(By.ID, "ot-lst-cnt")
 
                 # if len(sections_popups) > 0:
                 #     print(len(sections_popups))
                 #     print(sections_popups[0].get_attribute("outerHTML"))
 
-                next_btn[0].click()
-                sleep(3)
+                browser.click(next_btn[0])
+
+                self.readiness.wait(
+                    driver,
+                    "critic_reviews_next",
+                    rows_replaced(By.CLASS_NAME, "review-row", review_rows),
+                )
+                browser.measure("critic_reviews_next")
             else:
                 has_more = False
 
             page += 1
 
-        self.driver.close()
-
-        old_window = self.driver.window_handles[0]
-        self.driver.switch_to.window(old_window)
         print(f"Successfully extracted all critic reviews")
 
-    def get_audience_reviews(self, title, url_chunk):
-        self.driver.execute_script("window.open('');")
+        return collector.newest
+
+    def get_audience_reviews(
+        self, browser, movie_url, title, url_chunk, emit, last_seen=None
+    ):
+        from selenium.webdriver.common.by import By
+
+        driver = browser.driver
+        collector = ReviewCollector(
+            movie_url,
+            title,
+            "audience_review",
+            emit,
+            last_seen,
+            limit=self.review_limit,
+            since=self.review_since,
+        )
 
-        new_window = self.driver.window_handles[1]
-        self.driver.switch_to.window(new_window)
+        complete_url = urljoin(self.url, url_chunk)
 
-        complete_url = "https://" + self.domain + url_chunk
-        self.driver.get(complete_url)
+        browser.get(complete_url, "audience_reviews")
 
-        sleep(3)
-        self.driver.execute_script("window.stop();")
+        self.readiness.wait(
+            driver,
+            "audience_reviews",
+            element_present(By.CLASS_NAME, "audience-review-row"),
+        )
+        driver.execute_script("window.stop();")
+        browser.measure("audience_reviews")
 
         has_more = True
         page = 1
-        max_pages = 10
 
         while has_more:
-            print(f"Getting page {page} of {max_pages} from '{title}' audience reviews")
-
-            review_rows = self.driver.find_elements(
-                By.CLASS_NAME, ("audience-review-row")
-            )
-
-            for row in review_rows:
-                posted_by_elems = row.find_elements(
-                    By.CLASS_NAME, "audience-reviews__name"
-                )
-                posted_by = (
-                    posted_by_elems[0].text.strip()
-                    if len(posted_by_elems) > 0
-                    else "N/A"
-                )
+            print(f"Getting page {page} from '{title}' audience reviews")
 
-                review_elems = row.find_elements(
-                    By.CSS_SELECTOR, "p[data-qa='review-text']"
-                )
-                review = (
-                    review_elems[0].text.strip() if len(review_elems) > 0 else "N/A"
-                )
-
-                date_posted_elems = row.find_elements(
-                    By.CSS_SELECTOR, "span[class='audience-reviews__duration']"
-                )
-                date_posted = (
-                    date_posted_elems[0].text.strip()
-                    if len(date_posted_elems) > 0
-                    else "N/A"
-                )
+            page_data = driver.execute_script(AUDIENCE_REVIEWS_SCRIPT)
+            review_rows = page_data["rows"]
 
-                self.reviews.append(
-                    [title, posted_by, review, date_posted, "audience_review"]
-                )
+            more = collector.add_page(page_data["reviews"])
 
-            next_btn = self.driver.find_elements(By.CLASS_NAME, "next")
+            next_btn = driver.find_elements(By.CLASS_NAME, "next")
 
             if (
                 len(next_btn) != 0
                 and next_btn[0].get_attribute("class") == "next"
-                and page < max_pages
+                and (self.review_max_pages == 0 or page < self.review_max_pages)
+                and more
             ):
-                next_btn[0].click()
-                sleep(3)
+                browser.click(next_btn[0])
+
+                self.readiness.wait(
+                    driver,
+                    "audience_reviews_next",
+                    rows_replaced(By.CLASS_NAME, "audience-review-row", review_rows),
+                )
+                browser.measure("audience_reviews_next")
             else:
                 has_more = False
 
             page += 1
 
-        self.driver.close()
+        print(f"Successfully extracted all audience reviews")
 
-        old_window = self.driver.window_handles[0]
-        self.driver.switch_to.window(old_window)
+        return collector.newest
 
-        print(f"Successfully extracted all audience reviews")
+    def get_metadata(self, movie, movie_url=None):
+        title = movie.title
 
-    def get_metadata(self, soup):
-        try:
-            title_elem = soup.find_all("h1", attrs={"data-qa": "score-panel-title"})
-            title = title_elem[0].text.strip() if len(title_elem) > 0 else ""
+        print(f"Getting metadata for {title}")
 
-            print(f"Getting metadata for {title}")
+        value, unchanged = self.check_fingerprint(movie_url, "metadata", movie)
 
-            thumbnail_elem = soup.find_all("tile-dynamic", attrs={"class": "thumbnail"})
-            thumbnail = (
-                thumbnail_elem[0].find("img").get("src")
-                if len(thumbnail_elem) > 0
-                else ""
-            )
+        if unchanged:
+            print(f"Metadata for {title} is unchanged")
 
-            synopsis_elem = soup.find_all("p", attrs={"data-qa": "movie-info-synopsis"})
-            synopsis = synopsis_elem[0].text.strip() if len(synopsis_elem) > 0 else ""
-
-            score_board = soup.find("score-board", attrs={"id": "scoreboard"})
-
-            audience_score = score_board.get("audiencescore")
-            tomatometer_score = score_board.get("tomatometerscore")
-
-            list_item_elems = soup.find_all("li", attrs={"class": "info-item"})
-
-            rating = "N/A"
-            genre = "N/A"
-            language = "N/A"
-            director = "N/A"
-            producer = "N/A"
-            writer = "N/A"
-            theater_release_date = "N/A"
-            streaming_release_date = "N/A"
-            usa_box_office_gross = "N/A"
-            runtime = "N/A"
-            distributor = "N/A"
-            production_company = "N/A"
-            sound_mix = "N/A"
-
-            for item in list_item_elems:
-                p_elem = item.find("p")
-
-                label = p_elem.find("b").text.strip()
-                value = p_elem.find("span").text.strip()
-
-                if label == "Rating:":
-                    rating = value
-                if label == "Genre:":
-                    # genre = [word.strip() for word in value.split(",")]
-                    genre = f"{','.join([word.strip() for word in value.split(',')])}"
-                if label == "Original Language:":
-                    language = value
-                if label == "Director:":
-                    # director = [word.strip() for word in value.split(",")]
-                    director = (
-                        f"{','.join([word.strip() for word in value.split(',')])}"
-                    )
-                if label == "Producer:":
-                    # producer = [word.strip() for word in value.split(",")]
-                    producer = (
-                        f"{','.join([word.strip() for word in value.split(',')])}"
-                    )
-                if label == "Writer:":
-                    # writer_list = [word.strip() for word in value.split(",")]
-                    writer = f"{','.join([word.strip() for word in value.split(',')])}"
-                if label == "Release Date (Theaters):":
-                    theater_release_date = value
-                if label == "Release Date (Streaming):":
-                    streaming_release_date = value
-                if label == "Box Office (Gross USA):":
-                    usa_box_office_gross = value
-                if label == "Runtime:":
-                    runtime = value
-                if label == "Distributor:":
-                    distributor = value
-                if label == "Production Co:":
-                    # production_company = [word.strip() for word in value.split(",")]
-                    production_company = (
-                        f"{','.join([word.strip() for word in value.split(',')])}"
-                    )
-                if label == "Sound Mix:":
-                    # sound_mix = [word.strip() for word in value.split(",")]
-                    sound_mix = (
-                        f"{','.join([word.strip() for word in value.split(',')])}"
-                    )
+        self.output(
+            None if unchanged else self.movie_sink,
+            [movie._replace(crawled_at=crawl_time())],
+            movie_url=movie_url,
+            stage="metadata",
+            fingerprints=[("metadata", value)],
+        )
 
-            self.movies.append(
-                [
-                    title,
-                    genre,
-                    thumbnail,
-                    synopsis,
-                    rating,
-                    audience_score,
-                    tomatometer_score,
-                    language,
-                    director,
-                    writer,
-                    producer,
-                    theater_release_date,
-                    streaming_release_date,
-                    usa_box_office_gross,
-                    runtime,
-                    distributor,
-                    production_company,
-                    sound_mix,
-                ]
-            )
+        print(f"Successfully extracted and saved metadata for {title}")
 
-            index = (
-                self.last_movie_row
-                if self.last_movie_row == 0
-                else self.last_movie_row - 1
-            )
+    def check_fingerprint(self, movie_url, name, *values):
+        """
+        Returns the fingerprint of what `name` extracted from `movie_url` and
+        whether, on an incremental crawl, it matches the last crawl's.
+        """
 
-            new_movies = self.movies[index:]
-
-            columns = (
-                None
-                if self.last_movie_row > 0
-                else [
-                    "title",
-                    "genre",
-                    "thumbnail_url",
-                    "synopsis",
-                    "rating",
-                    "audience_score",
-                    "tomatometer_score",
-                    "language",
-                    "director",
-                    "writer",
-                    "producer",
-                    "theater_release_date",
-                    "streaming_release_date",
-                    "usa_box_office_gross",
-                    "runtime",
-                    "distributor",
-                    "production_company",
-                    "soundmix",
-                ]
-            )
+        value = fingerprint(*values)
 
-            start = self.last_movie_row + 1
-            end = (
-                len(new_movies) + 1
-                if self.last_movie_row == 0
-                else len(new_movies) + self.last_movie_row
-            )
+        if movie_url is None or not self.incremental:
+            return value, False
 
-            print("End: ", end)
+        return value, self.frontier.get_fingerprint(movie_url, name) == value
 
-            self.write_to_google_sheet(
-                new_movies,
-                columns,
-                worksheet="Movies",
-                start=start,
-                end=end,
-                last_column_letter="R",
-            )
+    def output(self, sink=None, rows=(), movie_url=None, stage=None, fingerprints=()):
+        self.pipeline.emit((sink, rows, movie_url, stage, fingerprints))
 
-            self.last_movie_row = end
-
-            with open("data/movies.csv", "w") as movies_csv:
-                writer = csv.writer(movies_csv)
-                writer.writerow(
-                    [
-                        "title",
-                        "genre",
-                        "thumbnail_url",
-                        "synopsis",
-                        "rating",
-                        "audience_score",
-                        "tomatometer_score",
-                        "language",
-                        "director",
-                        "writer",
-                        "producer",
-                        "theater_release_date",
-                        "streaming_release_date",
-                        "usa_box_office_gross",
-                        "runtime",
-                        "distributor",
-                        "production_company",
-                        "soundmix",
-                    ]
-                )
-                writer.writerows(self.movies)
+    def write_record(self, record):
+        # runs on the pipeline's writer thread, so rows reach their sink
+        # before the stage they belong to is marked done
+        sink, rows, movie_url, stage, fingerprints = record
 
-                print(f"Successfully extracted and saved metadata for {title}")
-        except Exception as e:
-            print("Error: ", e)
+        if sink is self.review_sink and self.review_index is not None:
+            # checked here so a review is only recorded as seen in the
+            # same checkpoint that writes it
+            rows = self.review_index.new_reviews(movie_url or "", rows)
+
+        if sink is not None and len(rows) > 0:
+            try:
+                sink.write(rows)
+            except Exception as e:
+                # the rows stay buffered and the next flush retries them, so
+                # the record is still bookkept, and a checkpoint that cannot
+                # write them commits none of it
+                print("Error: ", e)
+
+        if movie_url is None:
+            return
+
+        for name, value in fingerprints:
+            self.frontier.set_fingerprint(movie_url, name, value)
+
+        if stage is not None:
+            self.frontier.mark_done(movie_url, stage)
+
+    def checkpoint(self):
+        if self.archive is not None:
+            self.archive.commit()
+
+        for sink in self.sinks:
+            sink.flush()
+
+            for name, position in sink.positions().items():
+                self.frontier.set_offset(name, position)
+
+        self.frontier.commit()
+
+        # after the offsets, so a crash in between can repeat a review but
+        # never lose one
+        if self.review_index is not None:
+            self.review_index.commit()
+
+    def close_sinks(self):
+        close_each(self.sinks)
 
     def store_data(self):
         pass
 
-    def write_to_google_sheet(
-        self, data, columns, worksheet, start, end, last_column_letter
-    ):
-        scopes = [
-            "https://www.googleapis.com/auth/spreadsheets",
-            # "https://www.googleapis.com/auth/drive",
-        ]
 
-        # path = os.path.join(os.getcwd(), "credentials.json")
-        info_str = os.getenv("CREDENTIALS")
-        info_json = json.loads(info_str)
+def export_outputs(data_dir, sheets, batch_size=500):
+    """
+    Uploads the CSV outputs in `data_dir` to their worksheets in the crawl's
+    Google Sheet, from the top of each worksheet. Movie and cast rows that a
+    later crawl of their movie superseded are left out.
+    """
+
+    for stage, (file_name, worksheet, columns, last_column_letter) in OUTPUTS.items():
+        path = os.path.join(data_dir, file_name)
 
-        credentials = service_account.Credentials.from_service_account_info(
-            info_json, scopes=scopes
+        if not os.path.exists(path):
+            continue
+
+        sink = SheetsSink(
+            sheets, worksheet, columns, last_column_letter, batch_size=batch_size
         )
-        spreadsheet_service = build("sheets", "v4", credentials=credentials)
-        # drive_service = build("drive", "v3", credentials=credentials)
 
-        values = data
+        if stage == "reviews":
+            rows = read_csv_rows(path)
+        else:
+            rows = latest_rows(path, one_per_movie=stage == "metadata")
 
-        if columns is not None:
-            values.insert(0, columns)
+        for row in rows:
+            sink.write([row])
 
-        range = f"{worksheet}!A{start}:{last_column_letter}{end}"
+        sink.close()
 
-        body = {"values": values}
+        print(f"Exported {max(sink.position() - 1, 0)} rows of {path} to {worksheet}")
 
-        result = (
-            spreadsheet_service.spreadsheets()
-            .values()
-            .update(
-                spreadsheetId="11ZDCJ0_1oAkAcvXUQkQx95uAt_eeO9h5XNxtwJ5eeDc",
-                range=range,
-                valueInputOption="USER_ENTERED",
-                body=body,
-            )
-            .execute()
-        )
 
-        print(result)
+def merge_outputs(data_dir, workers=None):
+    """
+    Rebuilds the CSV outputs in `data_dir` from those of the `workers` of a
+    sharded crawl (all of them by default), in `data_dir/workers/<worker>`,
+    so `export` and `normalize` see the whole crawl. Only checkpointed rows
+    are read. A review that more than one worker wrote is kept once, and
+    so are the movie and cast rows of each movie's latest crawl. Returns
+    the rows written to each file.
+    """
+
+    workers_dir = os.path.join(data_dir, "workers")
+
+    if workers is None:
+        workers = sorted(os.listdir(workers_dir)) if os.path.isdir(workers_dir) else []
+
+    merged = {}
+
+    for stage, (file_name, _, columns, _) in OUTPUTS.items():
+        paths = []
+
+        for worker in workers:
+            path = os.path.join(workers_dir, worker, file_name)
+
+            if not os.path.exists(path):
+                continue
+
+            if read_header(path) != columns:
+                print(f"Error: {path} has the columns of an older crawler, skipping it")
+                continue
+
+            paths.append(path)
+
+        if len(paths) == 0:
+            continue
+
+        latest = None
+
+        if stage != "reviews":
+            # the latest crawl of each movie, by any of the workers
+            latest = {}
+            url_index = columns.index("movie_url")
+            crawled_at_index = columns.index("crawled_at")
+
+            for path in paths:
+                for url, (crawled_at, _) in latest_crawls(path).items():
+                    if crawled_at >= latest.get(url, ""):
+                        latest[url] = crawled_at
+
+        sink = CsvSink(os.path.join(data_dir, file_name), columns, batch_size=1000)
+        # reviews by key, and movies by URL as they have one row per crawl
+        seen = set() if stage in ("reviews", "metadata") else None
+        merged[file_name] = 0
+
+        for path in paths:
+            for row in read_csv_rows(path):
+                if latest is not None:
+                    key = row[url_index]
+
+                    if row[crawled_at_index] != latest[key]:
+                        continue
+                else:
+                    movie_url, _, posted_by, text, date_posted, review_type = row
+                    key = review_key(
+                        movie_url, posted_by, date_posted, text, review_type
+                    )
+
+                if seen is not None:
+                    if key in seen:
+                        continue
+
+                    seen.add(key)
+
+                sink.write([row])
+                merged[file_name] += 1
+
+        sink.close()
+
+        print(
+            f"Merged {merged[file_name]} rows from {len(paths)} workers"
+            f" into {sink.path}"
+        )
 
-        print("\n--- Writing from Google Sheets------")
-        print("------------------------------------")
-        print("\t{0} cells updated.".format(result.get("updatedCells")))
-        print("\t{0} rows updated.".format(result.get("updatedRows")))
-        print("------------------------------------")
+    return merged
@@ -0,0 +1,176 @@
+import os
+import mmap
+import math
+import sqlite3
+import hashlib
+import threading
+from crawler.metrics import metrics
+from crawler.reviews import parse_review_date
+
+
+def normalize(value):
+    return " ".join(value.split()).casefold()
+
+
+def review_key(movie, posted_by, date_posted, text, review_type):
+    """
+    A 64-bit hash of a review, the same however its whitespace or case
+    changes between crawls. Audience reviews show a relative date like "5d"
+    while they are recent and the date they were posted later on, so their
+    date is left out, as are dates that are not dates.
+    """
+
+    date = None if review_type == "audience_review" else parse_review_date(date_posted)
+    normalized = "\x1f".join(
+        [
+            normalize(movie),
+            normalize(posted_by),
+            "" if date is None else date.isoformat(),
+            normalize(text),
+        ]
+    )
+    digest = hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).digest()
+
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class ReviewIndex:
+    """
+    Every review written in this or an earlier crawl, so reviews that are
+    already in the append-only outputs are not written again.
+
+    The keys are 64-bit review hashes kept in a SQLite table. In front of
+    it is a Bloom filter, memory-mapped from `<path>.bloom` and sized for
+    `capacity` reviews at `error_rate` when the index is created, which
+    answers in constant time for the reviews it has never seen, most of
+    the new ones. Only the reviews it might have seen are looked up in the
+    table, so a false positive costs a lookup and never drops a review.
+    Past `capacity` the filter only gets less selective.
+
+    Like the frontier, new keys are only written on `commit`, which the
+    crawler calls after flushing its sinks. Without `keep` the index is cleared,
+    for crawls that start their outputs from scratch.
+    """
+
+    def __init__(self, path, capacity=10_000_000, error_rate=0.01, keep=True) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.pending = set()
+
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS reviews (key INTEGER PRIMARY KEY) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS bloom (bits INTEGER, hashes INTEGER);
+            """
+        )
+
+        if not keep:
+            with self.connection:
+                self.connection.execute("DELETE FROM reviews")
+
+        row = self.connection.execute("SELECT bits, hashes FROM bloom").fetchone()
+
+        if row is None:
+            bits = int(-capacity * math.log(error_rate) / math.log(2) ** 2)
+            hashes = max(1, round(bits / capacity * math.log(2)))
+            row = (bits, hashes)
+
+            with self.connection:
+                self.connection.execute("INSERT INTO bloom VALUES (?, ?)", row)
+
+        self.bits, self.hashes = row
+        self.bloom = self.open_bloom(path + ".bloom", keep)
+
+    def open_bloom(self, path, keep):
+        size = (self.bits + 7) // 8
+        fresh = not keep or not os.path.exists(path) or os.path.getsize(path) != size
+
+        with open(path, "w+b" if fresh else "r+b") as bloom_file:
+            bloom_file.truncate(size)
+            bloom = mmap.mmap(bloom_file.fileno(), size)
+
+        if fresh:
+            # a missing or resized filter is rebuilt from the table
+            for (key,) in self.connection.execute("SELECT key FROM reviews"):
+                self.set_bits(bloom, key)
+
+        return bloom
+
+    def positions(self, key):
+        key &= 0xFFFFFFFFFFFFFFFF
+        first = key & 0xFFFFFFFF
+        step = (key >> 32) | 1
+
+        return [(first + i * step) % self.bits for i in range(self.hashes)]
+
+    def set_bits(self, bloom, key):
+        for position in self.positions(key):
+            bloom[position >> 3] |= 1 << (position & 7)
+
+    def might_contain(self, key):
+        return all(
+            self.bloom[position >> 3] & (1 << (position & 7))
+            for position in self.positions(key)
+        )
+
+    def add(self, key):
+        """
+        Records `key` and returns True if it had not been seen before.
+        """
+
+        with self.lock:
+            if self.might_contain(key):
+                metrics.inc("review_index_lookups")
+
+                if (
+                    key in self.pending
+                    or self.connection.execute(
+                        "SELECT 1 FROM reviews WHERE key = ?", (key,)
+                    ).fetchone()
+                ):
+                    metrics.inc("review_duplicates")
+                    return False
+
+            self.set_bits(self.bloom, key)
+            self.pending.add(key)
+
+            return True
+
+    def new_reviews(self, movie, reviews):
+        """
+        Returns the `reviews` of `movie` that have not been seen before.
+        """
+
+        return [
+            review
+            for review in reviews
+            if self.add(
+                review_key(
+                    movie,
+                    review.posted_by,
+                    review.date_posted,
+                    review.text,
+                    review.review_type,
+                )
+            )
+        ]
+
+    def commit(self):
+        with self.lock:
+            self.bloom.flush()
+
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO reviews (key) VALUES (?)",
+                    [(key,) for key in self.pending],
+                )
+
+            self.pending = set()
+
+    def close(self):
+        # keys still pending were never checkpointed with their reviews, so
+        # they are dropped; the filter bits they set only cost a lookup
+        self.bloom.flush()
+        self.bloom.close()
+        self.connection.close()
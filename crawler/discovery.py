@@ -0,0 +1,102 @@
+from crawler.parsing import parse_html
+from urllib.parse import urljoin, urlparse, parse_qs, urlencode, urlunparse
+
+
+class ListingDiscovery:
+    """
+    Reads the browse listing over HTTP (`?page=N`) and yields every movie
+    URL the first time it is seen, so no browser is needed to find the
+    titles.
+
+    The listing renders the tiles of all previous pages too, so walking it
+    page by page would read about half the listing squared. Instead the
+    page number doubles (1, 2, 4, ...) until a page has no "load more"
+    button, which holds the whole listing, so the tiles read stay within a
+    few times the listing's size. A page past the end that renders no
+    tiles, or no new ones, is narrowed down to the last page that does by
+    bisecting between it and the last good page. `max_pages` caps the page
+    number.
+    """
+
+    def __init__(self, session, url, max_pages=None) -> None:
+        self.session = session
+        self.url = url
+        self.max_pages = max_pages
+        self.seen = set()
+
+    def page_url(self, page):
+        parts = urlparse(self.url)
+        query = parse_qs(parts.query)
+        query["page"] = [str(page)]
+
+        return urlunparse(parts._replace(query=urlencode(query, doseq=True)))
+
+    def urls(self):
+        good = int(parse_qs(urlparse(self.url).query).get("page", ["1"])[0]) - 1
+        page = good + 1
+        bad = None
+
+        while bad is None or bad - good > 1:
+            new_urls, more = self.read_page(page)
+
+            if new_urls is None:
+                # past the end of the listing
+                bad = page
+            else:
+                yield from new_urls
+
+                if not more or page == self.max_pages:
+                    return
+
+                good = page
+
+            if bad is None:
+                page = (
+                    page * 2
+                    if self.max_pages is None
+                    else min(page * 2, self.max_pages)
+                )
+            else:
+                page = (good + bad) // 2
+
+    def read_page(self, page):
+        """
+        Returns the URLs on listing page `page` that were not seen before
+        and whether it has a "load more" button, or `(None, False)` when the
+        page has no new URLs.
+        """
+
+        page_url = self.page_url(page)
+        print(f"Discovering movies on {page_url}")
+
+        response = self.session.get(page_url)
+
+        if response.status_code == 404:
+            return None, False
+
+        if response.status_code != 200:
+            print(f"Error: got {response.status_code} for {page_url}")
+            return None, False
+
+        soup = parse_html(response.content)
+        new_urls = []
+
+        for url in self.tile_urls(soup, page_url):
+            if url not in self.seen:
+                self.seen.add(url)
+                new_urls.append(url)
+
+        if len(new_urls) == 0:
+            return None, False
+
+        more_btn = soup.find_all("button", attrs={"data-qa": "dlp-load-more-button"})
+
+        return new_urls, len(more_btn) > 0
+
+    def tile_urls(self, soup, page_url):
+        for elem in soup.find_all(class_="js-tile-link"):
+            if elem.name != "a":
+                elem = elem.select_one("tile-dynamic a")
+
+            if elem is not None and elem.get("href"):
+                yield urljoin(page_url, elem.get("href"))
@@ -0,0 +1,269 @@
+from time import perf_counter
+from crawler.frontier import fingerprint
+from crawler.parsing import (
+    MOVIE_PAGE_REGIONS,
+    matching_regions,
+    parse_html,
+    parse_movie_page,
+)
+from crawler.records import CastMember, Movie
+from crawler.specs import (
+    CAST_MEMBERS,
+    INFO_ITEMS,
+    METADATA_FIELDS,
+    REVIEW_LINKS,
+    REVIEW_NEXT,
+    REVIEW_ROWS,
+)
+
+
+# Everything here works on the raw page and returns plain tuples, lists and
+# strings, so it can run in a worker process and send compact records back
+# instead of BeautifulSoup trees. The specs in crawler/specs.py are compiled
+# once, when the module is imported.
+
+MISSING = object()
+
+NORMALIZERS = {
+    None: None,
+    "strip": lambda value: value.strip(),
+    "list": lambda value: ",".join([word.strip() for word in value.split(",")]),
+    "words": lambda value: " ".join([word.strip() for word in value.split(" ")]),
+}
+
+
+def compile_steps(steps):
+    finds = []
+
+    for step in steps:
+        tag, _, class_name = step.partition(".")
+        finds.append((tag, {"class": class_name} if class_name else {}))
+
+    def find(elem):
+        for tag, attrs in finds:
+            elem = elem.find(tag, attrs=attrs)
+
+            if elem is None:
+                return None
+
+        return elem
+
+    return find
+
+
+def compile_path(path):
+    """
+    Compiles a `read` path into a function of an element that returns the
+    value, or MISSING when an element along the path is not there.
+    """
+
+    steps = path.split()
+    last = steps.pop()
+    find = compile_steps(steps)
+
+    if last == "text":
+        read = lambda elem: elem.text.strip()
+    elif last.startswith("@"):
+        read = lambda elem, name=last[1:]: elem.get(name)
+    else:
+        raise ValueError(f"a read path must end in text or @name, not {last}")
+
+    def reader(elem):
+        elem = find(elem) if elem is not None else None
+
+        return MISSING if elem is None else read(elem)
+
+    return reader
+
+
+class Field:
+    __slots__ = ("name", "region", "read", "default", "normalize", "prefix")
+
+    def __init__(self, name, spec) -> None:
+        self.name = name
+        self.region = spec.get("region")
+        self.read = compile_path(spec["read"])
+        self.default = spec.get("default", MISSING)
+        self.normalize = NORMALIZERS[spec.get("normalize")]
+        self.prefix = spec.get("prefix")
+
+    def __call__(self, elem, domain=""):
+        value = self.read(elem)
+
+        if value is MISSING:
+            if self.default is MISSING:
+                raise ValueError(f"{self.name} not found")
+
+            return self.default
+
+        if self.normalize is not None:
+            value = self.normalize(value)
+
+        if self.prefix == "domain":
+            value = domain + value
+
+        return value
+
+
+METADATA = [Field(name, spec) for name, spec in METADATA_FIELDS.items()]
+TITLE = METADATA[0]
+
+INFO_LABEL = compile_path(INFO_ITEMS["label"])
+INFO_VALUE = compile_path(INFO_ITEMS["value"])
+INFO_LABELS = {
+    label: (field, NORMALIZERS[normalize])
+    for label, (field, normalize) in INFO_ITEMS["labels"].items()
+}
+
+CAST_ROW_REQUIRES = compile_steps(CAST_MEMBERS["requires"].split())
+CAST_FIELDS = [Field(name, spec) for name, spec in CAST_MEMBERS["fields"].items()]
+
+LINKS = {name: Field(name, spec) for name, spec in REVIEW_LINKS.items()}
+
+
+def find_regions(soup):
+    """
+    Walks the page once and returns the elements of every region, in page
+    order.
+    """
+
+    found = {region: [] for region in MOVIE_PAGE_REGIONS}
+
+    for elem in soup.find_all(True):
+        for region in matching_regions(elem.name, elem.attrs):
+            found[region].append(elem)
+
+    return found
+
+
+def first(found, region):
+    elems = found[region]
+
+    return elems[0] if len(elems) > 0 else None
+
+
+def extract_title(found):
+    return TITLE(first(found, TITLE.region))
+
+
+def extract_cast(found, movie_url, domain):
+    cast_wrap = first(found, CAST_MEMBERS["region"])
+
+    if cast_wrap is None:
+        raise ValueError("cast not found")
+
+    cast = []
+
+    for row in cast_wrap.find_all(CAST_MEMBERS["row"]):
+        if CAST_ROW_REQUIRES(row) is not None:
+            cast.append(
+                CastMember(movie_url, *[field(row, domain) for field in CAST_FIELDS])
+            )
+
+    return cast
+
+
+def extract_metadata(found, movie_url):
+    values = {field.name: field(first(found, field.region)) for field in METADATA}
+
+    for field, _ in INFO_LABELS.values():
+        values[field] = INFO_ITEMS["default"]
+
+    for item in found[INFO_ITEMS["region"]]:
+        label = INFO_LABEL(item)
+
+        if label not in INFO_LABELS:
+            continue
+
+        field, normalize = INFO_LABELS[label]
+        value = INFO_VALUE(item)
+
+        if value is MISSING:
+            raise ValueError(f"no value for {label}")
+
+        values[field] = value if normalize is None else normalize(value)
+
+    return Movie(movie_url, **values)
+
+
+def extract_review_links(found):
+    """
+    Returns the title, the critic and audience review links (or None) and a
+    fingerprint of the review counts shown on the movie page, which only
+    change when there are new reviews to fetch.
+    """
+
+    counts = fingerprint(
+        *[
+            [elem.text.strip() for elem in found[field.region]]
+            for field in LINKS.values()
+        ]
+    )
+
+    return {
+        "title": extract_title(found),
+        **{name: field(first(found, field.region)) for name, field in LINKS.items()},
+        "counts": counts,
+    }
+
+
+def extract_review_page(content, review_type, parser=None):
+    """
+    Returns the `(posted_by, text, date_posted)` of every review on a review
+    page, in page order, and the href of its link to the next page or None.
+    """
+
+    spec = REVIEW_ROWS[review_type]
+    soup = parse_html(content, parser=parser)
+    rows = []
+
+    for row in soup.select(spec["row"]):
+        values = []
+
+        for selector in spec["fields"].values():
+            elem = row.select_one(selector)
+            values.append("N/A" if elem is None else elem.text.strip())
+
+        rows.append(tuple(values))
+
+    next_link = soup.select_one(REVIEW_NEXT)
+
+    return rows, None if next_link is None else next_link.get("href")
+
+
+EXTRACTORS = (
+    ("cast", lambda found, url, domain: extract_cast(found, url, domain)),
+    ("metadata", lambda found, url, domain: extract_metadata(found, url)),
+    ("reviews", lambda found, url, domain: extract_review_links(found)),
+)
+
+
+def extract_movie(url, content, domain, stages, parser=None, partial=True):
+    """
+    Parses a movie page and runs the extractors for `stages` over the
+    regions found in a single walk of the page. Returns a dict mapping each
+    stage to `(result, None)`, or to `(None, error)` with the error message
+    when its extractor failed, and "timings" to the seconds the parse and
+    each extractor took.
+    """
+
+    start = perf_counter()
+    soup = parse_movie_page(content, parser=parser, partial=partial)
+    found = find_regions(soup)
+    timings = {"parse": perf_counter() - start}
+    record = {"timings": timings}
+
+    for stage, extract in EXTRACTORS:
+        if stage not in stages:
+            continue
+
+        start = perf_counter()
+
+        try:
+            record[stage] = (extract(found, url, domain), None)
+        except Exception as e:
+            record[stage] = (None, str(e))
+
+        timings[stage] = perf_counter() - start
+
+    return record
@@ -0,0 +1,232 @@
+import random
+import asyncio
+import requests
+import threading
+from time import monotonic
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+from crawler.metrics import metrics
+from crawler.session import CachedSession
+from crawler.throttle import THROTTLE_STATUSES, AimdLimiter, retry_after
+
+
+class FetchError(Exception):
+    def __init__(self, message, status=None) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+class AsyncFetcher:
+    """
+    Fetches many pages at once on an asyncio event loop.
+
+    `concurrency` caps the number of requests in flight overall and
+    `per_host` caps the number in flight against a single host. With
+    `adaptive`, each host's limit starts lower and is tuned by an
+    `AimdLimiter` between 1 and `per_host`. `delay` is the minimum number of
+    seconds between two requests starting on the same host. The blocking
+    HTTP calls run on a thread pool, while the callbacks run on the event
+    loop thread one at a time, so they do not need to be thread safe.
+
+    `fetch` may also be awaited on other event loops at the same time, like
+    the review pager's. The host limits, politeness delays and the thread
+    pool are shared by all of them, so the site sees one crawler.
+
+    Only 200 responses are handed on. 429s, 5xx responses and network
+    errors are retried up to `retries` times after a jittered exponential
+    backoff starting at `backoff` seconds, or after the Retry-After delay
+    when that is longer. Any other status fails the URL straight away.
+    """
+
+    def __init__(
+        self,
+        concurrency=8,
+        per_host=4,
+        delay=0.0,
+        session=None,
+        adaptive=True,
+        retries=3,
+        backoff=1.0,
+        latency_target=None,
+    ) -> None:
+        self.concurrency = max(1, concurrency)
+        self.per_host = max(1, min(per_host, self.concurrency))
+        self.delay = delay
+        self.session = session or CachedSession(pool_size=self.concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self.adaptive = adaptive
+        self.retries = retries
+        self.backoff = backoff
+        self.latency_target = latency_target
+        self.limiters = {}
+        self.lock = threading.Lock()
+        self.host_next_request = {}
+
+    def run(self, urls, callback):
+        return asyncio.run(self.crawl(urls, callback))
+
+    async def crawl(self, urls, callback):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        tasks = [asyncio.ensure_future(self.fetch(url, semaphore)) for url in urls]
+
+        fetched = 0
+
+        for task in asyncio.as_completed(tasks):
+            try:
+                url, content = await task
+            except Exception as e:
+                print("Error: ", e)
+                continue
+
+            fetched += 1
+
+            try:
+                callback(url, content)
+            except Exception as e:
+                print("Error: ", e)
+
+        return fetched
+
+    def run_queue(self, inbox, outbox):
+        return asyncio.run(self.forward_all(inbox, outbox))
+
+    async def forward_all(self, inbox, outbox):
+        """
+        Fetches URLs taken from the `inbox` queue until it yields None and
+        puts `(url, content)` on the `outbox` queue. No more than
+        `concurrency` URLs are taken at a time, so a full outbox holds the
+        inbox back instead of piling up pages in memory.
+        """
+
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        fetched = 0
+
+        async def forward(url):
+            nonlocal fetched
+
+            try:
+                page = await self.fetch(url, semaphore)
+                await loop.run_in_executor(None, outbox.put, page)
+                fetched += 1
+            except Exception as e:
+                print("Error: ", e)
+            finally:
+                slots.release()
+
+        while True:
+            await slots.acquire()
+
+            url = await loop.run_in_executor(None, inbox.get)
+
+            if url is None:
+                break
+
+            task = asyncio.ensure_future(forward(url))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if len(tasks) > 0:
+            await asyncio.wait(tasks)
+
+        return fetched
+
+    def limiter(self, host):
+        with self.lock:
+            if host not in self.limiters:
+                self.limiters[host] = AimdLimiter(
+                    host,
+                    self.per_host,
+                    start=max(1, self.per_host // 2),
+                    latency_target=self.latency_target,
+                    adaptive=self.adaptive,
+                )
+
+            return self.limiters[host]
+
+    async def fetch(self, url, semaphore):
+        limiter = self.limiter(urlparse(url).netloc)
+        loop = asyncio.get_running_loop()
+
+        for attempt in range(self.retries + 1):
+            response = None
+            pause = None
+
+            async with semaphore:
+                await limiter.acquire()
+
+                try:
+                    await self.wait_turn(limiter.host)
+
+                    start = monotonic()
+                    response = await loop.run_in_executor(self.executor, self.get, url)
+                    latency = monotonic() - start
+                except requests.RequestException as e:
+                    error = e
+                    limiter.throttled()
+                finally:
+                    limiter.release()
+
+            if response is not None:
+                if response.status_code == 200:
+                    if not response.from_cache:
+                        limiter.succeeded(latency)
+
+                    return url, response.content
+
+                error = FetchError(
+                    f"got {response.status_code} for {url}", response.status_code
+                )
+
+                if response.status_code not in THROTTLE_STATUSES:
+                    raise error
+
+                pause = retry_after(response.headers)
+                limiter.throttled(pause)
+
+            if attempt == self.retries:
+                break
+
+            delay = self.backoff * 2**attempt * random.uniform(0.5, 1.5)
+            delay = max(delay, pause or 0)
+            metrics.inc("fetch_retries")
+
+            print(f"Retrying {url} in {delay:.1f}s after: {error}")
+            await asyncio.sleep(delay)
+
+        raise error
+
+    async def wait_turn(self, host):
+        if self.delay <= 0:
+            return
+
+        # each request books the next free start time on its host
+        with self.lock:
+            now = monotonic()
+            start = max(now, self.host_next_request.get(host, now))
+            self.host_next_request[host] = start + self.delay
+
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def get(self, url):
+        try:
+            with metrics.timer("fetch"):
+                response = self.session.get(url)
+        except Exception:
+            metrics.inc("fetch_errors")
+            raise
+
+        metrics.inc(
+            "fetched_pages",
+            status=response.status_code,
+            cached=response.from_cache,
+        )
+
+        return response
+
+    def close(self):
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,198 @@
+import json
+import sqlite3
+import hashlib
+import threading
+from time import time
+
+
+STAGES = ("metadata", "cast", "reviews")
+
+
+def fingerprint(*values):
+    return hashlib.sha1(
+        json.dumps(values, ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+class Frontier:
+    """
+    SQLite-backed crawl state: every discovered movie URL with the status of
+    each extraction stage, plus the sink offsets the outputs had reached.
+
+    A crawl that is still marked as running when the frontier is opened is
+    resumed, otherwise the frontier starts a new crawl from scratch. New
+    URLs, stage completions and offsets are held in memory until `commit`,
+    which the crawler calls right after flushing its sinks, so the database
+    never claims work that has not reached the outputs.
+
+    Content fingerprints of what was extracted for each movie are kept
+    across crawls, and so are the sink offsets when `keep_offsets` is set,
+    so an incremental crawl can append only what changed.
+    """
+
+    def __init__(self, path, keep_offsets=False) -> None:
+        self.path = path
+        self.lock = threading.RLock()
+        self.queued = set()
+        self.discovered = []
+        self.done = []
+        self.offsets = {}
+        self.fingerprints = {}
+
+        self.connection = sqlite3.connect(self.path, check_same_thread=False)
+        self.connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS urls (
+                url TEXT PRIMARY KEY,
+                discovered_at REAL,
+                metadata_status TEXT DEFAULT 'pending',
+                cast_status TEXT DEFAULT 'pending',
+                reviews_status TEXT DEFAULT 'pending'
+            );
+            CREATE TABLE IF NOT EXISTS offsets (name TEXT PRIMARY KEY, value INTEGER);
+            CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS fingerprints (
+                url TEXT,
+                name TEXT,
+                value TEXT,
+                PRIMARY KEY (url, name)
+            );
+            """
+        )
+
+        row = self.connection.execute(
+            "SELECT value FROM state WHERE key = 'status'"
+        ).fetchone()
+
+        self.resuming = row is not None and row[0] == "running"
+
+        with self.connection:
+            if not self.resuming:
+                self.connection.execute("DELETE FROM urls")
+
+                if not keep_offsets:
+                    self.connection.execute("DELETE FROM offsets")
+
+            self.connection.execute(
+                "INSERT OR REPLACE INTO state (key, value) VALUES ('status', 'running')"
+            )
+
+        if self.resuming:
+            print(f"Resuming the crawl recorded in {self.path}")
+
+    def add(self, url):
+        """
+        Records `url` and returns True if it still has stages to run and has
+        not already been queued in this run.
+        """
+
+        with self.lock:
+            if url in self.queued:
+                return False
+
+            if len(self.pending_stages(url)) == 0:
+                return False
+
+            self.queued.add(url)
+            self.discovered.append((url, time()))
+
+            return True
+
+    def pending_stages(self, url):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT metadata_status, cast_status, reviews_status FROM urls WHERE url = ?",
+                (url,),
+            ).fetchone()
+
+        if row is None:
+            return list(STAGES)
+
+        return [stage for stage, status in zip(STAGES, row) if status != "done"]
+
+    def mark_done(self, url, stage):
+        with self.lock:
+            self.done.append((url, stage))
+
+    def get_offset(self, name, default=0):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value FROM offsets WHERE name = ?", (name,)
+            ).fetchone()
+
+        return default if row is None else row[0]
+
+    def set_offset(self, name, value):
+        with self.lock:
+            self.offsets[name] = value
+
+    def get_fingerprint(self, url, name):
+        with self.lock:
+            if (url, name) in self.fingerprints:
+                return self.fingerprints[(url, name)]
+
+            row = self.connection.execute(
+                "SELECT value FROM fingerprints WHERE url = ? AND name = ?", (url, name)
+            ).fetchone()
+
+        return None if row is None else row[0]
+
+    def set_fingerprint(self, url, name, value):
+        with self.lock:
+            self.fingerprints[(url, name)] = value
+
+    def forget(self, stage, names, offsets):
+        """
+        Marks `stage` pending for every URL and forgets the fingerprints
+        `names` and the sink `offsets`, for an output that is started again
+        from scratch. Written straight away, unlike the crawl's progress.
+        """
+
+        with self.lock, self.connection:
+            self.connection.execute(f"UPDATE urls SET {stage}_status = 'pending'")
+            self.connection.executemany(
+                "DELETE FROM fingerprints WHERE name = ?", [(name,) for name in names]
+            )
+            self.connection.executemany(
+                "DELETE FROM offsets WHERE name = ?", [(name,) for name in offsets]
+            )
+
+    def commit(self):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO urls (url, discovered_at) VALUES (?, ?)",
+                self.discovered,
+            )
+
+            for url, stage in self.done:
+                self.connection.execute(
+                    f"UPDATE urls SET {stage}_status = 'done' WHERE url = ?", (url,)
+                )
+
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO offsets (name, value) VALUES (?, ?)",
+                self.offsets.items(),
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO fingerprints (url, name, value) VALUES (?, ?, ?)",
+                [
+                    (url, name, value)
+                    for (url, name), value in self.fingerprints.items()
+                ],
+            )
+
+            self.discovered = []
+            self.done = []
+            self.offsets = {}
+            self.fingerprints = {}
+
+    def finish(self):
+        self.commit()
+
+        with self.lock, self.connection:
+            self.connection.execute(
+                "UPDATE state SET value = 'complete' WHERE key = 'status'"
+            )
+
+    def close(self):
+        self.connection.close()
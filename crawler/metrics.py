@@ -0,0 +1,260 @@
+import threading
+from time import perf_counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# latency histogram bucket bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count", "max")
+
+    def __init__(self) -> None:
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+
+class Timer:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics, name, labels) -> None:
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, perf_counter() - self.start, **self.labels)
+
+
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class Metrics:
+    """
+    Counters, gauges and latency histograms for every stage of the crawl.
+
+    Everything is a no-op until `configure(enabled=True)`, so instrumented
+    code only pays for a method call and an attribute check when metrics
+    are off. `serve` exposes the metrics in the Prometheus text format on
+    a local port and `report` prints a summary every few seconds.
+    """
+
+    def __init__(self, prefix="crawler") -> None:
+        self.prefix = prefix
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.server = None
+        self.stopped = threading.Event()
+
+    def configure(self, enabled):
+        self.enabled = enabled
+
+    def key(self, name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+
+        key = self.key(name, labels)
+
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        if not self.enabled:
+            return
+
+        with self.lock:
+            self.gauges[self.key(name, labels)] = value
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+
+        key = self.key(name, labels)
+
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+
+            self.histograms[key].observe(seconds)
+
+    def timer(self, name, **labels):
+        """
+        Times the `with` block into the `name` histogram.
+        """
+
+        if not self.enabled:
+            return NULL_TIMER
+
+        return Timer(self, name, labels)
+
+    def format_labels(self, labels, extra=()):
+        labels = list(labels) + list(extra)
+
+        if len(labels) == 0:
+            return ""
+
+        return "{%s}" % ",".join(
+            '{0}="{1}"'.format(
+                key, str(value).replace("\\", "\\\\").replace('"', '\\"')
+            )
+            for key, value in labels
+        )
+
+    def render(self):
+        """
+        Returns every metric in the Prometheus text exposition format.
+        """
+
+        lines = []
+        typed = set()
+
+        def declare(name, kind):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                name = f"{self.prefix}_{name}_total"
+                declare(name, "counter")
+                lines.append(f"{name}{self.format_labels(labels)} {value}")
+
+            for (name, labels), value in sorted(self.gauges.items()):
+                name = f"{self.prefix}_{name}"
+                declare(name, "gauge")
+                lines.append(f"{name}{self.format_labels(labels)} {value}")
+
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                name = f"{self.prefix}_{name}_seconds"
+                declare(name, "histogram")
+                cumulative = 0
+
+                for bound, count in zip(BUCKETS, histogram.counts):
+                    cumulative += count
+                    lines.append(
+                        "{0}_bucket{1} {2}".format(
+                            name,
+                            self.format_labels(labels, [("le", bound)]),
+                            cumulative,
+                        )
+                    )
+
+                lines.append(
+                    "{0}_bucket{1} {2}".format(
+                        name,
+                        self.format_labels(labels, [("le", "+Inf")]),
+                        histogram.count,
+                    )
+                )
+                lines.append(f"{name}_sum{self.format_labels(labels)} {histogram.sum}")
+                lines.append(
+                    f"{name}_count{self.format_labels(labels)} {histogram.count}"
+                )
+
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+
+                body = metrics.render().encode("utf-8")
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            self.server = ThreadingHTTPServer((host, port), Handler)
+        except OSError as e:
+            print("Error: ", e)
+            return
+
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        print(f"Serving metrics on http://{host}:{self.server.server_port}/metrics")
+
+    def report(self, interval):
+        def run():
+            while not self.stopped.wait(interval):
+                self.print_summary()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def print_summary(self):
+        if not self.enabled:
+            return
+
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = [
+                (key, histogram.count, histogram.sum, histogram.max)
+                for key, histogram in sorted(self.histograms.items())
+            ]
+
+        print("\n--- Crawl metrics ---")
+
+        for (name, labels), value in counters:
+            print(f"\t{name}{self.format_labels(labels)}: {value}")
+
+        for (name, labels), count, total, longest in histograms:
+            print(
+                "\t{0}{1}: {2} times, mean {3:.3f}s, max {4:.3f}s".format(
+                    name, self.format_labels(labels), count, total / count, longest
+                )
+            )
+
+        print("---------------------")
+
+    def close(self):
+        self.stopped.set()
+
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+metrics = Metrics()
@@ -0,0 +1,299 @@
+import os
+import pandas as pd
+from crawler.reviews import REVIEW_DATE_FORMATS, RELATIVE_DATE
+from crawler.sinks import latest_crawls, read_header
+
+
+# Turns the display strings of the crawled CSVs into typed columns, a whole
+# batch of rows at a time with pandas' vectorized string and numeric
+# operations, and writes them as Parquet tables. The comma separated lists
+# of the movies are exploded into tables of their own, one row per item.
+# Every table is keyed by `movie_slug`, the movie's part of its URL, as
+# titles are not unique.
+
+MOVIE_LISTS = {
+    "genre": "movie_genres",
+    "director": "movie_directors",
+    "writer": "movie_writers",
+    "producer": "movie_producers",
+    "production_company": "movie_production_companies",
+    "soundmix": "movie_soundmixes",
+}
+
+AMOUNTS = {"K": 1e3, "M": 1e6, "B": 1e9}
+
+
+def strings(column):
+    # the crawler writes "N/A" for missing values
+    column = column.astype("string").str.strip()
+
+    return column.mask(column.isin(["N/A", ""]))
+
+
+def parse_integers(column):
+    return pd.to_numeric(
+        strings(column).str.rstrip("%").str.replace(",", ""), errors="coerce"
+    ).astype("Int64")
+
+
+def parse_dates(column):
+    column = strings(column)
+    parsed = pd.Series(pd.NaT, index=column.index, dtype="datetime64[ns]")
+
+    for date_format in REVIEW_DATE_FORMATS:
+        missing = parsed.isna()
+
+        if not missing.any():
+            break
+
+        parsed[missing] = pd.to_datetime(
+            column[missing], format=date_format, errors="coerce"
+        )
+
+    return parsed
+
+
+def parse_money(column):
+    """
+    "$298.1M" -> 298100000, "$950K" -> 950000, "$12,345" -> 12345.
+    """
+
+    parts = strings(column).str.extract(r"^\$?\s*([\d,]*\.?\d+)\s*([KMB])?$")
+    amount = pd.to_numeric(parts[0].str.replace(",", ""), errors="coerce")
+    scale = parts[1].map(AMOUNTS).astype("float64").fillna(1.0)
+
+    return (amount * scale).round().astype("Int64")
+
+
+def parse_runtime(column):
+    """
+    "2h 15m" -> 135, "45m" -> 45, "2h" -> 120.
+    """
+
+    column = strings(column)
+    hours = pd.to_numeric(column.str.extract(r"(\d+)\s*h")[0], errors="coerce")
+    minutes = pd.to_numeric(column.str.extract(r"(\d+)\s*m")[0], errors="coerce")
+    runtime = hours.fillna(0) * 60 + minutes.fillna(0)
+
+    return runtime.mask(hours.isna() & minutes.isna()).astype("Int64")
+
+
+def movie_slugs(urls):
+    """
+    "https://www.rottentomatoes.com/m/barbie" -> "barbie".
+    """
+
+    return strings(urls).str.extract(r"/m/([^/?#]+)")[0]
+
+
+def exploded(batch, column, key="movie_slug", separator=","):
+    items = strings(batch[column]).str.split(separator)
+    table = pd.DataFrame({key: batch[key], column: items}).explode(column)
+    table[column] = strings(table[column])
+
+    return table.dropna(subset=[column]).reset_index(drop=True)
+
+
+def latest(batch, crawls, one_per_movie=False):
+    """
+    The rows of a batch that the latest crawl of their movie wrote, given
+    the `latest_crawls` of their file (see crawler.sinks.latest_rows).
+    """
+
+    if one_per_movie:
+        last = {url: number for url, (_, number) in crawls.items()}
+        keep = batch["movie_url"].map(last) == batch.index
+    else:
+        crawled_at = {url: value for url, (value, _) in crawls.items()}
+        keep = batch["movie_url"].map(crawled_at) == batch["crawled_at"]
+
+    return batch[keep]
+
+
+def normalize_movies(batch):
+    """
+    Returns the typed movies of a batch of movies.csv rows, and the
+    exploded list tables by name.
+    """
+
+    batch = batch.assign(movie_slug=movie_slugs(batch["movie_url"]))
+    movies = pd.DataFrame(
+        {
+            "movie_slug": batch["movie_slug"],
+            "movie_url": strings(batch["movie_url"]),
+            "title": strings(batch["title"]),
+        }
+    )
+
+    for column in ("thumbnail_url", "synopsis", "language", "distributor"):
+        movies[column] = strings(batch[column])
+
+    rating = strings(batch["rating"]).str.extract(r"^([^(]+?)\s*(?:\((.*)\))?$")
+    movies["rating"] = strings(rating[0])
+    movies["rating_reasons"] = strings(rating[1])
+
+    movies["audience_score"] = parse_integers(batch["audience_score"])
+    movies["tomatometer_score"] = parse_integers(batch["tomatometer_score"])
+
+    # "May 26, 2023\n wide" is the date and how widely the movie was released
+    release = strings(batch["theater_release_date"]).str.extract(r"^(.+?\d{4})\s*(.*)$")
+    movies["theater_release_date"] = parse_dates(release[0])
+    movies["theater_release_type"] = strings(release[1])
+    movies["streaming_release_date"] = parse_dates(batch["streaming_release_date"])
+
+    movies["usa_box_office_gross"] = parse_money(batch["usa_box_office_gross"])
+    movies["runtime_minutes"] = parse_runtime(batch["runtime"])
+    movies["crawled_at"] = pd.to_datetime(strings(batch["crawled_at"]), utc=True)
+
+    lists = {
+        name: exploded(batch, column).astype("string")
+        for column, name in MOVIE_LISTS.items()
+    }
+    lists["movie_rating_reasons"] = exploded(
+        movies, "rating_reasons", separator="|"
+    ).astype("string")
+
+    return movies, lists
+
+
+def normalize_cast(batch):
+    cast = pd.DataFrame(
+        {column: strings(batch[column]) for column in batch.columns},
+        index=batch.index,
+    )
+    cast.insert(0, "movie_slug", movie_slugs(batch["movie_url"]))
+    cast["crawled_at"] = pd.to_datetime(cast["crawled_at"], utc=True)
+
+    return cast
+
+
+def normalize_reviews(batch, as_of=None):
+    """
+    Returns the typed reviews of a batch of reviews.csv rows. The crawler
+    saves relative dates ("5d") as the date they stand for, but rows from
+    older crawls may still hold them. Those are counted back from `as_of`,
+    the day they were crawled, or left missing without it.
+    """
+
+    reviews = pd.DataFrame(
+        {
+            column: strings(batch[column])
+            for column in ("movie_url", "movie", "posted_by", "text", "review_type")
+        },
+        index=batch.index,
+    )
+    reviews.insert(0, "movie_slug", movie_slugs(batch["movie_url"]))
+
+    posted = parse_dates(batch["date_posted"])
+    # "5d" is 5 days ago, and "2h" or "30m" is today
+    relative = strings(batch["date_posted"]).str.extract(RELATIVE_DATE.pattern)
+    days = pd.to_numeric(relative[0], errors="coerce").mask(
+        relative[1].isin(["h", "m"]), 0
+    )
+
+    if as_of is not None:
+        posted = posted.fillna(pd.Timestamp(as_of) - pd.to_timedelta(days, unit="D"))
+
+    reviews.insert(5, "date_posted", posted)
+
+    return reviews
+
+
+class ParquetTables:
+    """
+    Writes every named table to `<output_dir>/<name>.parquet`, a row group
+    per batch. The schema of a table is fixed by its first batch.
+    """
+
+    def __init__(self, output_dir) -> None:
+        self.output_dir = output_dir
+        self.writers = {}
+        self.rows = {}
+
+        os.makedirs(self.output_dir, exist_ok=True)
+
+    def write(self, name, frame):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if name not in self.writers:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            self.writers[name] = pq.ParquetWriter(
+                os.path.join(self.output_dir, name + ".parquet"), table.schema
+            )
+            self.rows[name] = 0
+        else:
+            table = pa.Table.from_pandas(
+                frame, schema=self.writers[name].schema, preserve_index=False
+            )
+
+        self.writers[name].write_table(table)
+        self.rows[name] += len(frame)
+
+    def close(self):
+        for writer in self.writers.values():
+            writer.close()
+
+
+def read_batches(path, batch_size):
+    return pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=batch_size)
+
+
+def keyed(path):
+    """
+    Whether the CSV output at `path` exists and has the `movie_url` its
+    tables are keyed by. The next crawl writes older outputs again.
+    """
+
+    if not os.path.exists(path):
+        return False
+
+    if "movie_url" not in (read_header(path) or []):
+        print(f"Error: {path} has no movie_url column, crawl it again to normalize it")
+        return False
+
+    return True
+
+
+def normalize_outputs(input_dir, output_dir, batch_size=50000, as_of=None):
+    """
+    Normalizes the movies.csv, cast_and_crew.csv and reviews.csv in
+    `input_dir` into Parquet tables in `output_dir`, reading `batch_size`
+    rows at a time. Movie and cast rows that a later crawl of their movie
+    superseded are left out. `as_of` is the day older reviews.csv rows with
+    relative dates were crawled (see normalize_reviews). Returns the rows
+    written to each table.
+    """
+
+    tables = ParquetTables(output_dir)
+
+    try:
+        path = os.path.join(input_dir, "movies.csv")
+
+        if keyed(path):
+            crawls = latest_crawls(path)
+
+            for batch in read_batches(path, batch_size):
+                movies, lists = normalize_movies(latest(batch, crawls, True))
+                tables.write("movies", movies)
+
+                for name, table in lists.items():
+                    tables.write(name, table)
+
+        path = os.path.join(input_dir, "cast_and_crew.csv")
+
+        if keyed(path):
+            crawls = latest_crawls(path)
+
+            for batch in read_batches(path, batch_size):
+                tables.write("cast_and_crew", normalize_cast(latest(batch, crawls)))
+
+        path = os.path.join(input_dir, "reviews.csv")
+
+        if keyed(path):
+            for batch in read_batches(path, batch_size):
+                tables.write("reviews", normalize_reviews(batch, as_of))
+    finally:
+        tables.close()
+
+    return tables.rows
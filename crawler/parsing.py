@@ -0,0 +1,75 @@
+from bs4 import BeautifulSoup, SoupStrainer
+from crawler.specs import regions
+
+try:
+    import lxml  # noqa: F401
+
+    DEFAULT_PARSER = "lxml"
+except ImportError:
+    DEFAULT_PARSER = "html.parser"
+
+
+# The only parts of a movie page the extractors read, as (tag, attribute,
+# value) triples, grouped by tag so each element is checked against its own.
+MOVIE_PAGE_REGIONS = regions()
+
+REGIONS_BY_TAG = {}
+
+for region in MOVIE_PAGE_REGIONS:
+    REGIONS_BY_TAG.setdefault(region[0], []).append(region)
+
+
+def matching_regions(name, attrs):
+    matched = []
+
+    for region in REGIONS_BY_TAG.get(name, ()):
+        attr, value = region[1], region[2]
+
+        if attr not in attrs:
+            continue
+
+        if attr == "class":
+            classes = attrs[attr]
+            classes = classes.split() if isinstance(classes, str) else classes
+
+            if value in classes:
+                matched.append(region)
+        elif attrs[attr] == value:
+            matched.append(region)
+
+    return matched
+
+
+def in_movie_page_region(name, attrs):
+    return len(matching_regions(name, attrs)) > 0
+
+
+class MoviePageStrainer(SoupStrainer):
+    # BeautifulSoup 4.13+ no longer passes attributes to a strainer function
+    # and asks the strainer about each new tag through this hook instead
+    def allow_tag_creation(self, nsprefix, name, attrs):
+        return in_movie_page_region(name, attrs or {})
+
+    def allow_string_creation(self, string):
+        return False
+
+
+MOVIE_PAGE_STRAINER = MoviePageStrainer(in_movie_page_region)
+
+
+def parse_html(content, parser=None):
+    return BeautifulSoup(content, parser or DEFAULT_PARSER)
+
+
+def parse_movie_page(content, parser=None, partial=True):
+    """
+    Parses a movie page with `parser` (lxml when it is installed). With
+    `partial`, only the regions in MOVIE_PAGE_REGIONS are built into the
+    tree, which is all the movie extractors look at.
+    """
+
+    return BeautifulSoup(
+        content,
+        parser or DEFAULT_PARSER,
+        parse_only=MOVIE_PAGE_STRAINER if partial else None,
+    )
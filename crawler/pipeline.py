@@ -0,0 +1,155 @@
+import queue
+import threading
+from time import monotonic
+from crawler.metrics import metrics
+
+
+class Pipeline:
+    """
+    Runs a crawl as four stages connected by bounded queues:
+
+        discover -> fetch -> parse -> write
+
+    The discover stage iterates `urls` on its own thread, the fetch stage
+    is an `AsyncFetcher` with its own event loop, `parse_workers` threads
+    call `parse(url, content)` and a single writer thread applies every
+    item passed to `emit` with `write(item)`, calling `checkpoint()` every
+    `checkpoint_every` items or `checkpoint_interval` seconds. Every queue
+    holds at most `queue_size` items, so a slow stage blocks the stages
+    feeding it and memory stays bounded however long the listing is.
+
+    `emit` writes straight away when no crawl is running.
+
+    `drain()` is called once every page has been parsed, before the write
+    stage is closed, so work the parse stage handed off elsewhere (like the
+    review browsers) can still emit its results.
+    """
+
+    def __init__(
+        self,
+        fetcher,
+        write,
+        parse_workers=2,
+        queue_size=64,
+        checkpoint_every=200,
+        checkpoint_interval=30,
+    ) -> None:
+        self.fetcher = fetcher
+        self.parse_workers = max(1, parse_workers)
+        self.queue_size = queue_size
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+        self.write = write
+        self.records = None
+        self.queues = {}
+
+    def run(self, urls, parse, checkpoint, drain=None):
+        url_queue = queue.Queue(maxsize=self.queue_size)
+        page_queue = queue.Queue(maxsize=self.queue_size)
+        self.records = queue.Queue(maxsize=self.queue_size)
+        self.queues = {"urls": url_queue, "pages": page_queue, "records": self.records}
+        found = [0]
+
+        def discover():
+            try:
+                for url in urls:
+                    found[0] += 1
+                    url_queue.put(url)
+            except Exception as e:
+                print("Error: ", e)
+            finally:
+                url_queue.put(None)
+
+        def fetch():
+            try:
+                self.fetcher.run_queue(url_queue, page_queue)
+            finally:
+                for _ in range(self.parse_workers):
+                    page_queue.put(None)
+
+        def parse_pages():
+            while True:
+                page = page_queue.get()
+
+                if page is None:
+                    break
+
+                try:
+                    parse(*page)
+                except Exception as e:
+                    print("Error: ", e)
+
+        writer = threading.Thread(target=self.write_records, args=(checkpoint,))
+        writer.start()
+
+        stages = [threading.Thread(target=discover), threading.Thread(target=fetch)]
+        stages += [
+            threading.Thread(target=parse_pages) for _ in range(self.parse_workers)
+        ]
+
+        for stage in stages:
+            stage.start()
+
+        for stage in stages:
+            stage.join()
+
+        if drain is not None:
+            drain()
+
+        self.records.put(None)
+        writer.join()
+        self.records = None
+
+        return found[0]
+
+    def emit(self, item):
+        records = self.records
+
+        if records is None:
+            self.write(item)
+        else:
+            records.put(item)
+
+    def write_records(self, checkpoint):
+        pending = 0
+        last_checkpoint = monotonic()
+
+        while True:
+            try:
+                item = self.records.get(timeout=1)
+            except queue.Empty:
+                item = False
+
+            if item is None:
+                break
+
+            if metrics.enabled:
+                for name, stage_queue in self.queues.items():
+                    metrics.set("queue_size", stage_queue.qsize(), queue=name)
+
+            if item is not False:
+                try:
+                    self.write(item)
+                except Exception as e:
+                    print("Error: ", e)
+
+                pending += 1
+
+            if pending > 0 and (
+                pending >= self.checkpoint_every
+                or monotonic() - last_checkpoint >= self.checkpoint_interval
+            ):
+                self.checkpoint(checkpoint)
+                pending = 0
+                last_checkpoint = monotonic()
+
+        self.checkpoint(checkpoint)
+
+    def checkpoint(self, checkpoint):
+        # a failed checkpoint must not stop the writer, or every queue
+        # feeding it would fill up and block the crawl
+        try:
+            with metrics.timer("checkpoint"):
+                checkpoint()
+        except Exception as e:
+            print("Error: ", e)
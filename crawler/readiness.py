@@ -0,0 +1,161 @@
+import threading
+from time import monotonic
+from crawler.metrics import metrics
+
+
+# Selenium is imported inside the functions that use it, so the crawler can
+# be started for the stages that never open a browser without loading it.
+
+
+def element_present(by, value):
+    from selenium.webdriver.support import expected_conditions as EC
+
+    return EC.presence_of_element_located((by, value))
+
+
+def count_changed(by, value, previous):
+    def condition(driver):
+        return len(driver.find_elements(by, value)) != previous
+
+    return condition
+
+
+def rows_replaced(by, value, old_rows):
+    """
+    True once the rows on the page are no longer the `old_rows` elements,
+    either because there is a different number of them or because the first
+    one has been detached from the DOM.
+    """
+
+    from selenium.webdriver.support import expected_conditions as EC
+
+    stale = EC.staleness_of(old_rows[0]) if len(old_rows) > 0 else None
+
+    def condition(driver):
+        rows = driver.find_elements(by, value)
+
+        if len(rows) != len(old_rows):
+            return len(rows) > 0
+
+        return stale is not None and stale(driver)
+
+    return condition
+
+
+def network_idle(idle_time=0.5):
+    """
+    True once the document has parsed and no new resource has been requested
+    for `idle_time` seconds.
+    """
+
+    state = {"count": -1, "since": monotonic()}
+
+    def condition(driver):
+        ready_state, count = driver.execute_script(
+            "return [document.readyState,"
+            " performance.getEntriesByType('resource').length];"
+        )
+
+        if ready_state == "loading" or count != state["count"]:
+            state["count"] = count
+            state["since"] = monotonic()
+            return False
+
+        return monotonic() - state["since"] >= idle_time
+
+    return condition
+
+
+class PageReadiness:
+    """
+    Explicit waits used in place of fixed sleeps after Selenium navigations.
+
+    `wait` polls `condition` for up to `timeout` seconds. If it never holds,
+    the `fallback` policy decides what happens next: "idle" waits up to
+    `fallback_timeout` seconds for the network to go quiet, "stop" continues
+    straight away and "raise" re-raises the timeout. How long every wait
+    took is recorded under its name so `summary` can report it.
+    """
+
+    def __init__(
+        self, timeout=10, fallback="idle", fallback_timeout=5, poll=0.1
+    ) -> None:
+        self.timeout = timeout
+        self.fallback = fallback
+        self.fallback_timeout = fallback_timeout
+        self.poll = poll
+        self.timings = {}
+        self.timeouts = {}
+        self.lock = threading.Lock()
+
+    def wait(self, driver, name, condition, timeout=None):
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        start = monotonic()
+        ready = True
+
+        try:
+            WebDriverWait(
+                driver, timeout or self.timeout, poll_frequency=self.poll
+            ).until(condition)
+        except TimeoutException:
+            ready = False
+
+            if self.fallback == "raise":
+                self.record(name, monotonic() - start, ready)
+                raise
+
+            print(f"Timed out waiting for {name}, falling back to '{self.fallback}'")
+
+            if self.fallback == "idle":
+                try:
+                    WebDriverWait(
+                        driver, self.fallback_timeout, poll_frequency=self.poll
+                    ).until(network_idle())
+                except TimeoutException:
+                    pass
+
+        self.record(name, monotonic() - start, ready)
+
+        return ready
+
+    def record(self, name, elapsed, ready):
+        metrics.observe("selenium_wait", elapsed, name=name)
+
+        if not ready:
+            metrics.inc("selenium_wait_timeouts", name=name)
+
+        with self.lock:
+            self.timings.setdefault(name, []).append(elapsed)
+
+            if not ready:
+                self.timeouts[name] = self.timeouts.get(name, 0) + 1
+
+    def summary(self):
+        with self.lock:
+            return {
+                name: {
+                    "count": len(timings),
+                    "timeouts": self.timeouts.get(name, 0),
+                    "mean": sum(timings) / len(timings),
+                    "max": max(timings),
+                }
+                for name, timings in self.timings.items()
+            }
+
+    def print_summary(self):
+        print("\n--- Page readiness waits (seconds) ---")
+
+        for name, stats in self.summary().items():
+            print(
+                "\t{0}: {1} waits, {2} timeouts, mean {3:.2f}, max {4:.2f}".format(
+                    name,
+                    stats["count"],
+                    stats["timeouts"],
+                    stats["mean"],
+                    stats["max"],
+                )
+            )
+
+        print("--------------------------------------")
@@ -0,0 +1,69 @@
+from typing import NamedTuple
+from datetime import datetime, timezone
+
+
+# The rows the crawler streams to its sinks. Named tuples keep no per-row
+# __dict__, are written by csv as they are and fingerprint the same as the
+# plain lists and tuples they replace.
+#
+# Every row carries the URL of its movie, which unlike the title is unique.
+# Movie and cast rows also carry when they were crawled, as the outputs
+# are append-only: a movie that changed gets new rows, which
+# supersede the ones of earlier crawls (see `latest_crawls`). `crawled_at`
+# is left empty by the extractors and set when the rows are saved, so it
+# is not part of their fingerprints.
+
+
+def crawl_time(seconds=None):
+    """
+    The `crawled_at` of rows crawled at `seconds` since the epoch, or now.
+    ISO 8601 in UTC to the microsecond, so the times sort as strings and
+    two crawls of a movie are told apart however close together they ran.
+    """
+
+    if seconds is None:
+        date = datetime.now(timezone.utc)
+    else:
+        date = datetime.fromtimestamp(seconds, timezone.utc)
+
+    return date.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class Movie(NamedTuple):
+    movie_url: str
+    title: str
+    genre: str
+    thumbnail_url: str
+    synopsis: str
+    rating: str
+    audience_score: str
+    tomatometer_score: str
+    language: str
+    director: str
+    writer: str
+    producer: str
+    theater_release_date: str
+    streaming_release_date: str
+    usa_box_office_gross: str
+    runtime: str
+    distributor: str
+    production_company: str
+    soundmix: str
+    crawled_at: str = ""
+
+
+class CastMember(NamedTuple):
+    movie_url: str
+    actor_profile_url: str
+    name: str
+    role: str
+    crawled_at: str = ""
+
+
+class Review(NamedTuple):
+    movie_url: str
+    movie: str
+    posted_by: str
+    text: str
+    date_posted: str
+    review_type: str
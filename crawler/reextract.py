@@ -0,0 +1,102 @@
+import os
+from time import monotonic
+from urllib.parse import urlparse
+from concurrent.futures import ProcessPoolExecutor
+from crawler.archive import PageArchive, read_record
+from crawler.extraction import extract_movie
+from crawler.records import CastMember, Movie, crawl_time
+from crawler.sinks import CsvSink
+
+
+# Review pages fetched over HTTP are archived too, but they are not
+# re-extracted: their rows need the title from the movie page, and the
+# same review moves between pages from one crawl to the next.
+STAGES = ("metadata", "cast")
+
+
+def is_review_page(url):
+    return urlparse(url).path.rstrip("/").endswith("/reviews")
+
+
+def extract_archived(path, entry, domain, parser, partial):
+    url, fetched_at, file_name, offset, length = entry
+    content = read_record(path, file_name, offset, length)
+
+    return (
+        url,
+        fetched_at,
+        extract_movie(url, content, domain, STAGES, parser=parser, partial=partial),
+    )
+
+
+def reextract(
+    path, output_dir, domain, processes=None, parser=None, partial=True, chunksize=8
+):
+    """
+    Runs the extractors over the latest archived copy of every movie page in
+    the archive at `path` with `processes` processes (one per core by
+    default) and writes fresh movies.csv and cast_and_crew.csv files to
+    `output_dir`, in archive order. Nothing is fetched.
+    """
+
+    archive = PageArchive(path)
+    entries = [entry for entry in archive.entries() if not is_review_page(entry[0])]
+    archive.close()
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    movie_sink = CsvSink(
+        os.path.join(output_dir, "movies.csv"), list(Movie._fields), batch_size=1000
+    )
+    cast_sink = CsvSink(
+        os.path.join(output_dir, "cast_and_crew.csv"),
+        list(CastMember._fields),
+        batch_size=1000,
+    )
+
+    print(f"Re-extracting {len(entries)} archived pages from {path}")
+
+    start = monotonic()
+    failed = 0
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        results = executor.map(
+            extract_archived,
+            [path] * len(entries),
+            entries,
+            [domain] * len(entries),
+            [parser] * len(entries),
+            [partial] * len(entries),
+            chunksize=chunksize,
+        )
+
+        for url, fetched_at, record in results:
+            # stamped with when the page was fetched, not re-extracted
+            crawled_at = crawl_time(fetched_at)
+
+            for stage, sink, rows in (
+                ("metadata", movie_sink, lambda movie: [movie]),
+                ("cast", cast_sink, lambda cast: cast),
+            ):
+                result, error = record[stage]
+
+                if error is not None:
+                    print(f"Error: {stage} from {url}: {error}")
+                    failed += 1
+                else:
+                    sink.write(
+                        [row._replace(crawled_at=crawled_at) for row in rows(result)]
+                    )
+
+    movie_sink.close()
+    cast_sink.close()
+
+    elapsed = monotonic() - start
+
+    print(
+        "Re-extracted {0} pages in {1:.1f}s ({2:.1f} pages/s), {3} failed".format(
+            len(entries), elapsed, len(entries) / max(elapsed, 1e-9), failed
+        )
+    )
+
+    return len(entries)
@@ -0,0 +1,321 @@
+import re
+import asyncio
+import threading
+from datetime import date, datetime, timedelta
+from urllib.parse import urljoin, urlparse, parse_qs, urlencode, urlunparse
+from crawler.extraction import extract_review_page
+from crawler.frontier import fingerprint
+from crawler.metrics import metrics
+from crawler.records import Review
+
+
+REVIEW_DATE_FORMATS = ("%b %d, %Y", "%B %d, %Y", "%m/%d/%Y", "%Y-%m-%d")
+
+# "5d" and "2h" on audience reviews that are only days old
+RELATIVE_DATE = re.compile(r"^(\d+)\s*([dhm])$")
+
+
+def parse_review_date(value):
+    """
+    Returns the date a review was posted, or None when it is not a date
+    (audience reviews show recent ones as "5d" or "2h").
+    """
+
+    for date_format in REVIEW_DATE_FORMATS:
+        try:
+            return datetime.strptime(value.strip(), date_format).date()
+        except ValueError:
+            continue
+
+    return None
+
+
+def resolve_review_date(value, today):
+    """
+    Returns a relative date like "5d" or "2h" as the date it stands for,
+    counted back from `today`, in the format of the other review dates.
+    Anything else is returned as it is.
+    """
+
+    match = RELATIVE_DATE.match(value.strip())
+
+    if match is None:
+        return value
+
+    days = int(match[1]) if match[2] == "d" else 0
+
+    return (today - timedelta(days=days)).strftime(REVIEW_DATE_FORMATS[0])
+
+
+def page_number(url):
+    """
+    Returns the `page` number in the query of `url`, or None.
+    """
+
+    pages = parse_qs(urlparse(url).query).get("page", [])
+
+    return int(pages[0]) if len(pages) == 1 and pages[0].isdigit() else None
+
+
+def numbered_url(url, page):
+    parts = urlparse(url)
+    query = parse_qs(parts.query, keep_blank_values=True)
+    query["page"] = [str(page)]
+
+    return urlunparse(parts._replace(query=urlencode(query, doseq=True)))
+
+
+class ReviewCollector:
+    """
+    Collects a movie's reviews of one type, newest first, a page at a time.
+
+    `add_page` takes the `(posted_by, text, date_posted)` rows of the next
+    page, hands the page's reviews to `emit` and returns False once there
+    is nothing more to collect: the page was empty, a review matched
+    `last_seen` (the newest review of the last crawl), `limit` reviews have
+    been collected or a review was posted before the `since` date. Only the
+    `newest` review and the `count` are kept, so a long review history is
+    never held in memory. `last_seen` is the fingerprint of a review's
+    author and text only, since recent audience reviews show a date like
+    "5d" that changes from one crawl to the next. Those relative dates are
+    saved as the date they stand for on the day the page was read.
+    """
+
+    def __init__(
+        self, movie_url, title, review_type, emit, last_seen=None, limit=0, since=None
+    ) -> None:
+        self.movie_url = movie_url
+        self.title = title
+        self.review_type = review_type
+        self.emit = emit
+        self.last_seen = last_seen
+        self.limit = limit
+        self.since = since
+        self.newest = None
+        self.count = 0
+        self.done = False
+        self.today = date.today()
+
+    def add_page(self, rows):
+        reviews = []
+
+        if len(rows) == 0:
+            self.done = True
+
+        for posted_by, text, date_posted in rows:
+            if fingerprint(posted_by, text) == self.last_seen:
+                self.done = True
+                break
+
+            date_posted = resolve_review_date(date_posted, self.today)
+
+            if self.since is not None:
+                posted = parse_review_date(date_posted)
+
+                if posted is not None and posted < self.since:
+                    self.done = True
+                    break
+
+            reviews.append(
+                Review(
+                    self.movie_url,
+                    self.title,
+                    posted_by,
+                    text,
+                    date_posted,
+                    self.review_type,
+                )
+            )
+
+            if self.limit > 0 and self.count + len(reviews) >= self.limit:
+                self.done = True
+                break
+
+        if len(reviews) > 0:
+            if self.newest is None:
+                self.newest = reviews[0]
+
+            self.count += len(reviews)
+            self.emit(reviews)
+
+        return not self.done
+
+
+class ReviewPager:
+    """
+    Pages through a movie's reviews over HTTP by following the link to the
+    next page in each page's markup (see specs.REVIEW_NEXT), instead of
+    clicking through them in a browser.
+
+    When those links number the pages (`page=N`), the `pages_in_flight`
+    pages after the one being read are fetched ahead by their numbers. A
+    page fetched ahead is only read once the page before it links to it,
+    so a site that ignores the numbers or pages by cursor is followed link
+    by link instead. Pages are read in order until the collector stops, a
+    page has no reviews or no next link, or `max_pages` pages have been
+    read (0 for no limit). Pages fetched past that point are dropped.
+
+    Every movie is paged on one event loop, started on first use in a
+    background thread, with the crawler's fetcher, so the per-host limits
+    and backoff hold across movie and review pages. Every page fetched is
+    added to `archive`. `run` returns a future of the newest review
+    collected, like the browser's scrapes, and every page's reviews are
+    handed to `emit` as soon as the page is read.
+    """
+
+    def __init__(
+        self,
+        fetcher,
+        parser=None,
+        pages_in_flight=4,
+        max_pages=0,
+        limit=0,
+        since=None,
+        archive=None,
+    ) -> None:
+        self.fetcher = fetcher
+        self.parser = parser
+        self.pages_in_flight = max(1, pages_in_flight)
+        self.max_pages = max_pages
+        self.limit = limit
+        self.since = since
+        self.archive = archive
+        self.lock = threading.Lock()
+        self.loop = None
+        self.thread = None
+        self.semaphore = None
+        self.fetching_ahead = set()
+
+    def start(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(
+                    target=self.loop.run_forever, daemon=True
+                )
+                self.thread.start()
+
+        return self.loop
+
+    def run(self, movie_url, title, url, review_type, emit, last_seen=None):
+        return asyncio.run_coroutine_threadsafe(
+            self.reviews(movie_url, title, url, review_type, emit, last_seen),
+            self.start(),
+        )
+
+    def read_page(self, url, content, review_type):
+        if self.archive is not None:
+            self.archive.append(url, content)
+
+        rows, next_link = extract_review_page(content, review_type, self.parser)
+
+        return rows, None if next_link is None else urljoin(url, next_link)
+
+    async def fetch_page(self, url, review_type):
+        _, content = await self.fetcher.fetch(url, self.semaphore)
+
+        metrics.inc("review_pages", review_type=review_type)
+
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self.read_page, url, content, review_type
+        )
+
+    def fetch_ahead(self, pages, url, review_type, read):
+        number = page_number(url)
+
+        for ahead in range(1, self.pages_in_flight):
+            if self.max_pages > 0 and read + ahead >= self.max_pages:
+                break
+
+            ahead_url = numbered_url(url, number + ahead)
+
+            if ahead_url not in pages:
+                page = asyncio.ensure_future(self.fetch_page(ahead_url, review_type))
+                pages[ahead_url] = page
+                # pages fetched ahead and never read are left to finish, so
+                # their requests keep their place in the host's limit, and
+                # an error past the last page is dropped with them
+                self.fetching_ahead.add(page)
+                page.add_done_callback(self.fetched_ahead)
+
+    def fetched_ahead(self, page):
+        self.fetching_ahead.discard(page)
+
+        if not page.cancelled():
+            page.exception()
+
+    async def settle(self):
+        if len(self.fetching_ahead) > 0:
+            await asyncio.wait(list(self.fetching_ahead))
+
+    async def reviews(self, movie_url, title, url, review_type, emit, last_seen):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.fetcher.concurrency)
+
+        loop = asyncio.get_running_loop()
+        collector = ReviewCollector(
+            movie_url,
+            title,
+            review_type,
+            emit,
+            last_seen,
+            limit=self.limit,
+            since=self.since,
+        )
+        pages = {}
+        visited = set()
+        ahead = True
+        page_url = url
+        last_rows = None
+        read = 0
+
+        while page_url is not None and (self.max_pages == 0 or read < self.max_pages):
+            if page_url in visited:
+                print(f"Error: {page_url} links back to a page already read")
+                break
+
+            visited.add(page_url)
+            page = pages.pop(page_url, None)
+
+            if page is None:
+                if len(pages) > 0:
+                    # the site did not link to the pages fetched ahead,
+                    # so the rest are followed link by link
+                    ahead = False
+                    pages = {}
+
+                page = self.fetch_page(page_url, review_type)
+
+            if ahead and page_number(page_url) is not None:
+                self.fetch_ahead(pages, page_url, review_type, read)
+
+            fetched_url = page_url
+            rows, page_url = await page
+
+            if len(rows) == 0:
+                break
+
+            if rows == last_rows:
+                print(f"Error: {fetched_url} repeats the reviews of the page before")
+                break
+
+            last_rows = rows
+            read += 1
+
+            # off the loop, as emitting waits while the writer's queue is full
+            if not await loop.run_in_executor(None, collector.add_page, rows):
+                break
+
+        print(
+            f"Got {collector.count} {review_type.replace('_', ' ')}s"
+            f" for '{title}' from {read} pages"
+        )
+
+        return collector.newest
+
+    def close(self):
+        if self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self.settle(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+            self.loop.close()
@@ -0,0 +1,236 @@
+import os
+import json
+import hashlib
+import requests
+import threading
+from time import time
+from requests.adapters import HTTPAdapter
+
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:98.0) Gecko/20100101 Firefox/98.0"
+}
+
+
+class CachedResponse:
+    def __init__(self, url, status_code, content, headers, from_cache=False) -> None:
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+        self.from_cache = from_cache
+
+
+class ResponseCache:
+    """
+    On-disk response cache keyed by URL.
+
+    Each entry is a `<key>.body` file with a `<key>.json` file next to it
+    holding the validators (ETag / Last-Modified), when it was stored and
+    when it was last read. Entries older than `ttl` seconds are stale and
+    must be revalidated, and once the bodies take up more than `max_bytes`
+    the least recently read entries are evicted.
+
+    Reads only update the last read time in memory. It is written to the
+    `.json` files on `close`, so a cache hit costs no write.
+    """
+
+    def __init__(self, path, ttl=86400, max_bytes=512 * 1024 * 1024) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.size = 0
+        self.accessed = set()
+
+        os.makedirs(self.path, exist_ok=True)
+
+        for name in os.listdir(self.path):
+            if not name.endswith(".json"):
+                continue
+
+            try:
+                with open(os.path.join(self.path, name)) as meta_file:
+                    meta = json.load(meta_file)
+            except (OSError, ValueError):
+                continue
+
+            self.entries[name[: -len(".json")]] = meta
+            self.size += meta["size"]
+
+    def key(self, url):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    def get(self, url):
+        key = self.key(url)
+
+        with self.lock:
+            meta = self.entries.get(key)
+
+            if meta is None:
+                return None, None
+
+            meta["accessed_at"] = time()
+            self.accessed.add(key)
+
+        try:
+            with open(os.path.join(self.path, key + ".body"), "rb") as body_file:
+                body = body_file.read()
+        except OSError:
+            with self.lock:
+                self.remove(key)
+
+            return None, None
+
+        return meta, body
+
+    def is_fresh(self, meta):
+        return time() - meta["stored_at"] < self.ttl
+
+    def put(self, url, body, etag=None, last_modified=None):
+        key = self.key(url)
+        now = time()
+        meta = {
+            "url": url,
+            "etag": etag,
+            "last_modified": last_modified,
+            "stored_at": now,
+            "accessed_at": now,
+            "size": len(body),
+        }
+
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries[key]["size"]
+
+            body_path = os.path.join(self.path, key + ".body")
+            tmp_path = body_path + ".tmp"
+
+            with open(tmp_path, "wb") as body_file:
+                body_file.write(body)
+
+            os.replace(tmp_path, body_path)
+
+            self.write_meta(key, meta)
+            self.entries[key] = meta
+            self.accessed.discard(key)
+            self.size += meta["size"]
+
+            self.evict()
+
+    def refresh(self, url, etag=None, last_modified=None):
+        key = self.key(url)
+
+        with self.lock:
+            meta = self.entries.get(key)
+
+            if meta is None:
+                return
+
+            meta["stored_at"] = time()
+            meta["etag"] = etag or meta["etag"]
+            meta["last_modified"] = last_modified or meta["last_modified"]
+
+            self.write_meta(key, meta)
+            self.accessed.discard(key)
+
+    def write_meta(self, key, meta):
+        meta_path = os.path.join(self.path, key + ".json")
+        tmp_path = meta_path + ".tmp"
+
+        with open(tmp_path, "w") as meta_file:
+            json.dump(meta, meta_file)
+
+        os.replace(tmp_path, meta_path)
+
+    def evict(self):
+        if self.size <= self.max_bytes:
+            return
+
+        by_access = sorted(self.entries.items(), key=lambda x: x[1]["accessed_at"])
+
+        for key, _ in by_access:
+            if self.size <= self.max_bytes:
+                break
+
+            self.remove(key)
+
+    def remove(self, key):
+        meta = self.entries.pop(key, None)
+        self.accessed.discard(key)
+
+        if meta is not None:
+            self.size -= meta["size"]
+
+        for ext in (".body", ".json"):
+            try:
+                os.remove(os.path.join(self.path, key + ext))
+            except OSError:
+                pass
+
+    def close(self):
+        # the last read times, for the eviction order of the next crawl
+        with self.lock:
+            for key in self.accessed:
+                self.write_meta(key, self.entries[key])
+
+            self.accessed = set()
+
+
+class CachedSession:
+    """
+    A shared `requests.Session` with keep-alive connection pooling in front
+    of a `ResponseCache`. Fresh entries are served from disk, stale entries
+    are revalidated with If-None-Match / If-Modified-Since and a 304 is
+    answered from disk.
+    """
+
+    def __init__(self, cache=None, pool_size=10, timeout=30) -> None:
+        self.cache = cache
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, url):
+        meta, body = (None, None) if self.cache is None else self.cache.get(url)
+
+        if meta is not None and self.cache.is_fresh(meta):
+            return CachedResponse(url, 200, body, {}, from_cache=True)
+
+        headers = {}
+
+        if meta is not None:
+            if meta["etag"]:
+                headers["If-None-Match"] = meta["etag"]
+            if meta["last_modified"]:
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
+
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+
+        if response.status_code == 304 and meta is not None:
+            self.cache.refresh(url, etag=etag, last_modified=last_modified)
+
+            return CachedResponse(url, 200, body, response.headers, from_cache=True)
+
+        if response.status_code == 200 and self.cache is not None:
+            self.cache.put(
+                url, response.content, etag=etag, last_modified=last_modified
+            )
+
+        return CachedResponse(
+            url, response.status_code, response.content, response.headers
+        )
+
+    def close(self):
+        self.session.close()
+
+        if self.cache is not None:
+            self.cache.close()
@@ -0,0 +1,490 @@
+import os
+import csv
+import json
+import threading
+from time import monotonic
+from crawler.metrics import metrics
+
+
+class Sink:
+    """
+    Buffers rows and hands them to `write_rows` in batches of `batch_size`,
+    or sooner once the oldest buffered row has waited `max_delay` seconds.
+    `flush` writes whatever is buffered and is called at checkpoints. Rows
+    stay buffered if writing them fails so the next flush retries them.
+    """
+
+    name = None
+
+    def __init__(self, columns, batch_size=100, max_delay=None) -> None:
+        self.columns = columns
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.buffer = []
+        self.buffered_at = None
+        self.lock = threading.Lock()
+
+    def write(self, rows):
+        with self.lock:
+            if self.buffered_at is None:
+                self.buffered_at = monotonic()
+
+            self.buffer.extend(rows)
+
+            if len(self.buffer) >= self.batch_size or (
+                self.max_delay is not None
+                and monotonic() - self.buffered_at >= self.max_delay
+            ):
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if len(self.buffer) == 0:
+            return
+
+        with metrics.timer("sink_write", sink=self.name):
+            self.write_rows(self.buffer)
+
+        metrics.inc("sink_rows", len(self.buffer), sink=self.name)
+
+        self.buffer = []
+        self.buffered_at = None
+
+    def write_rows(self, rows):
+        raise NotImplementedError
+
+    def position(self):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+
+class CsvSink(Sink):
+    """
+    Appends rows to a CSV file. After every flush the file is fsynced and
+    its length is saved in `<path>.checkpoint`; reopening with `append=True`
+    truncates anything written after the last checkpoint, or after `offset`
+    when it is given, so a crash never leaves a half-written batch behind.
+    """
+
+    def __init__(
+        self, path, columns, batch_size=100, append=False, offset=None
+    ) -> None:
+        super().__init__(columns, batch_size)
+        self.name = path
+        self.path = path
+        self.checkpoint_path = path + ".checkpoint"
+
+        if append and os.path.exists(self.path):
+            self.file = open(self.path, "r+", newline="")
+            self.file.truncate(self.read_checkpoint() if offset is None else offset)
+            self.file.seek(0, os.SEEK_END)
+            self.offset = self.file.tell()
+        else:
+            self.file = open(self.path, "w", newline="")
+            csv.writer(self.file).writerow(self.columns)
+            self.sync()
+
+        self.writer = csv.writer(self.file)
+
+    def read_checkpoint(self):
+        return read_checkpoint(self.path)
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+        tmp_path = self.checkpoint_path + ".tmp"
+
+        self.offset = self.file.tell()
+
+        with open(tmp_path, "w") as checkpoint_file:
+            json.dump({"offset": self.offset}, checkpoint_file)
+
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+        self.sync()
+
+    def position(self):
+        return self.offset
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.file.close()
+
+
+def close_each(sinks):
+    """
+    Closes every sink, even if closing one of them fails, and raises the
+    first error once they are all closed.
+    """
+
+    errors = []
+
+    for sink in sinks:
+        try:
+            sink.close()
+        except Exception as e:
+            errors.append(e)
+
+    if len(errors) > 0:
+        raise errors[0]
+
+
+def read_checkpoint(path):
+    try:
+        with open(path + ".checkpoint") as checkpoint_file:
+            return json.load(checkpoint_file)["offset"]
+    except (OSError, ValueError, KeyError):
+        return os.path.getsize(path)
+
+
+def read_csv_rows(path):
+    """
+    Yields the rows a CsvSink wrote to `path` up to its last checkpoint,
+    without the header, so a batch still being written is left out.
+    """
+
+    offset = read_checkpoint(path)
+
+    def lines():
+        position = 0
+
+        with open(path, "rb") as csv_file:
+            for line in csv_file:
+                position += len(line)
+
+                if position > offset:
+                    break
+
+                yield line.decode("utf-8")
+
+    rows = csv.reader(lines())
+    next(rows, None)
+
+    yield from rows
+
+
+def read_header(path):
+    """
+    The columns of the CSV file at `path`, or None if it has no header.
+    """
+
+    with open(path, newline="") as csv_file:
+        return next(csv.reader(csv_file), None)
+
+
+def latest_crawls(path):
+    """
+    Returns, for every movie in the CSV output at `path`, the `crawled_at`
+    of its latest crawl and the number of the last row that crawl wrote.
+    Later rows win ties. Outputs written before rows carried `movie_url`
+    and `crawled_at` give None.
+    """
+
+    columns = read_header(path) or []
+
+    if "movie_url" not in columns or "crawled_at" not in columns:
+        return None
+
+    url_index = columns.index("movie_url")
+    crawled_at_index = columns.index("crawled_at")
+    latest = {}
+
+    for number, row in enumerate(read_csv_rows(path)):
+        url, crawled_at = row[url_index], row[crawled_at_index]
+
+        if url not in latest or crawled_at >= latest[url][0]:
+            latest[url] = (crawled_at, number)
+
+    return latest
+
+
+def latest_rows(path, one_per_movie=False):
+    """
+    Yields the checkpointed rows of the CSV output at `path` that the
+    latest crawl of their movie wrote, leaving out the ones it superseded.
+    With `one_per_movie` only the last of them is kept. Outputs written
+    before rows carried `crawled_at` are yielded whole.
+    """
+
+    latest = latest_crawls(path)
+
+    if latest is None:
+        yield from read_csv_rows(path)
+        return
+
+    columns = read_header(path)
+    url_index = columns.index("movie_url")
+    crawled_at_index = columns.index("crawled_at")
+
+    for number, row in enumerate(read_csv_rows(path)):
+        crawled_at, last = latest[row[url_index]]
+
+        if number == last if one_per_movie else row[crawled_at_index] == crawled_at:
+            yield row
+
+
+class SheetsClient:
+    """
+    The Sheets API client for the crawl's spreadsheet. Credentials are
+    parsed and the service is built once, on first use, and shared by every
+    `SheetsSink`. Requests are retried with randomized exponential backoff
+    on 429 and 5xx responses. Setting SHEETS_ENDPOINT points the client at
+    another server, for example a local fake, and without CREDENTIALS it
+    then sends anonymous requests. The service's HTTP connection is not
+    thread-safe, so requests from the sinks' threads take turns.
+    """
+
+    scopes = [
+        "https://www.googleapis.com/auth/spreadsheets",
+        # "https://www.googleapis.com/auth/drive",
+    ]
+
+    def __init__(self, spreadsheet_id, endpoint=None, max_retries=5) -> None:
+        self.spreadsheet_id = spreadsheet_id
+        self.endpoint = endpoint
+        self.max_retries = max_retries
+        self.lock = threading.Lock()
+        self.request_lock = threading.Lock()
+        self._service = None
+
+    @property
+    def service(self):
+        with self.lock:
+            if self._service is None:
+                self._service = self.build_service()
+
+        return self._service
+
+    def build_service(self):
+        # the Google client libraries take a while to import, and only runs
+        # that write to the sheet need them
+        from googleapiclient.discovery import build
+        from google.oauth2 import service_account
+        from google.auth.credentials import AnonymousCredentials
+
+        info_str = os.getenv("CREDENTIALS")
+
+        if info_str is None and self.endpoint is not None:
+            credentials = AnonymousCredentials()
+        else:
+            credentials = service_account.Credentials.from_service_account_info(
+                json.loads(info_str), scopes=self.scopes
+            )
+
+        client_options = (
+            None if self.endpoint is None else {"api_endpoint": self.endpoint}
+        )
+
+        return build(
+            "sheets",
+            "v4",
+            credentials=credentials,
+            client_options=client_options,
+            cache_discovery=False,
+        )
+
+    def batch_update(self, data):
+        body = {"valueInputOption": "USER_ENTERED", "data": data}
+
+        with self.request_lock:
+            result = (
+                self.service.spreadsheets()
+                .values()
+                .batchUpdate(spreadsheetId=self.spreadsheet_id, body=body)
+                .execute(num_retries=self.max_retries)
+            )
+
+        print("\n--- Writing from Google Sheets------")
+        print("------------------------------------")
+        print("\t{0} cells updated.".format(result.get("totalUpdatedCells")))
+        print("\t{0} rows updated.".format(result.get("totalUpdatedRows")))
+        print("------------------------------------")
+
+        return result
+
+
+class SheetsSink(Sink):
+    """
+    Writes rows to a worksheet of the crawl's Google Sheet, below the rows
+    it has already written, with one `values:batchUpdate` per batch. The
+    header goes in with the first batch unless `start_row` says rows have
+    been written before.
+    """
+
+    def __init__(
+        self,
+        client,
+        worksheet,
+        columns,
+        last_column_letter,
+        batch_size=50,
+        max_delay=None,
+        start_row=0,
+    ) -> None:
+        super().__init__(columns, batch_size, max_delay)
+        self.name = worksheet
+        self.client = client
+        self.worksheet = worksheet
+        self.last_column_letter = last_column_letter
+        self.last_row = start_row
+
+    def write_rows(self, rows):
+        values = [list(row) for row in rows]
+
+        if self.last_row == 0:
+            values.insert(0, self.columns)
+
+        start = self.last_row + 1
+        end = self.last_row + len(values)
+
+        self.client.batch_update(
+            [
+                {
+                    "range": f"{self.worksheet}!A{start}:{self.last_column_letter}{end}",
+                    "values": values,
+                }
+            ]
+        )
+
+        self.last_row = end
+
+    def position(self):
+        return self.last_row
+
+
+class BackgroundSink:
+    """
+    Hands rows to `sink` on a thread of its own, so a slow or failing sink
+    (the Google Sheet) never holds up the crawl's writer thread. `flush`
+    only asks the thread to flush, and `position` is what `sink` has
+    written so far. After a failed flush the thread waits `retry_delay`
+    seconds before trying again. Once `max_buffer` rows are waiting, or
+    rows are left when it is closed, the sink is given up on for the rest
+    of the crawl: `python main.py export` uploads the CSV outputs again.
+    """
+
+    def __init__(self, sink, max_buffer=10000, retry_delay=30) -> None:
+        self.sink = sink
+        self.name = sink.name
+        self.max_buffer = max_buffer
+        self.retry_delay = retry_delay
+        self.rows = []
+        self.flushing = False
+        self.closing = False
+        self.stopped = False
+        self.wakeup = threading.Condition()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, rows):
+        with self.wakeup:
+            if self.stopped:
+                return
+
+            if len(self.rows) + len(self.sink.buffer) + len(rows) > self.max_buffer:
+                self.stop(f"{self.max_buffer} rows are waiting for {self.name}")
+                return
+
+            self.rows.extend(rows)
+            self.wakeup.notify()
+
+    def flush(self):
+        with self.wakeup:
+            self.flushing = True
+            self.wakeup.notify()
+
+    def stop(self, reason):
+        # called with the lock held
+        print(
+            f"Error: {reason}, so it is no longer written to."
+            " Run `python main.py export` to upload the CSV outputs again"
+        )
+        self.stopped = True
+        self.rows = []
+        self.wakeup.notify()
+
+    def run(self):
+        while True:
+            with self.wakeup:
+                self.wakeup.wait_for(
+                    lambda: self.rows or self.flushing or self.closing or self.stopped
+                )
+
+                if self.stopped:
+                    return
+
+                rows, self.rows = self.rows, []
+                flushing, self.flushing = self.flushing or self.closing, False
+                closing = self.closing
+
+            try:
+                if len(rows) > 0:
+                    self.sink.write(rows)
+
+                if flushing:
+                    self.sink.flush()
+            except Exception as e:
+                print("Error: ", e)
+
+                with self.wakeup:
+                    if closing:
+                        self.stop(f"{self.name} failed while closing")
+                        return
+
+                    self.flushing = True
+                    self.wakeup.wait_for(lambda: self.closing, self.retry_delay)
+
+                continue
+
+            if closing:
+                with self.wakeup:
+                    if len(self.rows) == 0:
+                        return
+
+    def position(self):
+        return self.sink.position()
+
+    def close(self):
+        with self.wakeup:
+            self.closing = True
+            self.wakeup.notify()
+
+        self.thread.join()
+
+
+class MultiSink:
+    def __init__(self, sinks) -> None:
+        self.sinks = sinks
+
+    def write(self, rows):
+        # every sink gets the rows even if one of them fails to write
+        errors = []
+
+        for sink in self.sinks:
+            try:
+                sink.write(rows)
+            except Exception as e:
+                errors.append(e)
+
+        if len(errors) > 0:
+            raise errors[0]
+
+    def flush(self):
+        for sink in self.sinks:
+            sink.flush()
+
+    def positions(self):
+        return {sink.name: sink.position() for sink in self.sinks}
+
+    def close(self):
+        close_each(self.sinks)
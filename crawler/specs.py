@@ -0,0 +1,128 @@
+# Where the movie page extractors find every field. A region is a
+# (tag, attribute, value) triple matching the elements a field is read from,
+# and these regions are also all that a partial parse keeps of the page.
+#
+# A field is read from the first element of its region with `read`, a path
+# of space separated `tag` or `tag.class` steps, each looked up under the
+# previous one, ending in either "text" (the stripped text) or "@name" (the
+# attribute). "@src" alone reads the region element's own attribute.
+# `default` is returned when an element along the path is missing, and a
+# field without one fails its extractor instead. `normalize` is applied to
+# the value: "strip" strips it, "list" strips every item of a comma
+# separated list and "words" strips every space separated word.
+
+METADATA_FIELDS = {
+    "title": {
+        "region": ("h1", "data-qa", "score-panel-title"),
+        "read": "text",
+        "default": "",
+    },
+    "thumbnail_url": {
+        "region": ("tile-dynamic", "class", "thumbnail"),
+        "read": "img @src",
+        "default": "",
+    },
+    "synopsis": {
+        "region": ("p", "data-qa", "movie-info-synopsis"),
+        "read": "text",
+        "default": "",
+    },
+    "audience_score": {
+        "region": ("score-board", "id", "scoreboard"),
+        "read": "@audiencescore",
+    },
+    "tomatometer_score": {
+        "region": ("score-board", "id", "scoreboard"),
+        "read": "@tomatometerscore",
+    },
+}
+
+# Every info item holds a label and a value, and the label says which
+# metadata field the value is, with its normalization.
+INFO_ITEMS = {
+    "region": ("li", "class", "info-item"),
+    "label": "p b text",
+    "value": "p span text",
+    "default": "N/A",
+    "labels": {
+        "Rating:": ("rating", None),
+        "Genre:": ("genre", "list"),
+        "Original Language:": ("language", None),
+        "Director:": ("director", "list"),
+        "Producer:": ("producer", "list"),
+        "Writer:": ("writer", "list"),
+        "Release Date (Theaters):": ("theater_release_date", None),
+        "Release Date (Streaming):": ("streaming_release_date", None),
+        "Box Office (Gross USA):": ("usa_box_office_gross", None),
+        "Runtime:": ("runtime", None),
+        "Distributor:": ("distributor", None),
+        "Production Co:": ("production_company", "list"),
+        "Sound Mix:": ("soundmix", "list"),
+    },
+}
+
+# A cast member is every `row` element in the region that has a `requires`
+# element in it. Profile URLs are prefixed with the site's domain.
+CAST_MEMBERS = {
+    "region": ("div", "class", "cast-wrap"),
+    "row": "div",
+    "requires": "div.metadata",
+    "fields": {
+        "actor_profile_url": {"read": "a @href", "default": "", "prefix": "domain"},
+        "name": {"read": "img @alt", "normalize": "strip"},
+        "role": {"read": "div.metadata p.p--small text", "normalize": "words"},
+    },
+}
+
+# The links get_reviews follows. The text of every element in these regions
+# (the review counts) is fingerprinted to tell when there are new reviews.
+REVIEW_LINKS = {
+    "critics": {
+        "region": ("a", "data-qa", "tomatometer-review-count"),
+        "read": "@href",
+        "default": None,
+    },
+    "audience": {
+        "region": ("a", "data-qa", "audience-rating-count"),
+        "read": "@href",
+        "default": None,
+    },
+}
+
+# The rows of the review pages fetched over HTTP, as CSS selectors: every
+# `row` element is a review, and each field is the stripped text of the
+# first element matching its selector in the row, or "N/A". The fields are
+# in the order of the Review record.
+REVIEW_ROWS = {
+    "critic_review": {
+        "row": "div.review-row",
+        "fields": {
+            "posted_by": "div.review-data div.reviewer-name-and-publication a.display-name",
+            "text": "div.review-text-container p.review-text",
+            "date_posted": "div.review-text-container p.original-score-and-url span[data-qa='review-date']",
+        },
+    },
+    "audience_review": {
+        "row": ".audience-review-row",
+        "fields": {
+            "posted_by": ".audience-reviews__name",
+            "text": "p[data-qa='review-text']",
+            "date_posted": "span.audience-reviews__duration",
+        },
+    },
+}
+
+
+# The link to the next page of reviews, as a CSS selector. Its href is
+# followed as it is, whether it holds a page number or a cursor, and a
+# review page without one is the last. The browser path clicks the same
+# element, and a "next" that is hidden or disabled is not a link.
+REVIEW_NEXT = "a.next[href]:not(.hide):not(.disabled)"
+
+
+def regions():
+    found = [field["region"] for field in METADATA_FIELDS.values()]
+    found += [INFO_ITEMS["region"], CAST_MEMBERS["region"]]
+    found += [field["region"] for field in REVIEW_LINKS.values()]
+
+    return tuple(dict.fromkeys(found))
@@ -0,0 +1,153 @@
+import asyncio
+import threading
+from time import monotonic
+from collections import deque
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from crawler.metrics import metrics
+
+
+# responses that mean the site is overloaded or rate limiting us
+THROTTLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def retry_after(headers, maximum=300):
+    """
+    Returns the seconds a Retry-After header asks to wait, or None.
+    """
+
+    value = headers.get("Retry-After")
+
+    if value is None:
+        return None
+
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+
+        seconds = (date - datetime.now(timezone.utc)).total_seconds()
+
+    return min(max(seconds, 0), maximum)
+
+
+class AimdLimiter:
+    """
+    Limits the requests in flight against one host with additive-increase,
+    multiplicative-decrease control. Every healthy response grows the limit
+    by about one request per round of `limit` responses, up to `maximum`.
+    A response slower than `latency_target` holds the limit where it is,
+    and a throttling response or timeout multiplies it by `backoff` (at
+    most once per `cooldown` seconds, so one burst of errors counts once)
+    and pauses the host for as long as Retry-After asks. With `adaptive`
+    off the limit stays at `maximum`.
+
+    One limiter is shared by every fetch against its host, on whichever
+    event loop it runs (the pipeline's, or the review pager's), so its
+    state is guarded by a lock and each waiter is woken on its own loop.
+    """
+
+    def __init__(
+        self,
+        host,
+        maximum,
+        start=None,
+        minimum=1,
+        backoff=0.5,
+        latency_target=None,
+        cooldown=1.0,
+        adaptive=True,
+    ) -> None:
+        self.host = host
+        self.maximum = maximum
+        self.minimum = min(minimum, maximum)
+        self.backoff = backoff
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self.adaptive = adaptive
+        self.limit = float(maximum if start is None or not adaptive else start)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.last_backoff = 0.0
+        self.waiters = deque()
+        self.lock = threading.Lock()
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+
+        while True:
+            waiter = None
+
+            with self.lock:
+                pause = self.paused_until - monotonic()
+
+                if pause <= 0:
+                    if self.in_flight < int(self.limit):
+                        self.in_flight += 1
+                        return
+
+                    waiter = loop.create_future()
+                    self.waiters.append((loop, waiter))
+
+            if waiter is None:
+                await asyncio.sleep(pause)
+            else:
+                await waiter
+
+    def release(self):
+        with self.lock:
+            self.in_flight -= 1
+            self.wake()
+
+    def wake(self):
+        # called with the lock held
+        free = int(self.limit) - self.in_flight
+
+        while free > 0 and len(self.waiters) > 0:
+            loop, waiter = self.waiters.popleft()
+
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(self.resume, waiter)
+                free -= 1
+
+    def resume(self, waiter):
+        if not waiter.done():
+            waiter.set_result(None)
+            return
+
+        # the waiter was cancelled, so its turn goes to the next one
+        with self.lock:
+            self.wake()
+
+    def succeeded(self, latency):
+        if not self.adaptive:
+            return
+
+        if self.latency_target is not None and latency > self.latency_target:
+            return
+
+        with self.lock:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.wake()
+
+        metrics.set("fetch_limit", self.limit, host=self.host)
+
+    def throttled(self, pause=None):
+        now = monotonic()
+
+        with self.lock:
+            if pause is not None:
+                self.paused_until = max(self.paused_until, now + pause)
+
+            if not self.adaptive or now - self.last_backoff < self.cooldown:
+                return
+
+            self.last_backoff = now
+            self.limit = max(self.minimum, self.limit * self.backoff)
+
+        metrics.set("fetch_limit", self.limit, host=self.host)
+
+        print(f"Backing off {self.host} to {int(self.limit)} requests at a time")
@@ -1,10 +1,305 @@
-from crawler.crawler import RottenTomatoesCrawler
+from time import perf_counter
 
+STARTED = perf_counter()
 
-def main():
-    crawler = RottenTomatoesCrawler()
+import os
+import socket
+import argparse
+from datetime import date
+from multiprocessing import Process
+from urllib.parse import urlparse
+from dotenv import load_dotenv, find_dotenv
 
-    crawler.get_page()
+
+# The crawler's modules are imported by the commands that need them, so a
+# command only loads and starts the components its stage uses.
+
+
+def started(command):
+    # how long the command took to get ready to crawl, from the first line
+    # of this file
+    from crawler.metrics import metrics
+
+    elapsed = perf_counter() - STARTED
+    metrics.set("cold_start_seconds", elapsed, command=command)
+
+    print(f"Started {command} in {elapsed:.2f}s")
+
+
+def coordinator():
+    from crawler.coordinator import Coordinator
+
+    return Coordinator(
+        os.getenv("COORDINATOR_PATH", "data/coordinator.db"),
+        lease_ttl=float(os.getenv("LEASE_TTL", "300")),
+        max_attempts=int(os.getenv("LEASE_MAX_ATTEMPTS", "3")),
+    )
+
+
+def coordinate(leases):
+    from crawler.crawler import START_URL
+    from crawler.discovery import ListingDiscovery
+    from crawler.session import CachedSession
+
+    # workers can claim the first leases while discovery carries on
+    session = CachedSession()
+    url = os.getenv("START_URL", START_URL)
+    added = leases.add_leases(
+        ListingDiscovery(session, url).urls(),
+        lease_size=int(os.getenv("LEASE_SIZE", "20")),
+    )
+    leases.seal()
+    session.close()
+
+    print(f"Split {added} movies into leases")
+
+
+def work(worker):
+    from crawler.crawler import RottenTomatoesCrawler
+
+    # every worker keeps its own frontier, output files and HTTP cache, and
+    # leaves the shared Google Sheet alone unless SHEETS_OUTPUT says otherwise
+    crawler = RottenTomatoesCrawler(
+        data_dir=os.path.join(os.getenv("DATA_DIR", "data"), "workers", worker),
+        sheets_output=os.getenv("SHEETS_OUTPUT", "0") == "1",
+        cache_dir=os.path.join(
+            os.getenv("CACHE_DIR", ".cache/http"), "workers", worker
+        ),
+    )
+
+    started(f"worker {worker}")
+    crawler.work(coordinator(), worker)
+
+
+def urls_path():
+    return os.getenv(
+        "URLS_PATH", os.path.join(os.getenv("DATA_DIR", "data"), "urls.txt")
+    )
+
+
+def read_urls(path):
+    with open(path) as urls_file:
+        for line in urls_file:
+            if line.strip():
+                yield line.strip()
+
+
+def discover(args):
+    from crawler.crawler import START_URL
+    from crawler.discovery import ListingDiscovery
+    from crawler.session import CachedSession
+
+    session = CachedSession()
+    started("discover")
+
+    os.makedirs(os.path.dirname(args.urls) or ".", exist_ok=True)
+    found = 0
+
+    with open(args.urls, "w") as urls_file:
+        for url in ListingDiscovery(session, os.getenv("START_URL", START_URL)).urls():
+            urls_file.write(url + "\n")
+            found += 1
+
+    session.close()
+
+    print(f"Discovered {found} movies, saved to {args.urls}")
+
+
+def crawl_stage(args):
+    from crawler.crawler import RottenTomatoesCrawler
+
+    # like workers, one-off stages leave the Google Sheet to `export`
+    crawler = RottenTomatoesCrawler(
+        sheets_output=os.getenv("SHEETS_OUTPUT", "0") == "1", stages=(args.command,)
+    )
+    started(args.command)
+
+    if os.path.exists(args.urls):
+        urls = read_urls(args.urls)
+    else:
+        print(f"No {args.urls}, discovering the movies first")
+        urls = crawler.discovered_urls()
+
+    crawler.crawl(urls)
+    crawler.close()
+
+
+def export(args):
+    from crawler.crawler import SPREADSHEET_ID, export_outputs
+    from crawler.sinks import SheetsClient
+
+    sheets = SheetsClient(
+        SPREADSHEET_ID,
+        endpoint=os.getenv("SHEETS_ENDPOINT"),
+        max_retries=int(os.getenv("SHEETS_MAX_RETRIES", "5")),
+    )
+    started("export")
+
+    export_outputs(
+        os.getenv("DATA_DIR", "data"),
+        sheets,
+        batch_size=int(os.getenv("SHEETS_BATCH_SIZE", "500")),
+    )
+
+
+def merge(args):
+    from crawler.crawler import merge_outputs
+
+    started("merge")
+
+    # the workers that joined the last sharded crawl, or every worker's
+    # outputs without a coordinator
+    workers = None
+
+    if os.path.exists(os.getenv("COORDINATOR_PATH", "data/coordinator.db")):
+        leases = coordinator()
+        workers = leases.workers() or None
+        leases.close()
+
+    merge_outputs(os.getenv("DATA_DIR", "data"), workers)
+
+
+def normalize(args):
+    from crawler.normalize import normalize_outputs
+
+    started("normalize")
+
+    start = perf_counter()
+    rows = normalize_outputs(
+        args.input, args.output, batch_size=args.batch_size, as_of=args.as_of
+    )
+
+    for name, count in rows.items():
+        print(f"\t{name}: {count} rows")
+
+    print(f"Normalized the outputs into {args.output} in {perf_counter() - start:.1f}s")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Crawls Rotten Tomatoes. Without a command, runs CRAWL_MODE."
+    )
+    commands = parser.add_subparsers(dest="command")
+
+    command = commands.add_parser(
+        "discover", help="list the movie URLs in the listing over HTTP"
+    )
+    command.set_defaults(run=discover)
+    command.add_argument("--urls", default=urls_path(), help="where to save them")
+
+    for stage, description in (
+        ("metadata", "extract movie metadata over HTTP"),
+        ("cast", "extract the cast and crew over HTTP"),
+        ("reviews", "fetch the critic and audience reviews"),
+    ):
+        command = commands.add_parser(stage, help=description)
+        command.set_defaults(run=crawl_stage)
+        command.add_argument(
+            "--urls",
+            default=urls_path(),
+            help="the movie URLs to crawl, discovered first if missing",
+        )
+
+    command = commands.add_parser(
+        "export", help="upload the CSV outputs to the Google Sheet"
+    )
+    command.set_defaults(run=export)
+
+    command = commands.add_parser(
+        "merge", help="combine the outputs of a sharded crawl's workers"
+    )
+    command.set_defaults(run=merge)
+
+    command = commands.add_parser(
+        "normalize", help="write typed Parquet tables from the CSV outputs"
+    )
+    command.set_defaults(run=normalize)
+    command.add_argument("--input", default=os.getenv("DATA_DIR", "data"))
+    command.add_argument(
+        "--output",
+        default=os.path.join(os.getenv("DATA_DIR", "data"), "analytics"),
+    )
+    command.add_argument("--batch-size", type=int, default=50000)
+    command.add_argument(
+        "--as-of",
+        type=date.fromisoformat,
+        help="the day reviews with dates like 5d were crawled, for older outputs",
+    )
+
+    return parser.parse_args(argv)
+
+
+def run_mode():
+    mode = os.getenv("CRAWL_MODE", "single")
+
+    if mode == "coordinator":
+        leases = coordinator()
+
+        if leases.begin():
+            coordinate(leases)
+
+        leases.print_summary()
+    elif mode == "worker":
+        # the same on every run, so a restarted worker carries on with its
+        # own outputs instead of leaving them behind
+        work(os.getenv("WORKER_ID", socket.gethostname()))
+    elif mode == "reextract":
+        from crawler.crawler import START_URL
+        from crawler.reextract import reextract
+
+        # re-runs the extractors over the archived pages, without the network
+        data_dir = os.getenv("DATA_DIR", "data")
+
+        reextract(
+            os.getenv("ARCHIVE_DIR", os.path.join(data_dir, "archive")),
+            os.getenv("REEXTRACT_DIR", os.path.join(data_dir, "reextract")),
+            urlparse(os.getenv("START_URL", START_URL)).netloc,
+            processes=int(os.getenv("EXTRACT_PROCESSES", "0")) or None,
+            parser=os.getenv("HTML_PARSER"),
+            partial=os.getenv("PARTIAL_PARSE", "1") == "1",
+        )
+    elif mode == "local":
+        # a coordinator and WORKERS worker processes on this machine
+        leases = coordinator()
+        resuming = not leases.begin()
+        workers = [
+            Process(target=work, args=(f"worker-{i}",))
+            for i in range(int(os.getenv("WORKERS", "2")))
+        ]
+
+        for worker in workers:
+            worker.start()
+
+        if not resuming:
+            coordinate(leases)
+
+        for worker in workers:
+            worker.join()
+
+        leases.print_summary()
+
+        from crawler.crawler import merge_outputs
+
+        merge_outputs(os.getenv("DATA_DIR", "data"), leases.workers())
+        leases.close()
+    else:
+        from crawler.crawler import RottenTomatoesCrawler
+
+        crawler = RottenTomatoesCrawler()
+        started("crawl")
+
+        crawler.get_page()
+
+
+def main(argv=None):
+    load_dotenv(find_dotenv())
+
+    args = parse_args(argv)
+
+    if args.command is not None:
+        args.run(args)
+    else:
+        run_mode()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,52 @@
+import os
+import csv
+import pytest
+from benchmarks.fake_site import FakeSite
+
+
+@pytest.fixture
+def site():
+    site = FakeSite(movies=3, review_pages=2).start()
+
+    yield site
+
+    site.stop()
+
+
+@pytest.fixture
+def crawl(site, tmp_path, monkeypatch):
+    """
+    Runs a whole crawl of the fake site into `tmp_path` in this process,
+    with the reviews fetched over HTTP. Keyword arguments set more of the
+    crawler's environment variables.
+    """
+
+    def crawl(stages=None, **env):
+        from crawler.crawler import RottenTomatoesCrawler
+
+        settings = {
+            "START_URL": site.listing_url,
+            "DATA_DIR": str(tmp_path),
+            "CACHE_DIR": str(tmp_path / "cache"),
+            "CACHE_TTL": "0",
+            "REVIEW_FETCH": "http",
+            "SHEETS_OUTPUT": "0",
+            **env,
+        }
+
+        for name, value in settings.items():
+            monkeypatch.setenv(name, value)
+
+        monkeypatch.delenv("CREDENTIALS", raising=False)
+
+        RottenTomatoesCrawler(stages=stages).get_page()
+
+    return crawl
+
+
+def read_rows(path):
+    if not os.path.exists(path):
+        return []
+
+    with open(path, newline="") as csv_file:
+        return list(csv.DictReader(csv_file))
@@ -0,0 +1,45 @@
+from benchmarks.fake_site import FakeSite, TILES_PER_PAGE
+
+
+class ListingThatEnds(FakeSite):
+    # 404s past the last page instead of rendering the whole listing again
+    def render(self, path, query):
+        if path.startswith("/browse/"):
+            pages = (self.movies + TILES_PER_PAGE - 1) // TILES_PER_PAGE
+
+            if int(query.get("page", ["1"])[0]) > pages:
+                return None
+
+        return super().render(path, query)
+
+
+def discover(site, tmp_path):
+    from crawler.discovery import ListingDiscovery
+    from crawler.session import CachedSession, ResponseCache
+
+    session = CachedSession(cache=ResponseCache(str(tmp_path / "cache")))
+    discovery = ListingDiscovery(session, site.listing_url)
+
+    try:
+        return list(discovery.urls()), site.requests
+    finally:
+        session.close()
+        site.stop()
+
+
+def test_discovery_doubles_the_page_until_the_listing_ends(tmp_path):
+    # 34 pages, read as pages 1, 2, 4, ..., 64
+    site = FakeSite(movies=1000).start()
+    urls, requests = discover(site, tmp_path)
+
+    assert urls == site.movie_urls()
+    assert requests == 7
+
+
+def test_discovery_bisects_to_the_last_page(tmp_path):
+    # 34 pages: 1, 2, 4, ..., 32, then 64, 48, 40 and 36 past the end, and 34
+    site = ListingThatEnds(movies=1000).start()
+    urls, requests = discover(site, tmp_path)
+
+    assert urls == site.movie_urls()
+    assert requests == 6 + 5
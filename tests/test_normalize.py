@@ -0,0 +1,42 @@
+import pandas as pd
+from datetime import date
+
+
+def test_every_table_is_keyed_by_the_movie_slug(site, crawl, tmp_path):
+    from crawler.normalize import normalize_outputs
+
+    crawl()
+    normalize_outputs(str(tmp_path), str(tmp_path / "analytics"))
+
+    slugs = sorted(url.rsplit("/", 1)[1] for url in site.movie_urls())
+
+    for name in ("movies", "movie_genres", "cast_and_crew", "reviews"):
+        table = pd.read_parquet(tmp_path / "analytics" / f"{name}.parquet")
+
+        assert sorted(table["movie_slug"].unique()) == slugs
+
+
+def test_relative_review_dates_are_counted_back_from_as_of():
+    from crawler.normalize import normalize_reviews
+
+    dates = ["5d", "2h", "May 26, 2023", "N/A"]
+    batch = pd.DataFrame(
+        {
+            "movie_url": "https://www.rottentomatoes.com/m/barbie",
+            "movie": "Barbie",
+            "posted_by": "Viewer",
+            "text": "Review",
+            "date_posted": dates,
+            "review_type": "audience_review",
+        }
+    )
+
+    reviews = normalize_reviews(batch, as_of=date(2023, 6, 10))
+
+    assert list(reviews["movie_slug"]) == ["barbie"] * 4
+    assert list(reviews["date_posted"]) == [
+        pd.Timestamp(2023, 6, 5),
+        pd.Timestamp(2023, 6, 10),
+        pd.Timestamp(2023, 5, 26),
+        pd.NaT,
+    ]
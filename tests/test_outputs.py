@@ -0,0 +1,59 @@
+import os
+from tests.conftest import read_rows
+
+
+def test_rows_of_a_changed_movie_supersede_the_earlier_ones(
+    site, crawl, tmp_path, capsys
+):
+    from crawler.crawler import export_outputs
+    from crawler.normalize import normalize_outputs
+    from crawler.sinks import SheetsClient
+
+    crawl(stages=("metadata", "cast"))
+
+    site.audience_score = 80
+    site.cast = 21
+    crawl(stages=("metadata", "cast"))
+
+    # both crawls are kept in the append-only outputs
+    movies = read_rows(tmp_path / "movies.csv")
+    cast = read_rows(tmp_path / "cast_and_crew.csv")
+
+    assert len(movies) == 3 * 2
+    assert len(cast) == 3 * (20 + 21)
+    assert sorted(row["movie_url"] for row in movies) == sorted(site.movie_urls() * 2)
+
+    for url in site.movie_urls():
+        first, second = [row for row in movies if row["movie_url"] == url]
+        assert first["crawled_at"] < second["crawled_at"]
+        assert second["audience_score"] == "80"
+
+    # but only the latest one is exported and normalized
+    capsys.readouterr()
+    export_outputs(str(tmp_path), SheetsClient("test", endpoint=site.url + "/"))
+    exported = capsys.readouterr().out
+
+    assert "Exported 3 rows of" in exported
+    assert f"Exported {3 * 21} rows of" in exported
+
+    rows = normalize_outputs(str(tmp_path), str(tmp_path / "analytics"))
+
+    assert rows["movies"] == 3
+    assert rows["cast_and_crew"] == 3 * 21
+
+
+def test_outputs_with_older_columns_are_moved_aside_and_written_again(
+    site, crawl, tmp_path
+):
+    crawl(stages=("metadata",))
+
+    # movies.csv as the crawler wrote it before rows had movie_url
+    path = tmp_path / "movies.csv"
+    lines = path.read_text().splitlines(keepends=True)
+    path.write_text("title,genre\n" + "".join(lines[1:]))
+
+    crawl(stages=("metadata",))
+
+    assert os.path.exists(str(path) + ".old")
+    assert len(read_rows(path)) == 3
+    assert all(row["movie_url"] for row in read_rows(path))
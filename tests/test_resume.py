@@ -0,0 +1,107 @@
+import os
+import sys
+import signal
+import sqlite3
+import subprocess
+import pytest
+from time import sleep, monotonic
+from benchmarks.fake_site import FakeSite
+from crawler.sinks import read_csv_rows
+from tests.conftest import read_rows
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def saved(path):
+    return len(list(read_csv_rows(str(path)))) if os.path.exists(path) else 0
+
+
+def test_a_killed_crawl_resumes_without_losing_or_repeating_rows(tmp_path):
+    site = FakeSite(movies=12, review_pages=2, latency=0.02).start()
+    env = {
+        **os.environ,
+        "START_URL": site.listing_url,
+        "DATA_DIR": str(tmp_path),
+        "CACHE_DIR": str(tmp_path / "cache"),
+        "CACHE_TTL": "0",
+        "REVIEW_FETCH": "http",
+        "SHEETS_OUTPUT": "0",
+        "CONCURRENCY": "2",
+        "CSV_BATCH_SIZE": "1",
+        "CRAWL_MODE": "single",
+    }
+    env.pop("CREDENTIALS", None)
+
+    try:
+        crawl = subprocess.Popen(
+            [sys.executable, "main.py"],
+            cwd=ROOT,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+        # killed once some movies are saved, without a chance to clean up
+        started = monotonic()
+
+        while saved(tmp_path / "movies.csv") == 0:
+            assert crawl.poll() is None and monotonic() - started < 60
+            sleep(0.05)
+
+        crawl.send_signal(signal.SIGKILL)
+        crawl.wait()
+
+        killed = len(read_rows(tmp_path / "movies.csv"))
+        assert 0 < killed < site.movies
+
+        subprocess.run(
+            [sys.executable, "main.py"],
+            cwd=ROOT,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            check=True,
+            timeout=120,
+        )
+    finally:
+        site.stop()
+
+    movies = read_rows(tmp_path / "movies.csv")
+    reviews = read_rows(tmp_path / "reviews.csv")
+
+    assert sorted(row["title"] for row in movies) == sorted(
+        f"Movie {i}" for i in range(site.movies)
+    )
+    assert len(reviews) == site.movies * (40 + 20)
+    assert len(
+        {(row["movie"], row["review_type"], row["text"]) for row in reviews}
+    ) == len(reviews)
+
+
+def test_a_crawl_whose_outputs_fail_is_resumed_instead_of_finished(
+    site, crawl, tmp_path, monkeypatch
+):
+    from crawler.sinks import CsvSink
+
+    crawl(stages=("cast",))
+
+    # the cast changes, but the next crawl cannot write it
+    site.cast = 21
+    write_rows = CsvSink.write_rows
+
+    def failing(self, rows):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(CsvSink, "write_rows", failing)
+
+    with pytest.raises(OSError):
+        crawl(stages=("cast",))
+
+    with sqlite3.connect(tmp_path / "frontier.db") as connection:
+        assert connection.execute("SELECT value FROM state").fetchone() == ("running",)
+
+    monkeypatch.setattr(CsvSink, "write_rows", write_rows)
+    crawl(stages=("cast",))
+
+    cast = read_rows(tmp_path / "cast_and_crew.csv")
+    assert sum(row["name"] == "Person 20" for row in cast) == 3
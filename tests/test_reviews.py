@@ -0,0 +1,117 @@
+import sqlite3
+from datetime import date, timedelta
+from tests.conftest import read_rows
+
+
+def test_incremental_crawl_stops_at_the_last_review_when_dates_change(
+    site, crawl, tmp_path
+):
+    site.review_age = 5
+    crawl(stages=("reviews",), REVIEW_DEDUPE="0")
+
+    first = read_rows(tmp_path / "reviews.csv")
+    assert len(first) == 3 * (40 + 20)
+    assert {
+        row["date_posted"] for row in first if row["review_type"] == "audience_review"
+    } == {(date.today() - timedelta(days=5)).strftime("%b %d, %Y")}
+
+    # a day later, with three new reviews of each type on top
+    site.review_age = 6
+    site.new_reviews = 3
+    crawl(stages=("reviews",), REVIEW_DEDUPE="0")
+
+    added = read_rows(tmp_path / "reviews.csv")[len(first) :]
+    assert sorted(
+        (row["movie"], row["review_type"], row["text"]) for row in added
+    ) == sorted(
+        (f"Movie {i}", review_type, f"Review {n} of Movie {i}.")
+        for i in range(3)
+        for review_type, old in (("critic_review", 40), ("audience_review", 20))
+        for n in range(old, old + 3)
+    )
+
+
+def test_review_scrapes_in_flight_are_bounded(site, crawl, tmp_path, monkeypatch):
+    from crawler.reviews import ReviewPager
+
+    reviews = ReviewPager.reviews
+    running = {"now": 0, "most": 0}
+
+    async def counted(self, *args):
+        running["now"] += 1
+        running["most"] = max(running["most"], running["now"])
+
+        try:
+            return await reviews(self, *args)
+        finally:
+            running["now"] -= 1
+
+    monkeypatch.setattr(ReviewPager, "reviews", counted)
+    site.latency = 0.01
+    crawl(stages=("reviews",), REVIEW_QUEUE_SIZE="1", PARSE_WORKERS="3")
+
+    assert running["most"] == 1
+    assert len(read_rows(tmp_path / "reviews.csv")) == 3 * (40 + 20)
+
+
+def test_dedupe_keeps_audience_reviews_once_when_their_dates_change(
+    site, crawl, tmp_path
+):
+    site.review_age = 5
+    crawl(stages=("reviews",))
+
+    first = read_rows(tmp_path / "reviews.csv")
+    assert len(first) == 3 * (40 + 20)
+
+    # without the markers of the last crawl every review is read again,
+    # over a week later, when "5d" is shown as the date it was posted
+    with sqlite3.connect(tmp_path / "frontier.db") as connection:
+        connection.execute("DELETE FROM fingerprints")
+
+    site.review_age = 10
+    crawl(stages=("reviews",))
+
+    assert read_rows(tmp_path / "reviews.csv") == first
+
+
+def test_reviews_are_saved_page_by_page_and_a_failed_scrape_is_read_again(
+    site, crawl, tmp_path, monkeypatch
+):
+    from crawler.reviews import ReviewPager, page_number
+
+    read_page = ReviewPager.read_page
+
+    def failing(self, url, content, review_type):
+        if "movie_0" in url and review_type == "critic_review":
+            if page_number(url) == 2:
+                raise OSError("connection reset")
+
+        return read_page(self, url, content, review_type)
+
+    monkeypatch.setattr(ReviewPager, "read_page", failing)
+    crawl(stages=("reviews",))
+
+    # the first page was saved before the second one failed, but the
+    # scrape left no marker, so the next crawl reads it again from the top
+    first = read_rows(tmp_path / "reviews.csv")
+    assert (
+        sum(
+            row["movie"] == "Movie 0" and row["review_type"] == "critic_review"
+            for row in first
+        )
+        == 20
+    )
+
+    with sqlite3.connect(tmp_path / "frontier.db") as connection:
+        assert connection.execute(
+            "SELECT name FROM fingerprints WHERE url LIKE '%movie_0'"
+        ).fetchall() == [("audience_review",)]
+
+    monkeypatch.setattr(ReviewPager, "read_page", read_page)
+    crawl(stages=("reviews",))
+
+    reviews = read_rows(tmp_path / "reviews.csv")
+    assert len(reviews) == 3 * (40 + 20)
+    assert len(
+        {(row["movie"], row["review_type"], row["text"]) for row in reviews}
+    ) == len(reviews)
@@ -0,0 +1,93 @@
+from time import sleep
+from tests.conftest import read_rows
+
+
+def test_a_lease_is_failed_after_max_attempts(tmp_path):
+    from crawler.coordinator import Coordinator
+
+    leases = Coordinator(str(tmp_path / "coordinator.db"), max_attempts=2)
+    leases.begin()
+    leases.add_leases(["a", "b"], lease_size=1)
+    leases.seal()
+
+    first, _ = leases.claim("worker")
+    leases.release(first, "worker")
+    assert leases.claim("worker")[0] == first
+    leases.release(first, "worker")
+
+    # the first lease failed twice, so the second one is handed out
+    second, urls = leases.claim("worker")
+    assert second != first and urls == ["b"]
+    assert not leases.is_finished()
+
+    leases.complete(second, "worker", {"urls": 1})
+    assert leases.claim("worker") is None
+    assert leases.is_finished()
+    assert leases.summary()["leases"] == {"done": 1, "failed": 1}
+
+    leases.close()
+
+
+def test_an_expired_lease_is_failed_after_max_attempts(tmp_path):
+    from crawler.coordinator import Coordinator
+
+    leases = Coordinator(str(tmp_path / "coordinator.db"), lease_ttl=0.1)
+    leases.max_attempts = 1
+    leases.begin()
+    leases.add_leases(["a"])
+    leases.seal()
+
+    assert leases.claim("doomed") is not None
+    sleep(0.2)
+
+    assert leases.claim("worker") is None
+    assert leases.is_finished()
+
+    leases.close()
+
+
+def test_merge_keeps_each_review_and_the_latest_crawl_of_each_movie_once(
+    site, crawl, tmp_path
+):
+    from crawler.crawler import merge_outputs
+
+    # two workers that crawled the same movies, as after a lease expired,
+    # the second one after the movies changed
+    crawl(DATA_DIR=str(tmp_path / "workers" / "worker-0"))
+    site.audience_score = 80
+    site.cast = 21
+    crawl(DATA_DIR=str(tmp_path / "workers" / "worker-1"))
+
+    merged = merge_outputs(str(tmp_path))
+
+    movies = read_rows(tmp_path / "movies.csv")
+    cast = read_rows(tmp_path / "cast_and_crew.csv")
+    reviews = read_rows(tmp_path / "reviews.csv")
+
+    assert merged["movies.csv"] == len(movies) == 3
+    assert {row["audience_score"] for row in movies} == {"80"}
+    assert merged["cast_and_crew.csv"] == len(cast) == 3 * 21
+    assert merged["reviews.csv"] == len(reviews) == 3 * (40 + 20)
+    assert len(
+        {(row["movie"], row["review_type"], row["text"]) for row in reviews}
+    ) == len(reviews)
+
+
+def test_merge_leaves_out_workers_of_earlier_crawls(site, crawl, tmp_path):
+    from crawler.coordinator import Coordinator
+    from crawler.crawler import merge_outputs
+
+    # a worker of an earlier crawl, when the listing had another movie
+    site.movies = 4
+    crawl(DATA_DIR=str(tmp_path / "workers" / "gone"))
+    site.movies = 3
+
+    leases = Coordinator(str(tmp_path / "coordinator.db"))
+    leases.begin()
+    leases.join("worker-0")
+    crawl(DATA_DIR=str(tmp_path / "workers" / "worker-0"))
+
+    merged = merge_outputs(str(tmp_path), leases.workers())
+    leases.close()
+
+    assert merged["movies.csv"] == len(read_rows(tmp_path / "movies.csv")) == 3
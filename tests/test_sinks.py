@@ -0,0 +1,67 @@
+import sqlite3
+from time import perf_counter
+from tests.conftest import read_rows
+
+
+def test_a_sheets_outage_does_not_hold_up_the_crawl(site, crawl, tmp_path):
+    site.sheets_status = 503
+    start = perf_counter()
+
+    crawl(
+        SHEETS_OUTPUT="1",
+        SHEETS_ENDPOINT=site.url + "/",
+        SHEETS_MAX_RETRIES="0",
+        SHEETS_BATCH_SIZE="1",
+        SHEETS_RETRY_DELAY="60",
+    )
+
+    # every failed write after the first waits for the retry delay, away
+    # from the writer, and closing gives up on the sheet after one try
+    assert perf_counter() - start < 30
+    assert site.sheet_writes > 0
+    assert len(read_rows(tmp_path / "movies.csv")) == 3
+    assert len(read_rows(tmp_path / "reviews.csv")) == 3 * (40 + 20)
+
+    with sqlite3.connect(tmp_path / "frontier.db") as connection:
+        statuses = connection.execute(
+            "SELECT metadata_status, cast_status, reviews_status FROM urls"
+        ).fetchall()
+        offsets = dict(connection.execute("SELECT name, value FROM offsets"))
+
+    assert statuses == [("done", "done", "done")] * 3
+    assert offsets["Movies"] == 0
+
+
+def test_the_crawl_finishes_with_every_row_the_sheet_took(site, crawl, tmp_path):
+    crawl(SHEETS_OUTPUT="1", SHEETS_ENDPOINT=site.url + "/", SHEETS_BATCH_SIZE="7")
+
+    with sqlite3.connect(tmp_path / "frontier.db") as connection:
+        offsets = dict(connection.execute("SELECT name, value FROM offsets"))
+
+    # the header and every row
+    assert offsets["Movies"] == 1 + 3
+    assert offsets["Cast"] == 1 + 3 * 20
+    assert offsets["Reviews"] == 1 + 3 * (40 + 20)
+
+
+def test_sheets_rows_past_max_buffer_are_given_up_on(capsys):
+    from crawler.sinks import BackgroundSink, Sink
+
+    class Failing(Sink):
+        name = "Failing"
+
+        def write_rows(self, rows):
+            raise OSError("down")
+
+        def position(self):
+            return 0
+
+    sink = BackgroundSink(Failing(["a"], batch_size=1), max_buffer=5, retry_delay=60)
+
+    for i in range(10):
+        sink.write([[i]])
+
+    sink.close()
+
+    assert "5 rows are waiting for Failing" in capsys.readouterr().out
+    assert len(sink.sink.buffer) <= 5
@@ -0,0 +1,129 @@
+import asyncio
+import threading
+from time import monotonic, perf_counter
+from benchmarks.fake_site import FakeSite
+from crawler.throttle import AimdLimiter
+
+
+def test_the_limit_grows_by_about_one_per_round_up_to_the_maximum():
+    limiter = AimdLimiter("site", 4, start=2)
+
+    # a round of 2 responses at a limit of 2
+    limiter.succeeded(0.1)
+    limiter.succeeded(0.1)
+    assert int(limiter.limit) == 2
+
+    limiter.succeeded(0.1)
+    assert int(limiter.limit) == 3
+
+    for _ in range(20):
+        limiter.succeeded(0.1)
+
+    assert limiter.limit == 4
+
+
+def test_slow_responses_hold_the_limit_and_throttling_backs_it_off_once():
+    limiter = AimdLimiter("site", 8, start=8, latency_target=1.0, cooldown=60)
+
+    limiter.succeeded(2.0)
+    assert limiter.limit == 8
+
+    # one burst of errors backs off once, and never below the minimum
+    limiter.throttled()
+    limiter.throttled()
+    assert limiter.limit == 4
+
+    limiter.last_backoff = 0
+    limiter.throttled()
+    limiter.last_backoff = 0
+    limiter.throttled()
+    limiter.last_backoff = 0
+    limiter.throttled()
+    assert limiter.limit == 1
+
+
+def test_a_fixed_limit_is_not_tuned():
+    limiter = AimdLimiter("site", 4, start=1, adaptive=False)
+
+    limiter.succeeded(0.1)
+    limiter.throttled()
+
+    assert limiter.limit == 4
+
+
+def test_retry_after_pauses_the_host_and_backs_off(capsys):
+    from crawler.fetcher import AsyncFetcher
+    from crawler.session import CachedSession
+
+    site = FakeSite(movies=1).start()
+    site.throttle = 1
+    site.retry_after = 1
+    fetcher = AsyncFetcher(per_host=4, backoff=0.01, session=CachedSession())
+    fetched = []
+
+    try:
+        start = perf_counter()
+        fetcher.run(site.movie_urls(), lambda url, content: fetched.append(url))
+        elapsed = perf_counter() - start
+    finally:
+        fetcher.close()
+        fetcher.session.close()
+        site.stop()
+
+    # the retry waited for Retry-After rather than the 0.01s backoff
+    assert fetched == site.movie_urls()
+    assert site.requests == 2
+    assert elapsed >= 1
+    assert "to 1 requests at a time" in capsys.readouterr().out
+
+
+def test_a_limiter_shared_by_two_event_loops_wakes_the_other_loops_waiter():
+    limiter = AimdLimiter("site", 1)
+    held = threading.Event()
+    waited = []
+
+    async def hold():
+        await limiter.acquire()
+        held.set()
+        await asyncio.sleep(0.2)
+        limiter.release()
+
+    async def wait():
+        start = monotonic()
+        await limiter.acquire()
+        waited.append(monotonic() - start)
+        limiter.release()
+
+    holder = threading.Thread(target=asyncio.run, args=(hold(),))
+    holder.start()
+    held.wait()
+
+    waiter = threading.Thread(target=asyncio.run, args=(wait(),))
+    waiter.start()
+
+    holder.join()
+    waiter.join(5)
+
+    assert not waiter.is_alive()
+    assert 0.1 < waited[0] < 2
+    assert limiter.in_flight == 0
+
+
+def test_a_stale_cached_page_is_revalidated_with_its_etag(tmp_path):
+    from crawler.session import CachedSession, ResponseCache
+
+    site = FakeSite(movies=1, etags=True).start()
+    session = CachedSession(cache=ResponseCache(str(tmp_path), ttl=0))
+    url = site.movie_urls()[0]
+
+    try:
+        first = session.get(url)
+        second = session.get(url)
+    finally:
+        session.close()
+        site.stop()
+
+    assert not first.from_cache
+    assert second.status_code == 200 and second.from_cache
+    assert second.content == first.content
+    assert site.requests == 2 and site.not_modified == 1